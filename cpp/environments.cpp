@@ -129,6 +129,19 @@ int PuzzleN::getNumActions() const {
 	return(this->numActions);
 }
 
+int PuzzleN::getBitsPerElem() const {
+	int bitsPerElem = 1;
+	while ((1 << bitsPerElem) < this->numTiles) {
+		bitsPerElem++;
+	}
+
+	return(bitsPerElem);
+}
+
+PuzzleN *PuzzleN::fromState(std::vector<uint8_t> state) const {
+	return(new PuzzleN(state,this->dim));
+}
+
 ///LightsOut
 int **getMoveMat(int dim) {
   int **moveMat = new int*[dim*dim];
@@ -207,6 +220,14 @@ int LightsOut::getNumActions() const {
 	return(this->numActions);
 }
 
+int LightsOut::getBitsPerElem() const {
+	return(1);
+}
+
+LightsOut *LightsOut::fromState(std::vector<uint8_t> state) const {
+	return(new LightsOut(state,this->dim));
+}
+
 
 /// Cube3
 constexpr int Cube3::rotateIdxs_old[12][24];
@@ -259,6 +280,14 @@ int Cube3::getNumActions() const {
 	return(this->numActions);
 }
 
+int Cube3::getBitsPerElem() const {
+	return(6); // 54 stickers
+}
+
+Cube3 *Cube3::fromState(std::vector<uint8_t> state) const {
+	return(new Cube3(state));
+}
+
 /// Cube3SolvedCorners
 constexpr int Cube3SolvedCorners::rotateIdxs_old[12][24];
 constexpr int Cube3SolvedCorners::rotateIdxs_new[12][24];
@@ -310,6 +339,14 @@ int Cube3SolvedCorners::getNumActions() const {
 	return(this->numActions);
 }
 
+int Cube3SolvedCorners::getBitsPerElem() const {
+	return(6); // 54 stickers
+}
+
+Cube3SolvedCorners *Cube3SolvedCorners::fromState(std::vector<uint8_t> state) const {
+	return(new Cube3SolvedCorners(state));
+}
+
 /*** Cube4 ***/
 std::vector<int> U0_n1 = {3, 7, 11, 15, 15, 14, 13, 12, 12, 8, 4, 0, 0, 1, 2, 3, 6, 10, 10, 9, 9, 5, 5, 6, 67, 71, 75, 79, 35, 39, 43, 47, 83, 87, 91, 95, 51, 55, 59, 63};
 std::vector<int> U0_1 = {12, 8, 4, 0, 0, 1, 2, 3, 3, 7, 11, 15, 15, 14, 13, 12, 9, 5, 5, 6, 6, 10, 10, 9, 83, 87, 91, 95, 51, 55, 59, 63, 67, 71, 75, 79, 35, 39, 43, 47};
@@ -420,3 +457,11 @@ int Cube4::getNumActions() const {
 	return(this->numActions);
 }
 
+int Cube4::getBitsPerElem() const {
+	return(7); // 96 stickers
+}
+
+Cube4 *Cube4::fromState(std::vector<uint8_t> state) const {
+	return(new Cube4(state));
+}
+
@@ -14,6 +14,10 @@ class Environment {
     virtual bool isSolved() const = 0;
 
     virtual int getNumActions() const = 0;
+
+    virtual int getBitsPerElem() const = 0;
+
+    virtual Environment *fromState(std::vector<uint8_t> state) const = 0;
 };
 
 /*** PuzzleN ***/
@@ -43,6 +47,10 @@ class PuzzleN: public Environment {
     virtual bool isSolved() const;
 
     virtual int getNumActions() const;
+
+    virtual int getBitsPerElem() const;
+
+    virtual PuzzleN *fromState(std::vector<uint8_t> state) const;
 };
 
 /*** LightsOut ***/
@@ -67,6 +75,10 @@ class LightsOut: public Environment {
     virtual bool isSolved() const;
 
     virtual int getNumActions() const;
+
+    virtual int getBitsPerElem() const;
+
+    virtual LightsOut *fromState(std::vector<uint8_t> state) const;
 };
 
 class Cube3: public Environment {
@@ -119,6 +131,10 @@ class Cube3: public Environment {
     virtual bool isSolved() const;
 
     virtual int getNumActions() const;
+
+    virtual int getBitsPerElem() const;
+
+    virtual Cube3 *fromState(std::vector<uint8_t> state) const;
 };
 
 class Cube3SolvedCorners: public Environment {
@@ -171,6 +187,10 @@ class Cube3SolvedCorners: public Environment {
     virtual bool isSolved() const;
 
     virtual int getNumActions() const;
+
+    virtual int getBitsPerElem() const;
+
+    virtual Cube3SolvedCorners *fromState(std::vector<uint8_t> state) const;
 };
 
 
@@ -194,6 +214,10 @@ class Cube4: public Environment {
     virtual bool isSolved() const;
 
     virtual int getNumActions() const;
+
+    virtual int getBitsPerElem() const;
+
+    virtual Cube4 *fromState(std::vector<uint8_t> state) const;
 };
 
 
@@ -0,0 +1,19 @@
+#ifndef HEURISTIC_H
+#define HEURISTIC_H
+
+#include <stdint.h>
+#include <stddef.h>
+
+/*** Abstract Heuristic Class ***/
+/* States are written to the buffer returned by getStateBuffer, one byte per element, and computeHeuristics returns the
+ * heuristic value of each of them. */
+class Heuristic {
+	public:
+		virtual ~Heuristic() {}
+
+		virtual uint8_t *getStateBuffer(size_t numStates, size_t stateDim) = 0;
+
+		virtual const float *computeHeuristics() = 0;
+};
+
+#endif
@@ -0,0 +1,226 @@
+#include "nnet.h"
+
+#include <cstring>
+#include <algorithm>
+#include <stdio.h>
+#ifdef USE_BLAS
+#include <cblas.h>
+#endif
+
+static const char nnetMagic[8] = {'R','E','S','N','E','T','0','1'};
+
+static bool readFloats(FILE *f, std::vector<float> &data, size_t size) {
+	data.resize(size);
+	return(fread(data.data(),sizeof(float),size,f) == size);
+}
+
+static bool readLayer(FILE *f, NnetLayer &layer, int inDim, int outDim) {
+	layer.inDim = inDim;
+	layer.outDim = outDim;
+	return(readFloats(f,layer.weights,(size_t) inDim*(size_t) outDim) && readFloats(f,layer.bias,(size_t) outDim));
+}
+
+/* out = in * weights^T + bias, for numRows rows */
+static void linear(const NnetLayer &layer, const float *in, size_t numRows, float *out) {
+	size_t outDim = (size_t) layer.outDim;
+
+	#pragma omp parallel for
+	for (size_t i=0; i<numRows; i++) {
+		memcpy(out + i*outDim,layer.bias.data(),outDim*sizeof(float));
+	}
+
+#ifdef USE_BLAS
+	cblas_sgemm(CblasRowMajor,CblasNoTrans,CblasTrans,(int) numRows,layer.outDim,layer.inDim,1.0f,in,layer.inDim,layer.weights.data(),layer.inDim,1.0f,out,layer.outDim);
+#else
+	size_t inDim = (size_t) layer.inDim;
+	const float *weights = layer.weights.data();
+
+	#pragma omp parallel for
+	for (size_t i=0; i<numRows; i++) {
+		const float *inRow = in + i*inDim;
+		for (size_t o=0; o<outDim; o++) {
+			const float *weightRow = weights + o*inDim;
+			float sum = 0.0f;
+			for (size_t k=0; k<inDim; k++) {
+				sum += inRow[k]*weightRow[k];
+			}
+			out[i*outDim + o] += sum;
+		}
+	}
+#endif
+}
+
+static void relu(float *x, size_t size) {
+	#pragma omp parallel for
+	for (size_t i=0; i<size; i++) {
+		x[i] = std::max(x[i],0.0f);
+	}
+}
+
+NnetHeuristic::NnetHeuristic() {
+	this->stateDim = 0;
+	this->oneHotDepth = 0;
+	memset(this->inputMap,0,sizeof(this->inputMap));
+	this->maxBatchSize = 1024;
+	this->numStates = 0;
+	this->stateDimMatches = true;
+}
+
+bool NnetHeuristic::load(std::string fileName) {
+	FILE *f = fopen(fileName.c_str(),"rb");
+	if (f == NULL) {
+		perror(fileName.c_str());
+		return(false);
+	}
+
+	// Header: magic, then stateDim, oneHotDepth, h1Dim, resnetDim, numResnetBlocks and outDim as 4 byte integers
+	char magic[8];
+	int32_t dims[6];
+	bool ok = (fread(magic,1,sizeof(magic),f) == sizeof(magic)) && (memcmp(magic,nnetMagic,sizeof(magic)) == 0);
+	ok = ok && (fread(dims,sizeof(int32_t),6,f) == 6) && (fread(this->inputMap,sizeof(float),256,f) == 256);
+
+	int h1Dim = 0, resnetDim = 0, numResnetBlocks = 0, outDim = 0;
+	if (ok) {
+		this->stateDim = dims[0];
+		this->oneHotDepth = dims[1];
+		h1Dim = dims[2];
+		resnetDim = dims[3];
+		numResnetBlocks = dims[4];
+		outDim = dims[5];
+	}
+
+	// Layers
+	int inDim = this->oneHotDepth > 0 ? this->stateDim*this->oneHotDepth : this->stateDim;
+	ok = ok && readLayer(f,this->fc1,inDim,h1Dim) && readLayer(f,this->fc2,h1Dim,resnetDim);
+
+	this->resFc1s.resize((size_t) std::max(numResnetBlocks,0));
+	this->resFc2s.resize((size_t) std::max(numResnetBlocks,0));
+	for (int i=0; ok && (i<numResnetBlocks); i++) {
+		ok = readLayer(f,this->resFc1s[(size_t) i],resnetDim,resnetDim) && readLayer(f,this->resFc2s[(size_t) i],resnetDim,resnetDim);
+	}
+	ok = ok && readLayer(f,this->fcOut,resnetDim,outDim);
+	fclose(f);
+
+	if (!ok) {
+		fprintf(stderr,"%s is not a valid nnet file\n",fileName.c_str());
+		return(false);
+	}
+
+	// Columns of the first layer are added up for one-hot inputs
+	if (this->oneHotDepth > 0) {
+		size_t numCols = (size_t) inDim;
+		size_t numRows = (size_t) h1Dim;
+		this->fc1Cols.resize(numCols*numRows);
+		for (size_t j=0; j<numRows; j++) {
+			for (size_t c=0; c<numCols; c++) {
+				this->fc1Cols[c*numRows + j] = this->fc1.weights[j*numCols + c];
+			}
+		}
+		std::vector<float>().swap(this->fc1.weights);
+	}
+
+	return(true);
+}
+
+int NnetHeuristic::getStateDim() const {
+	return(this->stateDim);
+}
+
+void NnetHeuristic::forward(const uint8_t *states, size_t numStates, float *values) {
+	size_t stateDim = (size_t) this->stateDim;
+	size_t h1Dim = (size_t) this->fc1.outDim;
+	size_t resnetDim = (size_t) this->fc2.outDim;
+	size_t outDim = (size_t) this->fcOut.outDim;
+
+	this->h1Buf.resize(numStates*h1Dim);
+	this->xBuf.resize(numStates*resnetDim);
+	this->resBuf.resize(numStates*resnetDim);
+	this->outBuf.resize(numStates*std::max(resnetDim,outDim));
+	float *h1 = this->h1Buf.data();
+	float *x = this->xBuf.data();
+	float *res = this->resBuf.data();
+	float *out = this->outBuf.data();
+
+	// First layer
+	if (this->oneHotDepth > 0) {
+		size_t oneHotDepth = (size_t) this->oneHotDepth;
+
+		#pragma omp parallel for
+		for (size_t i=0; i<numStates; i++) {
+			float *h1Row = h1 + i*h1Dim;
+			memcpy(h1Row,this->fc1.bias.data(),h1Dim*sizeof(float));
+			for (size_t k=0; k<stateDim; k++) {
+				// values are checked in computeHeuristics
+				size_t val = (size_t) this->inputMap[states[i*stateDim + k]];
+				const float *col = this->fc1Cols.data() + (k*oneHotDepth + (size_t) val)*h1Dim;
+				for (size_t j=0; j<h1Dim; j++) {
+					h1Row[j] += col[j];
+				}
+			}
+		}
+	} else {
+		this->inputBuf.resize(numStates*stateDim);
+		for (size_t i=0; i<numStates*stateDim; i++) {
+			this->inputBuf[i] = this->inputMap[states[i]];
+		}
+		linear(this->fc1,this->inputBuf.data(),numStates,h1);
+	}
+	relu(h1,numStates*h1Dim);
+
+	linear(this->fc2,h1,numStates,x);
+	relu(x,numStates*resnetDim);
+
+	// Resnet blocks
+	for (size_t b=0; b<this->resFc1s.size(); b++) {
+		linear(this->resFc1s[b],x,numStates,res);
+		relu(res,numStates*resnetDim);
+		linear(this->resFc2s[b],res,numStates,out);
+
+		#pragma omp parallel for
+		for (size_t i=0; i<numStates*resnetDim; i++) {
+			x[i] = std::max(x[i] + out[i],0.0f);
+		}
+	}
+
+	// Output
+	linear(this->fcOut,x,numStates,out);
+	for (size_t i=0; i<numStates; i++) {
+		values[i] = std::max(out[i*outDim],0.0f);
+	}
+}
+
+uint8_t *NnetHeuristic::getStateBuffer(size_t numStates, size_t stateDim) {
+	this->numStates = numStates;
+	this->stateDimMatches = stateDim == (size_t) this->stateDim;
+	this->stateBuf.resize(std::max(numStates*stateDim,(size_t) 1));
+
+	return(this->stateBuf.data());
+}
+
+const float *NnetHeuristic::computeHeuristics() {
+	if (!this->stateDimMatches) {
+		fprintf(stderr,"States do not have the dimension of the nnet (%i)\n",this->stateDim);
+		return(NULL);
+	}
+
+	// Like one_hot in PyTorch, values outside of the one-hot input are an error
+	if (this->oneHotDepth > 0) {
+		size_t numVals = this->numStates*(size_t) this->stateDim;
+		for (size_t i=0; i<numVals; i++) {
+			float val = this->inputMap[this->stateBuf[i]];
+			if ((val < 0.0f) || (val >= (float) this->oneHotDepth)) {
+				fprintf(stderr,"State value %i is %g as nnet input, which is not in [0, %i)\n",
+						(int) this->stateBuf[i],(double) val,this->oneHotDepth);
+				return(NULL);
+			}
+		}
+	}
+
+	this->valueBuf.resize(std::max(this->numStates,(size_t) 1));
+	for (size_t start=0; start<this->numStates; start+=this->maxBatchSize) {
+		size_t batchSize = std::min(this->maxBatchSize,this->numStates - start);
+		this->forward(this->stateBuf.data() + start*(size_t) this->stateDim,batchSize,this->valueBuf.data() + start);
+	}
+
+	return(this->valueBuf.data());
+}
@@ -0,0 +1,62 @@
+#ifndef NNET_H
+#define NNET_H
+
+#include <vector>
+#include <string>
+#include <stdint.h>
+#include <stddef.h>
+
+#include "heuristic.h"
+
+/*** Fully connected layer, weights are outDim x inDim ***/
+struct NnetLayer {
+	int inDim;
+	int outDim;
+	std::vector<float> weights;
+	std::vector<float> bias;
+};
+
+/*** ResnetModel evaluated on the CPU ***/
+/* Weights are read from a file written by nnet_utils.export_resnet, with batch norm folded into the linear layers.
+ * The first layer of a one-hot model adds up one column of its weights per element instead of multiplying the one-hot
+ * input. The other layers are matrix multiplications, with BLAS if it was found when building. Heuristic values are
+ * clipped at zero. */
+class NnetHeuristic: public Heuristic {
+	private:
+		int stateDim;
+		int oneHotDepth;
+		float inputMap[256];
+
+		std::vector<float> fc1Cols;
+		NnetLayer fc1;
+		NnetLayer fc2;
+		std::vector<NnetLayer> resFc1s;
+		std::vector<NnetLayer> resFc2s;
+		NnetLayer fcOut;
+
+		size_t maxBatchSize;
+		std::vector<uint8_t> stateBuf;
+		size_t numStates;
+		bool stateDimMatches;
+		std::vector<float> inputBuf;
+		std::vector<float> h1Buf;
+		std::vector<float> xBuf;
+		std::vector<float> resBuf;
+		std::vector<float> outBuf;
+		std::vector<float> valueBuf;
+
+		void forward(const uint8_t *states, size_t numStates, float *values);
+	public:
+		NnetHeuristic();
+
+		/* Returns false if the file cannot be read */
+		bool load(std::string fileName);
+
+		int getStateDim() const;
+
+		virtual uint8_t *getStateBuffer(size_t numStates, size_t stateDim);
+
+		virtual const float *computeHeuristics();
+};
+
+#endif
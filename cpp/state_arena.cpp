@@ -0,0 +1,93 @@
+#include "state_arena.h"
+
+#include <algorithm>
+
+/// StatePacker
+StatePacker::StatePacker(size_t stateDim, int bitsPerElem) {
+	this->stateDim = stateDim;
+	this->bitsPerElem = bitsPerElem;
+	this->numBytes = (stateDim*((size_t) bitsPerElem) + 7)/8;
+}
+
+size_t StatePacker::getStateDim() const {
+	return(this->stateDim);
+}
+
+size_t StatePacker::getNumBytes() const {
+	return(this->numBytes);
+}
+
+void StatePacker::pack(const std::vector<uint8_t> &state, uint8_t *packed) const {
+	uint64_t acc = 0;
+	int accBits = 0;
+	size_t byteIdx = 0;
+	for (size_t i=0; i<this->stateDim; i++) {
+		acc |= ((uint64_t) state[i]) << accBits;
+		accBits += this->bitsPerElem;
+		while (accBits >= 8) {
+			packed[byteIdx++] = (uint8_t) (acc & 0xFF);
+			acc >>= 8;
+			accBits -= 8;
+		}
+	}
+	if (accBits > 0) {
+		packed[byteIdx] = (uint8_t) (acc & 0xFF);
+	}
+}
+
+void StatePacker::unpack(const uint8_t *packed, uint8_t *state) const {
+	const uint64_t mask = (((uint64_t) 1) << this->bitsPerElem) - 1;
+	uint64_t acc = 0;
+	int accBits = 0;
+	size_t byteIdx = 0;
+	for (size_t i=0; i<this->stateDim; i++) {
+		while (accBits < this->bitsPerElem) {
+			acc |= ((uint64_t) packed[byteIdx++]) << accBits;
+			accBits += 8;
+		}
+		state[i] = (uint8_t) (acc & mask);
+		acc >>= this->bitsPerElem;
+		accBits -= this->bitsPerElem;
+	}
+}
+
+/// Arena
+Arena::Arena(size_t objSize, size_t objsPerChunk) {
+	this->objSize = ((objSize + 7)/8)*8; // keep objects 8 byte aligned
+	this->objsPerChunk = objsPerChunk;
+	this->chunkCapacity = 0;
+	this->numUsed = 0;
+	this->numBytes = 0;
+}
+
+Arena::~Arena() {
+	for (unsigned int i=0; i<this->chunks.size(); i++) {
+		delete[] this->chunks[i];
+	}
+}
+
+void Arena::reserve(size_t num) {
+	// Start a new chunk if the current one does not have room for num more objects
+	if (this->numUsed + num > this->chunkCapacity) {
+		this->chunkCapacity = std::max(this->objsPerChunk,num);
+		this->chunks.push_back(new uint8_t[this->objSize*this->chunkCapacity]);
+		this->numUsed = 0;
+		this->numBytes += this->objSize*this->chunkCapacity;
+	}
+}
+
+void *Arena::allocReserved() {
+	size_t objIdx = this->numUsed.fetch_add(1);
+
+	return(this->chunks.back() + objIdx*this->objSize);
+}
+
+void *Arena::alloc() {
+	this->reserve(1);
+
+	return(this->allocReserved());
+}
+
+size_t Arena::getNumBytes() const {
+	return(this->numBytes);
+}
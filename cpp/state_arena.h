@@ -0,0 +1,52 @@
+#ifndef STATE_ARENA_H
+#define STATE_ARENA_H
+
+#include <vector>
+#include <atomic>
+#include <stdint.h>
+#include <stddef.h>
+
+/*** StatePacker ***/
+/* States are stored with a fixed number of bits for each element, e.g. 6 bits for the 54 stickers of Cube3 */
+class StatePacker {
+	private:
+		size_t stateDim;
+		int bitsPerElem;
+		size_t numBytes;
+	public:
+		StatePacker(size_t stateDim, int bitsPerElem);
+
+		size_t getStateDim() const;
+
+		size_t getNumBytes() const;
+
+		void pack(const std::vector<uint8_t> &state, uint8_t *packed) const;
+
+		void unpack(const uint8_t *packed, uint8_t *state) const;
+};
+
+/*** Arena ***/
+/* Memory for objects of the same size. Objects are never freed one at a time, all memory is released when the arena is
+ * deleted. Several threads can call allocReserved at the same time for objects reserved beforehand with reserve. */
+class Arena {
+	private:
+		size_t objSize;
+		size_t objsPerChunk;
+		std::vector<uint8_t*> chunks;
+		size_t chunkCapacity;
+		std::atomic<size_t> numUsed;
+		size_t numBytes;
+	public:
+		Arena(size_t objSize, size_t objsPerChunk);
+		~Arena();
+
+		void reserve(size_t num);
+
+		void *allocReserved();
+
+		void *alloc();
+
+		size_t getNumBytes() const;
+};
+
+#endif
@@ -0,0 +1,139 @@
+#include "transport.h"
+
+#include <cstring>
+#include <stdio.h>
+#include <stdlib.h>
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/socket.h>
+#include <sys/types.h>
+#include <sys/un.h>
+#include <unistd.h>
+
+static void transportError(const char *msg) {
+	perror(msg);
+	exit(1);
+}
+
+static void writeAll(int fd, const void *data, size_t size) {
+	const char *dataPtr = (const char*) data;
+	while (size > 0) {
+		ssize_t numWritten = write(fd,dataPtr,size);
+		if (numWritten <= 0) {
+			transportError("Writing to socket");
+		}
+		dataPtr += numWritten;
+		size -= (size_t) numWritten;
+	}
+}
+
+static void readAll(int fd, void *data, size_t size) {
+	char *dataPtr = (char*) data;
+	while (size > 0) {
+		ssize_t numRead = read(fd,dataPtr,size);
+		if (numRead <= 0) {
+			transportError("Reading from socket");
+		}
+		dataPtr += numRead;
+		size -= (size_t) numRead;
+	}
+}
+
+HeuristicTransport::HeuristicTransport(std::string socketName, std::string shmName) {
+	struct sockaddr_un serv_addr;
+
+	// Initalize socket
+	bzero((char *)&serv_addr,sizeof(serv_addr));
+	serv_addr.sun_family = AF_UNIX;
+	strcpy(serv_addr.sun_path, socketName.c_str());
+	int servlen = (int) strlen(serv_addr.sun_path) + (int) sizeof(serv_addr.sun_family);
+
+	if ((this->sockfd = socket(AF_UNIX, SOCK_STREAM,0)) < 0)
+		transportError("Creating socket");
+	if (connect(this->sockfd, (struct sockaddr *) &serv_addr, (socklen_t) servlen) < 0)
+		transportError("Connecting");
+
+	// Initialize shared memory
+	this->useShm = shmName.size() > 0;
+	this->shmName = shmName;
+	this->shmFd = -1;
+	this->shm = NULL;
+	this->shmSize = 0;
+	if (this->useShm) {
+		if ((this->shmFd = open(shmName.c_str(), O_RDWR | O_CREAT | O_TRUNC, 0600)) < 0)
+			transportError("Creating shared memory");
+		this->resizeShm(1 << 20);
+	}
+
+	this->numBytes = 0;
+	this->numStates = 0;
+	this->valuesOffset = 0;
+}
+
+HeuristicTransport::~HeuristicTransport() {
+	if (this->useShm) {
+		munmap(this->shm,this->shmSize);
+		close(this->shmFd);
+		unlink(this->shmName.c_str());
+	}
+	close(this->sockfd);
+}
+
+void HeuristicTransport::resizeShm(size_t size) {
+	if (this->shm != NULL) {
+		munmap(this->shm,this->shmSize);
+	}
+	if (ftruncate(this->shmFd,(off_t) size) < 0)
+		transportError("Resizing shared memory");
+
+	void *shm = mmap(NULL,size,PROT_READ | PROT_WRITE,MAP_SHARED,this->shmFd,0);
+	if (shm == MAP_FAILED)
+		transportError("Mapping shared memory");
+
+	this->shm = (uint8_t*) shm;
+	this->shmSize = size;
+}
+
+uint8_t *HeuristicTransport::getStateBuffer(size_t numStates, size_t stateDim) {
+	this->numStates = numStates;
+	this->numBytes = numStates*stateDim;
+	this->valuesOffset = ((this->numBytes + 63)/64)*64; // values are aligned after the states
+
+	if (!this->useShm) {
+		this->stateBuf.resize(this->numBytes);
+		return(this->stateBuf.data());
+	}
+
+	size_t sizeNeeded = this->valuesOffset + sizeof(float)*numStates;
+	if (sizeNeeded > this->shmSize) {
+		size_t size = this->shmSize;
+		while (size < sizeNeeded) {
+			size *= 2;
+		}
+		this->resizeShm(size);
+	}
+
+	return(this->shm);
+}
+
+const float *HeuristicTransport::computeHeuristics() {
+	if (!this->useShm) {
+		unsigned long long dataSendSize = this->numBytes;
+		writeAll(this->sockfd,&dataSendSize,8);
+		writeAll(this->sockfd,this->stateBuf.data(),this->numBytes);
+
+		this->valueBuf.resize(this->numStates);
+		readAll(this->sockfd,this->valueBuf.data(),sizeof(float)*this->numStates);
+
+		return(this->valueBuf.data());
+	}
+
+	// Ring the doorbell and wait for the reply
+	long long doorbell[3] = {(long long) this->numBytes, (long long) this->numStates, (long long) this->valuesOffset};
+	writeAll(this->sockfd,doorbell,sizeof(doorbell));
+
+	char reply;
+	readAll(this->sockfd,&reply,1);
+
+	return((const float*) (this->shm + this->valuesOffset));
+}
@@ -0,0 +1,40 @@
+#include <vector>
+#include <string>
+#include <stdint.h>
+#include <stddef.h>
+
+#include "heuristic.h"
+
+/*** Transport to the heuristic server ***/
+/* computeHeuristics sends the states to the heuristic server and waits for the heuristic value of each state.
+ *
+ * socket: an 8 byte size followed by the states are written to the socket and the values are read back from it.
+ * shared memory: states and values are in a file mapped into memory by both processes (e.g. in /dev/shm). Only a
+ * doorbell goes over the socket: the number of bytes of states, the number of states and the offset of the values, as
+ * 8 byte integers. The server writes the values as float32 at the offset and replies with one byte. */
+class HeuristicTransport: public Heuristic {
+	private:
+		int sockfd;
+		bool useShm;
+
+		std::string shmName;
+		int shmFd;
+		uint8_t *shm;
+		size_t shmSize;
+
+		std::vector<uint8_t> stateBuf;
+		size_t numBytes;
+		size_t numStates;
+		size_t valuesOffset;
+		std::vector<float> valueBuf;
+
+		void resizeShm(size_t size);
+	public:
+		/* shmName is the path of the memory mapped file, an empty shmName uses the socket for data */
+		HeuristicTransport(std::string socketName, std::string shmName);
+		~HeuristicTransport();
+
+		virtual uint8_t *getStateBuffer(size_t numStates, size_t stateDim);
+
+		virtual const float *computeHeuristics();
+};
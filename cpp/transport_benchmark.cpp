@@ -0,0 +1,61 @@
+#include <stdio.h>
+#include <stdlib.h>
+#include <string>
+#include <vector>
+#include <chrono>
+
+#include "transport.h"
+
+/* Usage: transport_benchmark <socket> <shm> <state_dim> <num_requests> <num_states> [<num_states> ...]
+ * shm is - to send data over the socket. The server should return the first element of each state as its value. */
+int main(int argc, const char *argv[]) {
+	if (argc < 6) {
+		fprintf(stderr,"Usage: %s <socket> <shm> <state_dim> <num_requests> <num_states> [<num_states> ...]\n",argv[0]);
+		return 1;
+	}
+
+	std::string socketName = argv[1];
+	std::string shmName = argv[2];
+	if (shmName == "-") {
+		shmName = "";
+	}
+	size_t stateDim = (size_t) atoi(argv[3]);
+	int numRequests = atoi(argv[4]);
+
+	HeuristicTransport transport(socketName,shmName);
+	for (int argIdx=5; argIdx<argc; argIdx++) {
+		size_t numStates = (size_t) atol(argv[argIdx]);
+
+		double writeTime = 0, heuristicTime = 0;
+		for (int reqIdx=0; reqIdx<numRequests; reqIdx++) {
+			std::chrono::high_resolution_clock::time_point t1 = std::chrono::high_resolution_clock::now();
+			uint8_t *states = transport.getStateBuffer(numStates,stateDim);
+			for (size_t i=0; i<numStates; i++) {
+				for (size_t j=0; j<stateDim; j++) {
+					states[i*stateDim + j] = (uint8_t) ((i + j + (size_t) reqIdx) % 251);
+				}
+			}
+			std::chrono::high_resolution_clock::time_point t2 = std::chrono::high_resolution_clock::now();
+
+			const float *values = transport.computeHeuristics();
+			std::chrono::high_resolution_clock::time_point t3 = std::chrono::high_resolution_clock::now();
+
+			for (size_t i=0; i<numStates; i++) {
+				if (values[i] != (float) ((i + (size_t) reqIdx) % 251)) {
+					fprintf(stderr,"Wrong value for state %lu of request %i\n",i,reqIdx);
+					return 1;
+				}
+			}
+
+			writeTime += ((double) std::chrono::duration_cast<std::chrono::nanoseconds>(t2 - t1).count())/1000000000.0;
+			heuristicTime += ((double) std::chrono::duration_cast<std::chrono::nanoseconds>(t3 - t2).count())/1000000000.0;
+		}
+		writeTime /= numRequests;
+		heuristicTime /= numRequests;
+
+		printf("Transport: %s, States: %lu, Write: %f, Round trip: %f, States/sec: %.0f\n",shmName.size() > 0 ? "shm" : "socket",numStates,writeTime,heuristicTime,((double) numStates)/heuristicTime);
+		fflush(stdout);
+	}
+
+	return 0;
+}
@@ -0,0 +1,570 @@
+#include <cstring>
+#include <stdio.h>
+#include <stdlib.h>
+#include <vector>
+#include <queue>          // std::priority_queue
+#include <unordered_set>
+#include <algorithm>
+#include <chrono>
+#include <limits>
+#include <boost/functional/hash.hpp>
+
+#include "weighted_astar.h"
+#include "state_arena.h"
+
+double getTimeElapsed(std::chrono::high_resolution_clock::time_point t1, std::chrono::high_resolution_clock::time_point t2) {
+	double timeElapsed = ((double) std::chrono::duration_cast<std::chrono::nanoseconds>( t2 - t1 ).count())/1000000000.0;
+	return(timeElapsed);
+}
+
+/*** Search Algorithm ***/
+//Track environment information
+struct Node {
+		const uint8_t *state; // packed state, see StatePacker
+		size_t hash;
+		int depth;
+		int parentMove;
+		float cost;
+		float heuristic;
+		bool isSolved;
+		Node *parent;
+};
+
+struct NodePointerEq {
+	size_t numBytes;
+
+	bool operator () ( Node const *lhs, Node const *rhs ) const {
+		return(memcmp(lhs->state,rhs->state,numBytes) == 0);
+	}
+};
+
+
+struct Hash {
+	size_t operator() (const Node *node) const {
+		return(node->hash);
+	}
+};
+
+// Node comparator
+class compareNodeCost {
+	public:
+	bool operator() (const Node *node1, const Node *node2) {
+		return(node1->cost > node2->cost);
+	}
+};
+
+class OpenSet: public std::priority_queue<Node*,std::vector<Node*>,compareNodeCost> {
+	public:
+	void pushBulk(const std::vector<Node*> &nodes) {
+		// Rebuilding the heap is linear in its size, which is faster than pushing when many nodes are added
+		if (nodes.size() > this->c.size()) {
+			this->c.insert(this->c.end(),nodes.begin(),nodes.end());
+			std::make_heap(this->c.begin(),this->c.end(),this->comp);
+		} else {
+			for (unsigned int i=0; i<nodes.size(); i++) {
+				this->push(nodes[i]);
+			}
+		}
+	}
+};
+
+/*** Closed Set ***/
+/* States are split into shards by their hash so that shards can be checked by different threads. The children of an
+ * iteration are grouped by shard and each shard is checked by one thread in the order of the children, so the result
+ * does not depend on the number of threads. */
+class ClosedSet {
+	private:
+		int shardBits;
+		std::vector<std::unordered_set<Node*,Hash,NodePointerEq> > shards;
+	public:
+		ClosedSet() {}
+
+		ClosedSet(int shardBits, size_t numBytes) {
+			this->shardBits = shardBits;
+			this->shards = std::vector<std::unordered_set<Node*,Hash,NodePointerEq> >(((size_t) 1) << shardBits,std::unordered_set<Node*,Hash,NodePointerEq>(16,Hash(),NodePointerEq{numBytes}));
+		}
+
+		size_t getNumShards() const {
+			return(this->shards.size());
+		}
+
+		size_t getShardIdx(const Node *node) const {
+			// Use the high bits of a multiplicative hash, the shards use the low bits for their buckets
+			return((size_t) ((((uint64_t) node->hash)*0x9E3779B97F4A7C15ULL) >> (64 - this->shardBits)));
+		}
+
+		std::unordered_set<Node*,Hash,NodePointerEq> &getShard(size_t shardIdx) {
+			return(this->shards[shardIdx]);
+		}
+
+		void insert(Node *node) {
+			this->shards[this->getShardIdx(node)].insert(node);
+		}
+
+		size_t size() const {
+			size_t closedSize = 0;
+			for (unsigned int i=0; i<this->shards.size(); i++) {
+				closedSize += this->shards[i].size();
+			}
+
+			return(closedSize);
+		}
+};
+
+void writeStates(Heuristic &heuristic, std::vector<Node*> &children, const StatePacker &packer) {
+	// Unpack states straight into the buffer of the heuristic
+	size_t stateDim = packer.getStateDim();
+	uint8_t *states = heuristic.getStateBuffer(children.size(),stateDim);
+
+	#pragma omp parallel for
+	for (unsigned int i=0; i<children.size(); i++) {
+		packer.unpack(children[i]->state,states + i*stateDim);
+	}
+}
+
+struct Instance {
+		int stateIdx;
+		const Environment *env;
+		float depthPenalty;
+		OpenSet open;
+		ClosedSet closed;
+		Arena *nodeArena; // nodes and packed states kept by the search, released with the instance
+		Arena *stateArena;
+		long numNodesGenerated;
+		long numNodesEvaluated;
+		int searchItr;
+		bool isDone;
+		Node *root;
+		Node *solvedNode;
+		std::vector<Node*> poppedRecorded; // only with recordPopped
+		std::vector<float> poppedBellman;
+		std::chrono::high_resolution_clock::time_point startTime;
+};
+
+Node *addNode(Instance *inst, const Node &node, const StatePacker &packer) {
+	// Copy a node and its state into space reserved in the arenas of the instance
+	uint8_t *state = (uint8_t*) inst->stateArena->allocReserved();
+	memcpy(state,node.state,packer.getNumBytes());
+
+	Node *nodeAdded = new (inst->nodeArena->allocReserved()) Node(node);
+	nodeAdded->state = state;
+
+	return(nodeAdded);
+}
+
+const int closedShardBits = 6;
+
+Instance *initInstance(const Environment *env, int stateIdx, float depthPenalty, const StatePacker &packer) {
+	Instance *inst = new Instance();
+	inst->stateIdx = stateIdx;
+	inst->env = env;
+	inst->depthPenalty = depthPenalty;
+	inst->closed = ClosedSet(closedShardBits,packer.getNumBytes());
+	inst->nodeArena = new Arena(sizeof(Node),1 << 16);
+	inst->stateArena = new Arena(packer.getNumBytes(),1 << 16);
+	inst->numNodesGenerated = 1;
+	inst->numNodesEvaluated = 0;
+	inst->searchItr = 1;
+	inst->isDone = false;
+	inst->solvedNode = NULL;
+	inst->startTime = std::chrono::high_resolution_clock::now();
+
+	std::vector<uint8_t> rootState(packer.getNumBytes());
+	packer.pack(env->getState(),rootState.data());
+	size_t hash = boost::hash_range(rootState.begin(),rootState.end());
+
+	inst->nodeArena->reserve(1);
+	inst->stateArena->reserve(1);
+	Node *root = addNode(inst,Node{rootState.data(),hash,0,-1,0,0,env->isSolved(),NULL},packer);
+	inst->root = root;
+	inst->open.push(root); //Push root node to open
+	inst->closed.insert(root); //Add root node to seen
+
+	return(inst);
+}
+
+
+void deleteInstance(Instance *inst) {
+	delete inst->nodeArena;
+	delete inst->stateArena;
+	delete inst->env;
+	delete inst;
+}
+
+std::vector<Node*> popNodes(Instance *inst, int numParallel) {
+	// Remove from open, the instance is done when a goal node is popped
+	int openSize = (int) inst->open.size();
+	int numPop = std::min(openSize,numParallel);
+	std::vector<Node*> popped;
+
+	bool goal_node_found_prev = inst->solvedNode != NULL;
+	for (int i=0; i<numPop; i++) {
+		Node *node = inst->open.top();
+		popped.push_back(node);
+		inst->open.pop();
+
+		bool isSolved_itr = node->isSolved;
+		if (isSolved_itr) {
+			if (numParallel == 1) {
+				inst->solvedNode = node;
+				inst->isDone = true;
+			} else {
+				if (inst->solvedNode == NULL) {
+					inst->solvedNode = node;
+				} else if (inst->solvedNode->cost > node->cost) {
+					inst->solvedNode = node;
+				}
+			}
+			break;
+		}
+	}
+	if (popped.size() == 0) {
+		// open is empty
+		inst->isDone = true;
+	} else if (goal_node_found_prev && (popped[0]->cost >= inst->solvedNode->cost)) {
+		inst->isDone = true;
+	}
+
+	return(popped);
+}
+
+void expandNodes(const Environment *env, std::vector<Node*> &popped, const StatePacker &packer, float depthPenalty, std::vector<Node> &children, std::vector<uint8_t> &childStates) {
+	/* Children are written to children and their packed states to childStates. They are only copied into the arenas
+	 * of the instance if they are kept. */
+	size_t numActions = (size_t) env->getNumActions();
+	size_t numBytes = packer.getNumBytes();
+	children.resize(popped.size()*numActions);
+	childStates.resize(children.size()*numBytes);
+
+	#pragma omp parallel for
+	for (unsigned int i=0; i<popped.size(); i++) {
+		std::vector<uint8_t> state(packer.getStateDim());
+		packer.unpack(popped[i]->state,state.data());
+		Environment *parentEnv = env->fromState(state);
+
+		std::vector<Environment*> children_env = parentEnv->getNextStates();
+		int depth = popped[i]->depth + 1;
+
+		for (unsigned int j=0; j<children_env.size(); j++) {
+			uint8_t *childState = &childStates[(i*numActions + j)*numBytes];
+			packer.pack(children_env[j]->getState(),childState);
+			size_t hash = boost::hash_range(childState,childState + numBytes);
+			bool isSolved = children_env[j]->isSolved();
+
+			float heuristic_lb = std::max(popped[i]->heuristic - 1, (float) 0.0);  //TODO replace with transition cost
+			float cost = heuristic_lb*(!isSolved) + depthPenalty*((float) depth);
+			children[i*numActions + j] = Node{childState,hash,depth,(int) j,cost,heuristic_lb,isSolved,popped[i]};
+
+			delete children_env[j];
+		}
+		delete parentEnv;
+	}
+}
+
+std::vector<Node*> checkClosed(Instance *inst, std::vector<Node> &children, const StatePacker &packer, std::vector<Node*> &childNodes) {
+	/* Returns the children that are not in closed or are reached with a smaller depth, in order. A state that repeats
+	 * in the batch is only kept once unless a later copy has a smaller depth. childNodes is set to the node that holds
+	 * the heuristic value of each child, either the node added for it or the node already in closed. */
+	ClosedSet &closed = inst->closed;
+	size_t numShards = closed.getNumShards();
+
+	// Group children by shard, keeping their order
+	std::vector<size_t> shardIdxs(children.size());
+	std::vector<size_t> shardStarts(numShards + 1,0);
+	for (unsigned int i=0; i<children.size(); i++) {
+		shardIdxs[i] = closed.getShardIdx(&children[i]);
+		shardStarts[shardIdxs[i] + 1]++;
+	}
+	for (unsigned int shardIdx=0; shardIdx<numShards; shardIdx++) {
+		shardStarts[shardIdx + 1] += shardStarts[shardIdx];
+	}
+
+	std::vector<unsigned int> childIdxsByShard(children.size());
+	std::vector<size_t> shardEnds(shardStarts.begin(),shardStarts.end() - 1);
+	for (unsigned int i=0; i<children.size(); i++) {
+		childIdxsByShard[shardEnds[shardIdxs[i]]++] = i;
+	}
+
+	// Check shards in parallel
+	inst->nodeArena->reserve(children.size());
+	inst->stateArena->reserve(children.size());
+	std::vector<Node*> nodesAdded(children.size(),NULL);
+	childNodes.resize(children.size());
+
+	#pragma omp parallel for schedule(dynamic)
+	for (unsigned int shardIdx=0; shardIdx<numShards; shardIdx++) {
+		std::unordered_set<Node*,Hash,NodePointerEq> &shard = closed.getShard(shardIdx);
+		for (size_t k=shardStarts[shardIdx]; k<shardStarts[shardIdx + 1]; k++) {
+			unsigned int i = childIdxsByShard[k];
+			Node *node = &children[i];
+			std::unordered_set<Node*,Hash,NodePointerEq>::const_iterator found = shard.find(node);
+
+			if (found == shard.end()) {
+				Node *nodeAdded = addNode(inst,*node,packer);
+				shard.insert(nodeAdded);
+				nodesAdded[i] = nodeAdded;
+				childNodes[i] = nodeAdded;
+			} else if ((*found)->depth > node->depth) {
+				(*found)->depth = node->depth;
+				(*found)->parentMove = node->parentMove;
+				(*found)->parent = node->parent;
+
+				nodesAdded[i] = addNode(inst,*node,packer);
+				childNodes[i] = nodesAdded[i];
+			} else {
+				childNodes[i] = *found;
+			}
+		}
+	}
+
+	std::vector<Node*> nodesToAdd;
+	for (unsigned int i=0; i<children.size(); i++) {
+		if (nodesAdded[i] != NULL) {
+			nodesToAdd.push_back(nodesAdded[i]);
+		}
+	}
+	inst->numNodesGenerated += children.size();
+	inst->numNodesEvaluated += nodesToAdd.size();
+
+	return(nodesToAdd);
+}
+void addPoppedBellman(Instance *inst, const std::vector<Node*> &popped, const std::vector<Node*> &childNodes) {
+	// Bellman backup of each expanded node from the heuristic values of its children, every action costs 1
+	size_t numActions = (size_t) inst->env->getNumActions();
+	for (unsigned int i=0; i<popped.size(); i++) {
+		float bellman = 0;
+		if (!popped[i]->isSolved) {
+			bellman = std::numeric_limits<float>::max();
+			for (size_t j=0; j<numActions; j++) {
+				bellman = std::min(bellman,1 + childNodes[i*numActions + j]->heuristic);
+			}
+		}
+		inst->poppedRecorded.push_back(popped[i]);
+		inst->poppedBellman.push_back(bellman);
+	}
+}
+
+SearchResult getResult(const Instance *inst, const StatePacker &packer) {
+	SearchResult result;
+	result.stateIdx = inst->stateIdx;
+	result.solved = inst->solvedNode != NULL;
+	if (inst->solvedNode != NULL) {
+		Node *currNode = inst->solvedNode;
+		while (currNode->depth > 0) {
+			result.moves.push_back(currNode->parentMove);
+			currNode = currNode->parent;
+		}
+		std::reverse(result.moves.begin(),result.moves.end());
+	}
+	result.numNodesGenerated = inst->numNodesGenerated;
+	result.numNodesEvaluated = inst->numNodesEvaluated;
+	result.iterations = inst->searchItr;
+	result.time = getTimeElapsed(inst->startTime,std::chrono::high_resolution_clock::now());
+
+	size_t stateDim = packer.getStateDim();
+	result.poppedStates.resize(inst->poppedRecorded.size()*stateDim);
+	for (unsigned int i=0; i<inst->poppedRecorded.size(); i++) {
+		packer.unpack(inst->poppedRecorded[i]->state,result.poppedStates.data() + i*stateDim);
+	}
+	result.poppedBellman = inst->poppedBellman;
+
+	return(result);
+}
+
+bool parallelWeightedAStar(std::vector<const Environment*> &envs, const std::vector<float> &depthPenalties, int numParallel, Heuristic &heuristic, int numInstances, int maxIterations, bool recordPopped, bool verbose, std::function<void(const SearchResult&)> onResult) {
+	if (envs.size() == 0) {
+		return(true);
+	}
+	StatePacker packer(envs[0]->getState().size(),envs[0]->getBitsPerElem());
+	std::vector<Node> children;
+	std::vector<uint8_t> childStates;
+
+	std::vector<Instance*> instances;
+	unsigned int nextStateIdx = 0;
+	int searchItr = 1;
+	while ((nextStateIdx < envs.size()) || (instances.size() > 0)) {
+		std::chrono::high_resolution_clock::time_point startTime, t1;
+		double itrTime, remOpenTime, expandingTime, dataWriteTime, checkClosedTime, heuristicTime, costTime, addToQueueTime;
+		float maxValue = 0, minValue = 0, minCost = 0, maxCost = 0;
+
+		startTime = std::chrono::high_resolution_clock::now();
+
+		// Start searching the next states
+		while (((int) instances.size() < numInstances) && (nextStateIdx < envs.size())) {
+			instances.push_back(initInstance(envs[nextStateIdx],(int) nextStateIdx,depthPenalties[nextStateIdx],packer));
+			nextStateIdx++;
+		}
+
+		// Remove from open
+		t1 = std::chrono::high_resolution_clock::now();
+		std::vector<std::vector<Node*> > poppedAll;
+		std::vector<Instance*> instancesItr;
+		for (unsigned int instIdx=0; instIdx<instances.size(); instIdx++) {
+			Instance *inst = instances[instIdx];
+			std::vector<Node*> popped;
+			if ((maxIterations > 0) && (inst->searchItr > maxIterations)) {
+				inst->isDone = true;
+			} else {
+				popped = popNodes(inst,numParallel);
+			}
+			if (inst->isDone) {
+				// popped nodes are not expanded, only the solved ones have a Bellman backup
+				if (recordPopped) {
+					for (unsigned int i=0; i<popped.size(); i++) {
+						if (popped[i]->isSolved) {
+							inst->poppedRecorded.push_back(popped[i]);
+							inst->poppedBellman.push_back(0);
+						}
+					}
+				}
+				onResult(getResult(inst,packer));
+				deleteInstance(inst);
+			} else {
+				instancesItr.push_back(inst);
+				poppedAll.push_back(popped);
+			}
+		}
+		instances = instancesItr;
+		remOpenTime = getTimeElapsed(t1,std::chrono::high_resolution_clock::now());
+
+		if (instances.size() == 0) {
+			continue;
+		}
+
+		// Expand and check if in closed, only the children that are kept are evaluated
+		expandingTime = 0;
+		checkClosedTime = 0;
+		long numChildren = 0;
+		std::vector<std::vector<Node*> > nodesToAddAll(instances.size());
+		std::vector<std::vector<Node*> > childNodesAll(instances.size());
+		std::vector<Node*> nodesToAddFlat;
+		std::vector<float> depthPenaltiesFlat;
+		for (unsigned int instIdx=0; instIdx<instances.size(); instIdx++) {
+			Instance *inst = instances[instIdx];
+			t1 = std::chrono::high_resolution_clock::now();
+			expandNodes(inst->env,poppedAll[instIdx],packer,inst->depthPenalty,children,childStates);
+			numChildren += (long) children.size();
+			expandingTime += getTimeElapsed(t1,std::chrono::high_resolution_clock::now());
+
+			t1 = std::chrono::high_resolution_clock::now();
+			nodesToAddAll[instIdx] = checkClosed(inst,children,packer,childNodesAll[instIdx]);
+			nodesToAddFlat.insert(nodesToAddFlat.end(),nodesToAddAll[instIdx].begin(),nodesToAddAll[instIdx].end());
+			depthPenaltiesFlat.resize(nodesToAddFlat.size(),inst->depthPenalty);
+			checkClosedTime += getTimeElapsed(t1,std::chrono::high_resolution_clock::now());
+		}
+
+		// With recorded popped nodes, the start states are evaluated in their first iteration, after the children, so
+		// that children equal to them have a heuristic value for the Bellman backups
+		long numAdded = (long) nodesToAddFlat.size();
+		std::vector<Node*> nodesToEvaluate(nodesToAddFlat);
+		if (recordPopped) {
+			for (unsigned int instIdx=0; instIdx<instances.size(); instIdx++) {
+				if (instances[instIdx]->searchItr == 1) {
+					nodesToEvaluate.push_back(instances[instIdx]->root);
+				}
+			}
+		}
+
+		// Write children of all instances
+		t1 = std::chrono::high_resolution_clock::now();
+		writeStates(heuristic,nodesToEvaluate,packer);
+		dataWriteTime = getTimeElapsed(t1,std::chrono::high_resolution_clock::now());
+
+		//Get value
+		t1 = std::chrono::high_resolution_clock::now();
+		const float *values_temp = heuristic.computeHeuristics();
+		if (values_temp == NULL) {
+			for (unsigned int instIdx=0; instIdx<instances.size(); instIdx++) {
+				deleteInstance(instances[instIdx]);
+			}
+			for (unsigned int i=nextStateIdx; i<envs.size(); i++) {
+				delete envs[i];
+			}
+
+			return(false);
+		}
+		heuristicTime = getTimeElapsed(t1,std::chrono::high_resolution_clock::now());
+
+		//Compute cost
+		t1 = std::chrono::high_resolution_clock::now();
+		minValue = std::numeric_limits<float>::max();
+		maxValue = -std::numeric_limits<float>::max();
+		minCost = std::numeric_limits<float>::max();
+		maxCost = -std::numeric_limits<float>::max();
+
+		#pragma omp parallel for reduction(min:minValue,minCost) reduction(max:maxValue,maxCost)
+		for (long i=0; i<numAdded; i++) {
+			Node *node = nodesToAddFlat[(size_t) i];
+			node->heuristic = values_temp[i];
+			node->cost = node->heuristic*(!node->isSolved) + depthPenaltiesFlat[(size_t) i]*((float) node->depth);
+
+			minValue = std::min(minValue,node->heuristic);
+			maxValue = std::max(maxValue,node->heuristic);
+			minCost = std::min(minCost,node->cost);
+			maxCost = std::max(maxCost,node->cost);
+		}
+		if (numAdded == 0) {
+			minValue = 0; maxValue = 0; minCost = 0; maxCost = 0;
+		}
+		for (size_t i=(size_t) numAdded; i<nodesToEvaluate.size(); i++) {
+			nodesToEvaluate[i]->heuristic = values_temp[i];
+		}
+		costTime = getTimeElapsed(t1,std::chrono::high_resolution_clock::now());
+
+		if (recordPopped) {
+			for (unsigned int instIdx=0; instIdx<instances.size(); instIdx++) {
+				addPoppedBellman(instances[instIdx],poppedAll[instIdx],childNodesAll[instIdx]);
+			}
+		}
+
+		//Add to open, instances are independent
+		t1 = std::chrono::high_resolution_clock::now();
+		#pragma omp parallel for schedule(dynamic) if(instances.size() > 1)
+		for (unsigned int instIdx=0; instIdx<instances.size(); instIdx++) {
+			instances[instIdx]->open.pushBulk(nodesToAddAll[instIdx]);
+			instances[instIdx]->searchItr++;
+		}
+		addToQueueTime = getTimeElapsed(t1,std::chrono::high_resolution_clock::now());
+
+		unsigned long openSize = 0, closedSize = 0;
+		for (unsigned int instIdx=0; instIdx<instances.size(); instIdx++) {
+			openSize += instances[instIdx]->open.size();
+			closedSize += instances[instIdx]->closed.size();
+		}
+
+		itrTime = getTimeElapsed(startTime,std::chrono::high_resolution_clock::now());
+
+		if (verbose) {
+			printf("Times - remOpen: %f, exp: %f, write: %f, check: %f, heur: %f, cost: %f, add: %f\n",remOpenTime,expandingTime,dataWriteTime,checkClosedTime,heuristicTime,costTime,addToQueueTime);
+
+			printf("Iteration: %i, Instances: %li, Min/Max - Heur: %.2f/%.2f, Cost: %.2f/%.2f, OpenSize: %li, ClosedSize: %li, Time: %f, Num Generated: %li, Num Added: %li\n\n",searchItr,instances.size(),minValue,maxValue,minCost,maxCost,openSize,closedSize,itrTime,numChildren,numAdded);
+		}
+
+		searchItr++;
+	}
+
+	return(true);
+}
+
+Environment *makeEnvironment(std::string envName, std::vector<uint8_t> init) {
+	Environment *env = NULL;
+	if (envName == "puzzle15") {
+		env = new PuzzleN(init,4);
+	} else if (envName == "puzzle24") {
+		env = new PuzzleN(init,5);
+	} else if (envName == "puzzle35") {
+		env = new PuzzleN(init,6);
+	} else if (envName == "puzzle48") {
+		env = new PuzzleN(init,7);
+	} else if (envName == "cube3") {
+		env = new Cube3(init);
+	} else if (envName == "cube3_solved_corners") {
+		env = new Cube3SolvedCorners(init);
+	} else if (envName == "cube4") {
+		env = new Cube4(init);
+	} else if (envName == "lightsout7") {
+		env = new LightsOut(init,7);
+	}
+
+	return(env);
+}
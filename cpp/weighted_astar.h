@@ -0,0 +1,38 @@
+#ifndef WEIGHTED_ASTAR_H
+#define WEIGHTED_ASTAR_H
+
+#include <vector>
+#include <string>
+#include <functional>
+#include <stdint.h>
+
+#include "environments.h"
+#include "heuristic.h"
+
+struct SearchResult {
+		int stateIdx;
+		bool solved;
+		std::vector<int> moves; // from the start state to the goal
+		long numNodesGenerated;
+		long numNodesEvaluated;
+		int iterations;
+		double time;
+		// only with recordPopped: the nodes that were expanded and the solved nodes that were popped, as unpacked
+		// states one after the other, with the Bellman backup of each (0 if solved, else min over children of 1 plus
+		// the heuristic of the child)
+		std::vector<uint8_t> poppedStates;
+		std::vector<float> poppedBellman;
+};
+
+/* Searches up to numInstances states at the same time. The children of all of them are given to the heuristic together.
+ * depthPenalties has the weight on the path cost of each state. With maxIterations > 0, a search stops after that many
+ * iterations, solved or not. When a state is done, onResult is called with its result and the next state takes its
+ * place. With recordPopped, the result also has the popped nodes and their Bellman backups, and the start states are
+ * evaluated so that children equal to them have a heuristic value. The search deletes the environments. Returns false
+ * if the heuristic failed, in which case the search stops. */
+bool parallelWeightedAStar(std::vector<const Environment*> &envs, const std::vector<float> &depthPenalties, int numParallel, Heuristic &heuristic, int numInstances, int maxIterations, bool recordPopped, bool verbose, std::function<void(const SearchResult&)> onResult);
+
+/* Returns NULL for an unknown environment */
+Environment *makeEnvironment(std::string envName, std::vector<uint8_t> init);
+
+#endif
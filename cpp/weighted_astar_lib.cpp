@@ -0,0 +1,138 @@
+#include <vector>
+#include <string>
+#include <algorithm>
+
+#include "weighted_astar.h"
+#include "nnet.h"
+
+/*** C interface to the search and the environments, for use from Python with ctypes ***/
+
+/* Fills values with the heuristic value of each state, returns 0 on success */
+typedef int (*HeuristicCallback)(const uint8_t *states, size_t numStates, size_t stateDim, float *values);
+
+/* poppedStates and poppedBellman are the popped nodes and their Bellman backups, numPopped is 0 unless they are recorded */
+typedef void (*ResultCallback)(int stateIdx, int solved, const int *moves, int numMoves, long numNodesGenerated, long numNodesEvaluated, int iterations, double time, const uint8_t *poppedStates, const float *poppedBellman, int numPopped);
+
+class CallbackHeuristic: public Heuristic {
+	private:
+		HeuristicCallback callback;
+		std::vector<uint8_t> stateBuf;
+		std::vector<float> valueBuf;
+		size_t numStates;
+		size_t stateDim;
+	public:
+		CallbackHeuristic(HeuristicCallback callback) {
+			this->callback = callback;
+			this->numStates = 0;
+			this->stateDim = 0;
+		}
+
+		virtual uint8_t *getStateBuffer(size_t numStates, size_t stateDim) {
+			this->numStates = numStates;
+			this->stateDim = stateDim;
+			this->stateBuf.resize(std::max(numStates*stateDim,(size_t) 1));
+
+			return(this->stateBuf.data());
+		}
+
+		virtual const float *computeHeuristics() {
+			this->valueBuf.resize(std::max(this->numStates,(size_t) 1));
+			if (this->callback(this->stateBuf.data(),this->numStates,this->stateDim,this->valueBuf.data()) != 0) {
+				return(NULL);
+			}
+
+			return(this->valueBuf.data());
+		}
+};
+
+extern "C" {
+
+/* Solves numStates states stored one after the other, stateDim elements each, with the weight on the path cost of each
+ * state in weights. With maxIterations > 0, each search stops after that many iterations. With recordPopped, the popped
+ * nodes of each search and their Bellman backups are given to resultCallback, which is called for each state when its
+ * search is done. Returns 0 on success, 1 for an unknown environment and 2 if the heuristic failed. */
+int solve(const char *envName, const uint8_t *states, size_t numStates, size_t stateDim, const float *weights, int batchSize, int numInstances, int maxIterations, int recordPopped, int verbose, HeuristicCallback heuristicCallback, ResultCallback resultCallback) {
+	std::vector<const Environment*> envs;
+	for (size_t i=0; i<numStates; i++) {
+		std::vector<uint8_t> init(states + i*stateDim,states + (i + 1)*stateDim);
+		Environment *env = makeEnvironment(envName,init);
+		if (env == NULL) {
+			for (unsigned int j=0; j<envs.size(); j++) {
+				delete envs[j];
+			}
+			return 1;
+		}
+		envs.push_back(env);
+	}
+
+	std::vector<float> depthPenalties(weights,weights + numStates);
+	CallbackHeuristic heuristic(heuristicCallback);
+	bool finished = parallelWeightedAStar(envs,depthPenalties,batchSize,heuristic,std::max(numInstances,1),maxIterations,recordPopped != 0,verbose != 0,[resultCallback](const SearchResult &result) {
+		resultCallback(result.stateIdx,result.solved ? 1 : 0,result.moves.data(),(int) result.moves.size(),result.numNodesGenerated,result.numNodesEvaluated,result.iterations,result.time,result.poppedStates.data(),result.poppedBellman.data(),(int) result.poppedBellman.size());
+	});
+
+	return(finished ? 0 : 2);
+}
+
+/* Fills values with the heuristic value of numStates states given by the nnet in nnetFile. Returns 0 on success, 1 if
+ * the file cannot be read and 2 if the states do not match the nnet. */
+int nnet_heuristics(const char *nnetFile, const uint8_t *states, size_t numStates, size_t stateDim, float *values) {
+	NnetHeuristic nnet;
+	if (!nnet.load(nnetFile)) {
+		return 1;
+	}
+
+	uint8_t *stateBuf = nnet.getStateBuffer(numStates,stateDim);
+	std::copy(states,states + numStates*stateDim,stateBuf);
+	const float *heuristics = nnet.computeHeuristics();
+	if (heuristics == NULL) {
+		return 2;
+	}
+	std::copy(heuristics,heuristics + numStates,values);
+
+	return 0;
+}
+
+/* Number of actions of the environment, -1 for an unknown environment */
+int get_num_actions(const char *envName, size_t stateDim) {
+	Environment *env = makeEnvironment(envName,std::vector<uint8_t>(stateDim,0));
+	if (env == NULL) {
+		return -1;
+	}
+	int numActions = env->getNumActions();
+	delete env;
+
+	return numActions;
+}
+
+/* Expands numStates states stored one after the other, stateDim elements each. children is
+ * numStates x numActions x stateDim, costs and solved are numStates x numActions. Every action costs 1.
+ * Returns 0 on success and 1 for an unknown environment. */
+int expand_batch(const char *envName, const uint8_t *states, size_t numStates, size_t stateDim, uint8_t *children, double *costs, uint8_t *solved) {
+	std::string name(envName);
+	int numActionsEnv = get_num_actions(envName,stateDim);
+	if (numActionsEnv < 0) {
+		return 1;
+	}
+	size_t numActions = (size_t) numActionsEnv;
+
+	#pragma omp parallel for
+	for (size_t i=0; i<numStates; i++) {
+		Environment *env = makeEnvironment(name,std::vector<uint8_t>(states + i*stateDim,states + (i + 1)*stateDim));
+		std::vector<Environment*> nextStates = env->getNextStates();
+		for (size_t a=0; a<numActions; a++) {
+			size_t childIdx = i*numActions + a;
+			std::vector<uint8_t> child = nextStates[a]->getState();
+			std::copy(child.begin(),child.end(),children + childIdx*stateDim);
+			costs[childIdx] = 1.0;
+			solved[childIdx] = nextStates[a]->isSolved() ? 1 : 0;
+
+			delete nextStates[a];
+		}
+		delete env;
+	}
+
+	return 0;
+}
+
+}
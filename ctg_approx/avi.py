@@ -56,6 +56,16 @@ def parse_arguments(parser: ArgumentParser) -> Dict[str, Any]:
                                                                                   "each process update. "
                                                                                   "Make smaller if running out of "
                                                                                   "memory.")
+    parser.add_argument('--update_nnet_max_wait', type=float, default=0.0, help="Longest time (in seconds) the "
+                                                                               "nnet waits for requests from other "
+                                                                               "workers to fill a batch of "
+                                                                               "update_nnet_batch_size states. With "
+                                                                               "0, it batches the requests that are "
+                                                                               "already waiting.")
+    parser.add_argument('--update_transport', type=str, default="queue", help="How states and results are sent "
+                                                                              "between workers and the nnet. queue "
+                                                                              "pickles them, shm writes them to "
+                                                                              "shared memory.")
     parser.add_argument('--max_update_steps', type=int, default=1, help="Number of steps to take when trying to "
                                                                         "solve training states with "
                                                                         "greedy best-first search (GBFS) or A* search. "
@@ -71,9 +81,10 @@ def parse_arguments(parser: ArgumentParser) -> Dict[str, Any]:
                                                                         "robust by exploring more of the "
                                                                         "state space.")
 
-    parser.add_argument('--update_method', type=str, default="GBFS", help="GBFS or ASTAR. If max_update_steps is 1 "
-                                                                          "then either one is the same as doing value "
-                                                                          "iteration")
+    parser.add_argument('--update_method', type=str, default="GBFS", help="GBFS, ASTAR or ASTAR_CPP (A* with the "
+                                                                          "C++ search in cpp/libweighted_astar.so). "
+                                                                          "If max_update_steps is 1 then each one is "
+                                                                          "the same as doing value iteration")
 
     parser.add_argument('--eps_max', type=float, default=0, help="When addings training states with GBFS, each "
                                                                  "instance will have an eps that is distributed "
@@ -127,7 +138,8 @@ def copy_files(src_dir: str, dest_dir: str):
 
 
 def do_update(back_max: int, update_num: int, env: Environment, max_update_steps: int, update_method: str,
-              num_states: int, eps_max: float, heur_fn_i_q, heur_fn_o_qs) -> Tuple[List[np.ndarray], np.ndarray]:
+              num_states: int, eps_max: float, heur_fn_i_q, heur_fn_o_qs,
+              transport: str = "queue") -> Tuple[List[np.ndarray], np.ndarray]:
     update_steps: int = min(update_num + 1, max_update_steps)
     num_states: int = int(np.ceil(num_states / update_steps))
 
@@ -138,7 +150,7 @@ def do_update(back_max: int, update_num: int, env: Environment, max_update_steps
     if max_update_steps > 1:
         print("Using %s with %i step(s) to add extra states to training set" % (update_method.upper(), update_steps))
     updater: Updater = Updater(env, num_states, back_max, heur_fn_i_q, heur_fn_o_qs, update_steps, update_method,
-                               update_batch_size=10000, eps_max=eps_max)
+                               update_batch_size=10000, eps_max=eps_max, transport=transport)
 
     states_update_nnet: List[np.ndarray]
     output_update: np.ndarray
@@ -212,14 +224,16 @@ def main():
                                                                                  all_zeros=all_zeros,
                                                                                  clip_zero=True,
                                                                                  batch_size=args_dict[
-                                                                                     "update_nnet_batch_size"])
+                                                                                     "update_nnet_batch_size"],
+                                                                                 max_wait=args_dict[
+                                                                                     "update_nnet_max_wait"])
 
         states_nnet: List[np.ndarray]
         outputs: np.ndarray
         states_nnet, outputs = do_update(args_dict["back_max"], update_num, env,
                                          args_dict['max_update_steps'], args_dict['update_method'],
                                          args_dict['states_per_update'], args_dict['eps_max'],
-                                         heur_fn_i_q, heur_fn_o_qs)
+                                         heur_fn_i_q, heur_fn_o_qs, transport=args_dict['update_transport'])
 
         nnet_utils.stop_heuristic_fn_runners(heur_procs, heur_fn_i_q)
 
@@ -239,7 +253,10 @@ def main():
         start_time = time.time()
         heuristic_fn = nnet_utils.get_heuristic_fn(nnet, device, env, batch_size=args_dict['update_nnet_batch_size'])
         max_solve_steps: int = min(update_num + 1, args_dict['back_max'])
-        gbfs_test(args_dict['num_test'], args_dict['back_max'], env, heuristic_fn, max_solve_steps=max_solve_steps)
+        heuristic_fn_children = nnet_utils.get_children_heuristic_fn(nnet, device, env,
+                                                                     batch_size=args_dict['update_nnet_batch_size'])
+        gbfs_test(args_dict['num_test'], args_dict['back_max'], env, heuristic_fn, max_solve_steps=max_solve_steps,
+                  heuristic_fn_children=heuristic_fn_children)
 
         print("Test time: %.2f" % (time.time() - start_time))
 
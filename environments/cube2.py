@@ -1,4 +1,4 @@
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional
 import numpy as np
 
 from environments.cube3 import Cube3 as Cube3Environment
@@ -31,6 +31,9 @@ class Cube2(Cube3Environment):
     moves: List[str] = [x for x in MOVES_NAMES if x in FIXED_CUBIE_MOVES_NAMES_TO_INDICES]
     moves_rev: List[str] = [x for x in REVERSE_MOVES_NAMES if x in FIXED_CUBIE_MOVES_NAMES_TO_INDICES]
 
+    # only moves that undo the previous move are pruned
+    opposite_faces: Dict[str, str] = {}
+
     def __init__(self):
         super().__init__()
         self.dtype = np.uint8
@@ -39,6 +42,12 @@ class Cube2(Cube3Environment):
         # solved state
         self.goal_colors: np.ndarray = np.array(list(range(24)), dtype=self.dtype)
 
+    def get_cpp_env_name(self) -> Optional[str]:
+        """
+        The moves are not those of the C++ environment
+        """
+        return None
+
     def _move_np(self, states_np: np.ndarray, action_index: int):
         """
         Applies an action to a numpy array of cube states
@@ -51,6 +60,13 @@ class Cube2(Cube3Environment):
 
         return states_next_np, transition_costs
 
+    def _compute_symmetries(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Only the identity, the moves are not symmetric
+        """
+        return np.expand_dims(np.arange(len(MOVES_DEFINITIONS[0]), dtype=self.dtype), 0), \
+            np.expand_dims(np.arange(len(self.moves)), 0)
+
     def _compute_rotation_idxs(self, cube_len: int,
                                moves: List[str]) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
         """
@@ -1,4 +1,4 @@
-from typing import List, Dict, Tuple, Union
+from typing import List, Dict, Tuple, Union, Optional, Sequence
 import numpy as np
 from torch import nn
 from random import randrange
@@ -28,6 +28,9 @@ class Cube3(Environment):
     moves: List[str] = ["%s%i" % (f, n) for f in ['U', 'D', 'L', 'R', 'B', 'F'] for n in [-1, 1]]
     moves_rev: List[str] = ["%s%i" % (f, n) for f in ['U', 'D', 'L', 'R', 'B', 'F'] for n in [1, -1]]
 
+    # turns of opposite faces commute, so only the order with the first face first is kept
+    opposite_faces: Dict[str, str] = {'U': 'D', 'L': 'R', 'B': 'F'}
+
     def __init__(self):
         super().__init__()
         self.dtype = np.uint8
@@ -45,6 +48,12 @@ class Cube3(Environment):
 
         self.rotate_idxs_new, self.rotate_idxs_old = self._compute_rotation_idxs(self.cube_len, self.moves)
 
+        # moves pruned after each move
+        self.move_prune_table: np.ndarray = self._compute_move_prune_table()
+
+        # symmetries of the cube, computed on first use since only canonicalization needs them
+        self._symmetries: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = None
+
     def next_state(self, states: List[Cube3State], action: int) -> Tuple[List[Cube3State], List[float]]:
         states_np = np.stack([x.colors for x in states], axis=0)
         states_next_np, transition_costs = self._move_np(states_np, action)
@@ -75,8 +84,18 @@ class Cube3(Environment):
         return np.all(is_equal, axis=1)
 
     def state_to_nnet_input(self, states: List[Cube3State]) -> List[np.ndarray]:
-        states_np = np.stack([state.colors for state in states], axis=0)
+        return self.np_to_nnet_input(self.states_to_np(states))
+
+    def states_to_np(self, states: List[Cube3State]) -> np.ndarray:
+        return np.stack([state.colors for state in states], axis=0)
+
+    def np_to_states(self, states_np: np.ndarray) -> List[Cube3State]:
+        return [Cube3State(x) for x in list(states_np)]
 
+    def is_solved_np(self, states_np: np.ndarray) -> np.ndarray:
+        return np.all(states_np == np.expand_dims(self.goal_colors, 0), axis=1)
+
+    def np_to_nnet_input(self, states_np: np.ndarray) -> List[np.ndarray]:
         representation_np: np.ndarray = states_np / (self.cube_len ** 2)
         representation_np: np.ndarray = representation_np.astype(self.dtype)
 
@@ -93,6 +112,9 @@ class Cube3(Environment):
 
         return nnet
 
+    def get_cpp_env_name(self) -> Optional[str]:
+        return "cube3"
+
     def generate_states(self, num_states: int, backwards_range: Tuple[int, int]) -> Tuple[List[Cube3State], List[int]]:
         assert (num_states > 0)
         assert (backwards_range[0] >= 0)
@@ -126,12 +148,16 @@ class Cube3(Environment):
 
         return states, scramble_nums.tolist()
 
-    def expand(self, states: List[State]) -> Tuple[List[List[State]], List[np.ndarray]]:
+    def expand(self, states: List[State],
+               parent_moves: Optional[Sequence[int]] = None) -> Tuple[List[List[State]], List[np.ndarray]]:
         assert self.fixed_actions, "Environments without fixed actions must implement their own method"
+        if self.cpp_expand_name is not None:
+            return self._expand_cpp(states, parent_moves)
 
         # initialize
         num_states: int = len(states)
         num_env_moves: int = self.get_num_moves()
+        moves_allowed: np.ndarray = self.get_moves_allowed(num_states, parent_moves)
 
         states_exp: List[List[State]] = [[] for _ in range(len(states))]
 
@@ -144,22 +170,124 @@ class Cube3(Environment):
         move_idx: int
         move: int
         for move_idx in range(num_env_moves):
+            idxs: np.ndarray = np.where(moves_allowed[:, move_idx])[0]
+            if idxs.shape[0] == 0:
+                continue
+
             # next state
             states_next_np: np.ndarray
             tc_move: List[float]
-            states_next_np, tc_move = self._move_np(states_np, move_idx)
+            states_next_np, tc_move = self._move_np(states_np[idxs], move_idx)
 
             # transition cost
-            tc[:, move_idx] = np.array(tc_move)
+            tc[idxs, move_idx] = np.array(tc_move)
 
-            for idx in range(len(states)):
-                states_exp[idx].append(Cube3State(states_next_np[idx]))
+            for idx, state_next_np in zip(idxs, states_next_np):
+                states_exp[idx].append(Cube3State(state_next_np))
 
         # make lists
-        tc_l: List[np.ndarray] = [tc[i] for i in range(num_states)]
+        tc_l: List[np.ndarray] = [tc[i][moves_allowed[i]] for i in range(num_states)]
 
         return states_exp, tc_l
 
+    def expand_np(self, states_np: np.ndarray,
+                  parent_moves: Optional[Sequence[int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        if self.cpp_expand_name is not None:
+            return self._expand_np_cpp(states_np, parent_moves)
+
+        # initialize
+        num_states: int = states_np.shape[0]
+        num_env_moves: int = self.get_num_moves()
+        moves_allowed: np.ndarray = self.get_moves_allowed(num_states, parent_moves)
+
+        states_c_np: np.ndarray = np.empty((num_states, num_env_moves, states_np.shape[1]), dtype=states_np.dtype)
+        tc: np.ndarray = np.full([num_states, num_env_moves], np.inf)
+
+        # for each move, get next states and transition costs
+        for move_idx in range(num_env_moves):
+            idxs: np.ndarray = np.where(moves_allowed[:, move_idx])[0]
+            if idxs.shape[0] == 0:
+                continue
+
+            tc_move: List[float]
+            states_c_np[idxs, move_idx], tc_move = self._move_np(states_np[idxs], move_idx)
+
+            tc[idxs, move_idx] = np.array(tc_move)
+
+        return states_c_np, tc
+
+    def get_changed_idxs_np(self, states_np: np.ndarray) -> Optional[np.ndarray]:
+        # the stickers a move puts in a new place, the same for all states
+        changed_idxs: np.ndarray = np.stack([np.unique(self.rotate_idxs_new[move]) for move in self.moves])
+
+        return np.broadcast_to(changed_idxs, (states_np.shape[0],) + changed_idxs.shape)
+
+    def get_move_prune_table(self) -> np.ndarray:
+        return self.move_prune_table
+
+    @property
+    def sym_perms(self) -> np.ndarray:
+        """ Symmetries of the cube as sticker permutations, shape (num_syms, num_stickers) """
+        return self._get_symmetries()[0]
+
+    @property
+    def sym_move_maps(self) -> np.ndarray:
+        """ Move each move is mapped to by each symmetry, shape (num_syms, num_moves) """
+        return self._get_symmetries()[1]
+
+    @property
+    def sym_perms_inv(self) -> np.ndarray:
+        return self._get_symmetries()[2]
+
+    @property
+    def sym_idxs_inv(self) -> np.ndarray:
+        """ Index of the inverse of each symmetry """
+        return self._get_symmetries()[3]
+
+    def apply_symmetry_np(self, states_np: np.ndarray, sym_idxs: np.ndarray) -> np.ndarray:
+        """ Rotate/reflect states. Stickers are moved by the symmetry and relabeled with the sticker they are
+        mapped to, so the solved state is unchanged and distances to it are preserved. If state s is solved by
+        moves m_1, ..., m_n, then the state with symmetry g applied is solved by moves sym_move_maps[g, m_i].
+
+        @param states_np: Packed states
+        @param sym_idxs: Index of the symmetry applied to each state, sym_idxs_inv gives the inverse symmetry
+        @return: Packed states
+        """
+        perms: np.ndarray = self.sym_perms[sym_idxs]
+        states_sym_np: np.ndarray = np.take_along_axis(perms, states_np.astype(np.int64), axis=1)
+        states_sym_np = np.take_along_axis(states_sym_np, self.sym_perms_inv[sym_idxs], axis=1)
+
+        return states_sym_np.astype(states_np.dtype)
+
+    def canonicalize_np(self, states_np: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        num_states: int = states_np.shape[0]
+        num_syms: int = self.sym_perms.shape[0]
+        if (num_states == 0) or (num_syms == 1):
+            return states_np, np.zeros(num_states, dtype=np.int64)
+
+        # the canonical state is the lexicographically smallest symmetric state, with the first symmetry that gives it.
+        # Symmetries are compared one at a time against the smallest so far, so memory does not grow with num_syms.
+        states_canon_np: np.ndarray = self._apply_sym_np(states_np, 0)
+        sym_idxs: np.ndarray = np.zeros(num_states, dtype=np.int64)
+        for sym_idx in range(1, num_syms):
+            states_sym_np: np.ndarray = self._apply_sym_np(states_np, sym_idx)
+
+            # the first sticker at which they differ decides
+            is_diff: np.ndarray = states_sym_np != states_canon_np
+            first_diff: np.ndarray = np.argmax(is_diff, axis=1)
+            rows: np.ndarray = np.arange(num_states)
+            is_less: np.ndarray = is_diff[rows, first_diff] & (states_sym_np[rows, first_diff] <
+                                                               states_canon_np[rows, first_diff])
+
+            states_canon_np[is_less] = states_sym_np[is_less]
+            sym_idxs[is_less] = sym_idx
+
+        return states_canon_np, sym_idxs
+
+    def _apply_sym_np(self, states_np: np.ndarray, sym_idx: int) -> np.ndarray:
+        # the colors and the positions of the stickers are both permuted
+        return self.sym_perms[sym_idx][states_np][:, self.sym_perms_inv[sym_idx]]
+
     def _move_np(self, states_np: np.ndarray, action: int):
         action_str: str = self.moves[action]
 
@@ -170,6 +298,78 @@ class Cube3(Environment):
 
         return states_next_np, transition_costs
 
+    def _compute_move_prune_table(self) -> np.ndarray:
+        num_moves: int = len(self.moves)
+        prune_table: np.ndarray = np.zeros((num_moves, num_moves), dtype=bool)
+        for move_idx, (move, move_rev) in enumerate(zip(self.moves, self.moves_rev)):
+            for move_idx_next, move_next in enumerate(self.moves):
+                # undoes the previous move
+                if move_next == move_rev:
+                    prune_table[move_idx, move_idx_next] = True
+
+                # opposite faces turned in the other order
+                if self.opposite_faces.get(move_next[0]) == move[0]:
+                    prune_table[move_idx, move_idx_next] = True
+
+        return prune_table
+
+    def _get_symmetries(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        if self._symmetries is None:
+            sym_perms, sym_move_maps = self._compute_symmetries()
+            sym_perms_inv: np.ndarray = np.argsort(sym_perms, axis=1)
+            sym_idxs_inv: np.ndarray = np.array([np.where(np.all(sym_perms == perm_inv, axis=1))[0][0]
+                                                 for perm_inv in sym_perms_inv])
+            self._symmetries = (sym_perms, sym_move_maps, sym_perms_inv, sym_idxs_inv)
+
+        return self._symmetries
+
+    def _compute_symmetries(self) -> Tuple[np.ndarray, np.ndarray]:
+        """ The 48 symmetries of the cube (24 rotations, with and without a reflection) are the automorphisms of the
+        graph where stickers are connected if they are next to each other on a face or on the same cubie """
+        num_stickers: int = self.goal_colors.shape[0]
+        num_moves: int = len(self.moves)
+        face_shape: Tuple[int, int, int] = (6, self.cube_len, self.cube_len)
+
+        # stickers next to each other on a face
+        adj: np.ndarray = np.zeros((num_stickers, num_stickers), dtype=bool)
+        for face in range(6):
+            for row in range(self.cube_len):
+                for col in range(self.cube_len):
+                    idx: int = np.ravel_multi_index((face, row, col), face_shape)
+                    if row + 1 < self.cube_len:
+                        idx_next: int = np.ravel_multi_index((face, row + 1, col), face_shape)
+                        adj[idx, idx_next] = adj[idx_next, idx] = True
+                    if col + 1 < self.cube_len:
+                        idx_next: int = np.ravel_multi_index((face, row, col + 1), face_shape)
+                        adj[idx, idx_next] = adj[idx_next, idx] = True
+
+        # stickers on the same cubie are moved by the same moves
+        goal_np: np.ndarray = np.expand_dims(self.goal_colors, 0)
+        is_moved: np.ndarray = np.stack([self._move_np(goal_np, move_idx)[0][0] != self.goal_colors
+                                         for move_idx in range(num_moves)], axis=1)
+        same_cubie: np.ndarray = np.all(is_moved[:, None] == is_moved[None, :], axis=2)
+        same_cubie &= np.any(is_moved, axis=1)[:, None]
+        same_cubie &= np.not_equal.outer(np.arange(num_stickers) // (self.cube_len ** 2),
+                                         np.arange(num_stickers) // (self.cube_len ** 2))
+        adj |= same_cubie
+
+        sym_perms: np.ndarray = _get_automorphisms(adj).astype(self.dtype)
+
+        # map each move to the move that has the same effect on symmetric states
+        sym_perms_inv: np.ndarray = np.argsort(sym_perms, axis=1)
+        states_moved_np: np.ndarray = np.concatenate([self._move_np(goal_np, move_idx)[0]
+                                                      for move_idx in range(num_moves)], axis=0)
+        sym_move_maps: np.ndarray = np.zeros((sym_perms.shape[0], num_moves), dtype=np.int64)
+        for move_idx in range(num_moves):
+            states_sym_np: np.ndarray = sym_perms[:, states_moved_np[move_idx]]
+            states_sym_np = np.take_along_axis(states_sym_np, sym_perms_inv, axis=1)
+
+            is_match: np.ndarray = np.all(states_sym_np[:, None, :] == states_moved_np[None, :, :], axis=2)
+            assert np.all(np.sum(is_match, axis=1) == 1), "Symmetry does not map moves to moves"
+            sym_move_maps[:, move_idx] = np.argmax(is_match, axis=1)
+
+        return sym_perms, sym_move_maps
+
     def _get_adj(self) -> None:
         # WHITE:0, YELLOW:1, BLUE:2, GREEN:3, ORANGE: 4, RED: 5
         self.adj_faces: Dict[int, np.ndarray] = {0: np.array([2, 5, 3, 4]),
@@ -254,3 +454,54 @@ class Cube3(Environment):
                     rotate_idxs_old[move] = np.concatenate((rotate_idxs_old[move], [flat_idx_old]))
 
         return rotate_idxs_new, rotate_idxs_old
+
+
+def _get_automorphisms(adj: np.ndarray) -> np.ndarray:
+    """ All permutations of the nodes of a connected graph that map edges to edges, found with backtracking
+
+    @param adj: Boolean adjacency matrix
+    @return: Array of shape (num_automorphisms, num_nodes), row i maps node j to node [i, j]
+    """
+    num_nodes: int = adj.shape[0]
+    degrees: np.ndarray = np.sum(adj, axis=1)
+
+    # assign nodes in breadth-first order, so each node is next to an assigned node
+    order: List[int] = [0]
+    parents: np.ndarray = -np.ones(num_nodes, dtype=np.int64)
+    for node in order:
+        for node_next in np.where(adj[node])[0]:
+            if (node_next not in order) and (parents[node_next] < 0):
+                parents[node_next] = node
+                order.append(int(node_next))
+
+    perms: List[np.ndarray] = []
+    perm: np.ndarray = -np.ones(num_nodes, dtype=np.int64)
+    is_used: np.ndarray = np.zeros(num_nodes, dtype=bool)
+
+    def assign(pos: int):
+        if pos == num_nodes:
+            perms.append(perm.copy())
+            return
+
+        node: int = order[pos]
+        nodes_assigned: List[int] = order[:pos]
+        if pos == 0:
+            candidates: np.ndarray = np.arange(num_nodes)
+        else:
+            candidates: np.ndarray = np.where(adj[perm[parents[node]]])[0]
+
+        for candidate in candidates:
+            if is_used[candidate] or (degrees[candidate] != degrees[node]):
+                continue
+            if not np.array_equal(adj[node, nodes_assigned], adj[candidate, perm[nodes_assigned]]):
+                continue
+
+            perm[node] = candidate
+            is_used[candidate] = True
+            assign(pos + 1)
+            is_used[candidate] = False
+            perm[node] = -1
+
+    assign(0)
+
+    return np.stack(perms, axis=0)
@@ -1,7 +1,7 @@
 import os
 import numpy as np
 from pathlib import Path
-from typing import List, Dict, Tuple, Any
+from typing import List, Dict, Tuple, Any, Optional
 from environments.loggers import getLogger
 from environments.cube3 import Cube3State, Cube3 as Cube3Environment
 
@@ -42,6 +42,9 @@ class Cube3SolvedCorners(Cube3Environment):
     moves: List[str] = [x for x in MOVES_NAMES if x in FIXED_CUBIE_MOVES_NAMES_TO_INDICES]
     moves_rev: List[str] = [x for x in REVERSE_MOVES_NAMES if x in FIXED_CUBIE_MOVES_NAMES_TO_INDICES]
 
+    # only moves that undo the previous move are pruned
+    opposite_faces: Dict[str, str] = {}
+
     def __init__(self):
         super().__init__()
         self.dtype = np.uint8
@@ -50,6 +53,12 @@ class Cube3SolvedCorners(Cube3Environment):
         # solved state
         self.goal_colors: np.ndarray = np.array(list(range(54)), dtype=self.dtype)
 
+    def get_cpp_env_name(self) -> Optional[str]:
+        """
+        The moves are not those of the C++ environment
+        """
+        return None
+
     def generate_states(self, num_states: int, backwards_range: Tuple[int, int]) -> Tuple[List[Cube3State], List[int]]:
         """
         Generates 3-cube states with corner cubies placed correctly.
@@ -105,6 +114,13 @@ class Cube3SolvedCorners(Cube3Environment):
 
         return states_next_np, transition_costs
 
+    def _compute_symmetries(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Only the identity, the moves are not symmetric
+        """
+        return np.expand_dims(np.arange(len(MOVES_DEFINITIONS[0]), dtype=self.dtype), 0), \
+            np.expand_dims(np.arange(len(self.moves)), 0)
+
     def _compute_rotation_idxs(self, cube_len: int,
                                moves: List[str]) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
         """
@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 import numpy as np
-from typing import List, Tuple
+from typing import List, Tuple, Optional, Sequence
 from random import randrange
 import torch.nn as nn
 
@@ -19,6 +19,7 @@ class Environment(ABC):
     def __init__(self):
         self.dtype = np.float
         self.fixed_actions: bool = True
+        self.cpp_expand_name: Optional[str] = None
 
     @abstractmethod
     def next_state(self, states: List[State], action: int) -> Tuple[List[State], List[float]]:
@@ -124,17 +125,24 @@ class Environment(ABC):
 
         return states, scramble_nums.tolist()
 
-    def expand(self, states: List[State]) -> Tuple[List[List[State]], List[np.ndarray]]:
+    def expand(self, states: List[State],
+               parent_moves: Optional[Sequence[int]] = None) -> Tuple[List[List[State]], List[np.ndarray]]:
         """ Generate all children for the state
 
         @param states: List of states
-        @return: Children of each state, Transition costs for each state
+        @param parent_moves: Move that generated each state, -1 if none. If given, children pruned by
+        get_move_prune_table are not generated.
+        @return: Children of each state, Transition costs for each state. The children of a state are in the order of
+        the moves that are True in get_moves_allowed.
         """
         assert self.fixed_actions, "Environments without fixed actions must implement their own method"
+        if self.cpp_expand_name is not None:
+            return self._expand_cpp(states, parent_moves)
 
         # initialize
         num_states: int = len(states)
         num_env_moves: int = self.get_num_moves()
+        moves_allowed: np.ndarray = self.get_moves_allowed(num_states, parent_moves)
 
         states_exp: List[List[State]] = []
         for _ in range(len(states)):
@@ -146,18 +154,191 @@ class Environment(ABC):
         move_idx: int
         move: int
         for move_idx in range(num_env_moves):
+            idxs: np.ndarray = np.where(moves_allowed[:, move_idx])[0]
+            if idxs.shape[0] == 0:
+                continue
+
             # next state
             states_next_move: List[State]
             tc_move: List[float]
-            states_next_move, tc_move = self.next_state(states, move_idx)
+            states_next_move, tc_move = self.next_state([states[idx] for idx in idxs], move_idx)
 
             # transition cost
-            tc[:, move_idx] = np.array(tc_move)
+            tc[idxs, move_idx] = np.array(tc_move)
 
-            for idx in range(len(states)):
-                states_exp[idx].append(states_next_move[idx])
+            for idx, state_moved in zip(idxs, states_next_move):
+                states_exp[idx].append(state_moved)
 
         # make lists
-        tc_l: List[np.ndarray] = [tc[i] for i in range(num_states)]
+        tc_l: List[np.ndarray] = [tc[i][moves_allowed[i]] for i in range(num_states)]
+
+        return states_exp, tc_l
+
+    def get_move_prune_table(self) -> Optional[np.ndarray]:
+        """ Moves that do not have to be applied right after a given move because the child can also be reached
+        with a path that is not longer, for example a move that undoes the previous one.
+
+        @return: Boolean numpy array of shape (num_moves, num_moves), element [i, j] is True if move j is pruned
+        after move i. None if no moves are pruned.
+        """
+        return None
+
+    def get_moves_allowed(self, num_states: int, parent_moves: Optional[Sequence[int]] = None) -> np.ndarray:
+        """ Moves that are not pruned after the move that generated each state
+
+        @param num_states: Number of states
+        @param parent_moves: Move that generated each state, -1 if none. If None, no moves are pruned.
+        @return: Boolean numpy array of shape (num_states, num_moves)
+        """
+        moves_allowed: np.ndarray = np.ones((num_states, self.get_num_moves()), dtype=bool)
+
+        prune_table: Optional[np.ndarray] = self.get_move_prune_table()
+        if (parent_moves is None) or (prune_table is None):
+            return moves_allowed
+
+        parent_moves = np.asarray(parent_moves, dtype=np.int64)
+        has_parent: np.ndarray = parent_moves >= 0
+        moves_allowed[has_parent] = np.logical_not(prune_table[parent_moves[has_parent]])
+
+        return moves_allowed
+
+    def states_to_np(self, states: List[State]) -> np.ndarray:
+        """ Pack states into a numpy array. Used by the search code to store states in arrays instead of State
+        objects and to find repeated states. Environments that do not implement it cannot be used with that code.
+
+        @param states: List of states
+        @return: Array where the element at index i along the first dimension is the packed representation of the
+        state at index i
+        """
+        raise NotImplementedError("%s does not implement states_to_np, which is needed to pack states into arrays"
+                                  % type(self).__name__)
+
+    def np_to_states(self, states_np: np.ndarray) -> List[State]:
+        """ Unpack states from a numpy array made with states_to_np
+
+        @param states_np: Packed states
+        @return: List of states
+        """
+        raise NotImplementedError("%s does not implement np_to_states, which is needed to unpack states from arrays"
+                                  % type(self).__name__)
+
+    def is_solved_np(self, states_np: np.ndarray) -> np.ndarray:
+        """ Same as is_solved, but for packed states
+
+        @param states_np: Packed states
+        @return: Boolean numpy array
+        """
+        return self.is_solved(self.np_to_states(states_np))
+
+    def np_to_nnet_input(self, states_np: np.ndarray) -> List[np.ndarray]:
+        """ Same as state_to_nnet_input, but for packed states
+
+        @param states_np: Packed states
+        @return: List of numpy arrays
+        """
+        return self.state_to_nnet_input(self.np_to_states(states_np))
+
+    def get_changed_idxs_np(self, states_np: np.ndarray) -> Optional[np.ndarray]:
+        """ Positions of the nnet input at which each child of expand_np can differ from its parent, so that its
+        nnet input can be computed from that of its parent (see ResnetModel.forward_children). Each position that
+        changes is given once. Rows are padded with -1.
+
+        @param states_np: Packed states
+        @return: Positions with shape (num_states, num_moves, num_positions), None if the environment does not give
+        them
+        """
+        return None
+
+    def canonicalize_np(self, states_np: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """ Map states to a canonical representative of the states that are symmetric to them. Symmetric states
+        have the same distance to the goal, so search can treat them as the same state. Environments without
+        symmetries return the states unchanged.
+
+        @param states_np: Packed states
+        @return: Packed canonical states, index of the symmetry that maps each state to its canonical state
+        """
+        return states_np, np.zeros(states_np.shape[0], dtype=np.int64)
+
+    def expand_np(self, states_np: np.ndarray,
+                  parent_moves: Optional[Sequence[int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """ Same as expand, but for packed states
+
+        @param states_np: Packed states
+        @param parent_moves: Move that generated each state, -1 if none. If given, children pruned by
+        get_move_prune_table are not generated. Their packed state is unspecified and their transition cost is inf,
+        they can be removed with get_moves_allowed.
+        @return: Packed children with shape (num_states, num_moves, ...), transition costs with shape
+        (num_states, num_moves)
+        """
+        if self.cpp_expand_name is not None:
+            return self._expand_np_cpp(states_np, parent_moves)
+
+        num_states: int = states_np.shape[0]
+        moves_allowed: np.ndarray = self.get_moves_allowed(num_states, parent_moves)
+        states_exp, tc_l = self.expand(self.np_to_states(states_np), parent_moves)
+
+        states_c_np: np.ndarray = np.empty((num_states, self.get_num_moves()) + states_np.shape[1:],
+                                           dtype=states_np.dtype)
+        tc: np.ndarray = np.full(moves_allowed.shape, np.inf)
+        for idx, (states_c, tc_c) in enumerate(zip(states_exp, tc_l)):
+            if len(states_c) > 0:
+                states_c_np[idx, moves_allowed[idx]] = self.states_to_np(states_c)
+                tc[idx, moves_allowed[idx]] = tc_c
+
+        return states_c_np, tc
+
+    def get_cpp_env_name(self) -> Optional[str]:
+        """ Name of the same environment in cpp/environments.cpp, whose states are the packed states of this
+        environment and whose actions are the moves of this environment, in the same order
+
+        @return: Name of the C++ environment, None if there is none
+        """
+        return None
+
+    def use_cpp_expand(self, use: bool = True) -> bool:
+        """ Opt in to expanding states with the C++ environment (cpp/libweighted_astar.so) in expand and expand_np,
+        and so in search_utils.bellman. The setting is kept when the environment is pickled.
+
+        @param use: True to use the C++ environment, False to use this one
+        @return: True if the C++ environment is used. False if not asked for, if there is no C++ environment, or if
+        the library is not built.
+        """
+        from search_methods import astar_cpp
+
+        self.cpp_expand_name = None
+        if use and (self.get_cpp_env_name() is not None) and astar_cpp.lib_available():
+            self.cpp_expand_name = self.get_cpp_env_name()
+
+        return self.cpp_expand_name is not None
+
+    def _expand_cpp(self, states: List[State],
+                    parent_moves: Optional[Sequence[int]]) -> Tuple[List[List[State]], List[np.ndarray]]:
+        num_states: int = len(states)
+        if num_states == 0:
+            return [], []
+
+        moves_allowed: np.ndarray = self.get_moves_allowed(num_states, parent_moves)
+        states_c_np, tc = self._expand_np_cpp(self.states_to_np(states), parent_moves)
+
+        # children of all states at once, in the order of the states and then the moves
+        states_c: List[State] = self.np_to_states(states_c_np[moves_allowed])
+        split_idxs: List[int] = list(np.cumsum(np.sum(moves_allowed, axis=1))[:-1])
+
+        states_exp: List[List[State]] = []
+        start_idx: int = 0
+        for end_idx in split_idxs + [len(states_c)]:
+            states_exp.append(states_c[start_idx:end_idx])
+            start_idx = end_idx
+
+        tc_l: List[np.ndarray] = [tc[i][moves_allowed[i]] for i in range(num_states)]
 
         return states_exp, tc_l
+
+    def _expand_np_cpp(self, states_np: np.ndarray,
+                       parent_moves: Optional[Sequence[int]]) -> Tuple[np.ndarray, np.ndarray]:
+        from search_methods import astar_cpp
+
+        states_c_np, tc, _ = astar_cpp.expand_batch(self.cpp_expand_name, states_np)
+        tc[np.logical_not(self.get_moves_allowed(states_np.shape[0], parent_moves))] = np.inf
+
+        return states_c_np.astype(states_np.dtype, copy=False), tc
@@ -1,4 +1,4 @@
-from typing import List, Tuple, Union
+from typing import List, Tuple, Union, Optional, Sequence
 import numpy as np
 from torch import nn
 
@@ -42,6 +42,13 @@ class LightsOut(Environment):
 
             self.move_matrix[move] = [move, right, left, up, down]
 
+        # lights toggled by each move, once each. A light at the edge is its own missing neighbor in move_matrix.
+        self.move_changed_idxs: np.ndarray = self.move_matrix.copy()
+        self.move_changed_idxs[:, 1:][self.move_changed_idxs[:, 1:] == self.move_changed_idxs[:, :1]] = -1
+
+        # moves pruned after each move: pressing the same light again
+        self.move_prune_table: np.ndarray = np.eye(self.num_tiles, dtype=bool)
+
     def next_state(self, states: List[LOState], action: int) -> Tuple[List[LOState], List[float]]:
         states_np = np.stack([x.tiles for x in states], axis=0)
         states_next_np, transition_costs = self._move_np(states_np, [action] * states_np.shape[0])
@@ -68,9 +75,19 @@ class LightsOut(Environment):
         return np.all(states_np == 0, axis=1)
 
     def state_to_nnet_input(self, states: List[LOState]) -> List[np.ndarray]:
-        states_np = np.stack([state.tiles for state in states], axis=0).astype(self.dtype)
+        return self.np_to_nnet_input(self.states_to_np(states))
+
+    def states_to_np(self, states: List[LOState]) -> np.ndarray:
+        return np.stack([state.tiles for state in states], axis=0)
+
+    def np_to_states(self, states_np: np.ndarray) -> List[LOState]:
+        return [LOState(x) for x in list(states_np)]
+
+    def is_solved_np(self, states_np: np.ndarray) -> np.ndarray:
+        return np.all(states_np == 0, axis=1)
 
-        representation: List[np.ndarray] = [states_np]
+    def np_to_nnet_input(self, states_np: np.ndarray) -> List[np.ndarray]:
+        representation: List[np.ndarray] = [states_np.astype(self.dtype)]
 
         return representation
 
@@ -82,6 +99,12 @@ class LightsOut(Environment):
 
         return nnet
 
+    def get_cpp_env_name(self) -> Optional[str]:
+        if self.dim == 7:
+            return "lightsout%i" % self.dim
+
+        return None
+
     def generate_states(self, num_states: int, backwards_range: Tuple[int, int]) -> Tuple[List[LOState], List[int]]:
         assert (num_states > 0)
         assert (backwards_range[0] >= 0)
@@ -118,12 +141,16 @@ class LightsOut(Environment):
 
         return states, scramble_nums.tolist()
 
-    def expand(self, states: List[State]) -> Tuple[List[List[State]], List[np.ndarray]]:
+    def expand(self, states: List[State],
+               parent_moves: Optional[Sequence[int]] = None) -> Tuple[List[List[State]], List[np.ndarray]]:
         assert self.fixed_actions, "Environments without fixed actions must implement their own method"
+        if self.cpp_expand_name is not None:
+            return self._expand_cpp(states, parent_moves)
 
         # initialize
         num_states: int = len(states)
         num_env_moves: int = self.get_num_moves()
+        moves_allowed: np.ndarray = self.get_moves_allowed(num_states, parent_moves)
 
         states_exp: List[List[State]] = [[] for _ in range(len(states))]
 
@@ -136,22 +163,58 @@ class LightsOut(Environment):
         move_idx: int
         move: int
         for move_idx in range(num_env_moves):
+            idxs: np.ndarray = np.where(moves_allowed[:, move_idx])[0]
+            if idxs.shape[0] == 0:
+                continue
+
             # next state
             states_next_np: np.ndarray
             tc_move: List[float]
-            states_next_np, tc_move = self._move_np(states_np, [move_idx] * states_np.shape[0])
+            states_next_np, tc_move = self._move_np(states_np[idxs], [move_idx] * idxs.shape[0])
 
             # transition cost
-            tc[:, move_idx] = np.array(tc_move)
+            tc[idxs, move_idx] = np.array(tc_move)
 
-            for idx in range(len(states)):
-                states_exp[idx].append(LOState(states_next_np[idx]))
+            for idx, state_next_np in zip(idxs, states_next_np):
+                states_exp[idx].append(LOState(state_next_np))
 
         # make lists
-        tc_l: List[np.ndarray] = [tc[i] for i in range(num_states)]
+        tc_l: List[np.ndarray] = [tc[i][moves_allowed[i]] for i in range(num_states)]
 
         return states_exp, tc_l
 
+    def expand_np(self, states_np: np.ndarray,
+                  parent_moves: Optional[Sequence[int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        if self.cpp_expand_name is not None:
+            return self._expand_np_cpp(states_np, parent_moves)
+
+        # initialize
+        num_states: int = states_np.shape[0]
+        num_env_moves: int = self.get_num_moves()
+        moves_allowed: np.ndarray = self.get_moves_allowed(num_states, parent_moves)
+
+        states_c_np: np.ndarray = np.empty((num_states, num_env_moves, states_np.shape[1]), dtype=states_np.dtype)
+        tc: np.ndarray = np.full([num_states, num_env_moves], np.inf)
+
+        # for each move, get next states and transition costs
+        for move_idx in range(num_env_moves):
+            idxs: np.ndarray = np.where(moves_allowed[:, move_idx])[0]
+            if idxs.shape[0] == 0:
+                continue
+
+            tc_move: List[float]
+            states_c_np[idxs, move_idx], tc_move = self._move_np(states_np[idxs], [move_idx] * idxs.shape[0])
+
+            tc[idxs, move_idx] = np.array(tc_move)
+
+        return states_c_np, tc
+
+    def get_changed_idxs_np(self, states_np: np.ndarray) -> Optional[np.ndarray]:
+        return np.broadcast_to(self.move_changed_idxs, (states_np.shape[0],) + self.move_changed_idxs.shape)
+
+    def get_move_prune_table(self) -> np.ndarray:
+        return self.move_prune_table
+
     def _move_np(self, states_np: np.ndarray, actions: List[int]):
         states_next_np: np.ndarray = states_np.copy()
 
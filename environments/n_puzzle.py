@@ -1,4 +1,4 @@
-from typing import List, Tuple, Union
+from typing import List, Tuple, Union, Optional, Sequence
 import numpy as np
 import torch.nn as nn
 
@@ -43,6 +43,10 @@ class NPuzzle(Environment):
         # Next state ops
         self.swap_zero_idxs: np.ndarray = self._get_swap_zero_idxs(self.dim)
 
+        # moves pruned after each move: moving the blank back
+        self.move_prune_table: np.ndarray = np.array([[move_next == move_rev for move_next in self.moves]
+                                                      for move_rev in self.moves_rev])
+
     def next_state(self, states: List[NPuzzleState], action: int) -> Tuple[List[NPuzzleState], List[float]]:
         # initialize
         states_np = np.stack([x.tiles for x in states], axis=0)
@@ -82,8 +86,18 @@ class NPuzzle(Environment):
         return np.all(is_equal, axis=1)
 
     def state_to_nnet_input(self, states: List[NPuzzleState]) -> List[np.ndarray]:
-        states_np = np.stack([x.tiles for x in states], axis=0)
+        return self.np_to_nnet_input(self.states_to_np(states))
+
+    def states_to_np(self, states: List[NPuzzleState]) -> np.ndarray:
+        return np.stack([x.tiles for x in states], axis=0)
+
+    def np_to_states(self, states_np: np.ndarray) -> List[NPuzzleState]:
+        return [NPuzzleState(x) for x in list(states_np)]
 
+    def is_solved_np(self, states_np: np.ndarray) -> np.ndarray:
+        return np.all(states_np == np.expand_dims(self.goal_tiles, 0), axis=1)
+
+    def np_to_nnet_input(self, states_np: np.ndarray) -> List[np.ndarray]:
         representation = [states_np.astype(self.dtype)]
 
         return representation
@@ -93,10 +107,17 @@ class NPuzzle(Environment):
 
     def get_nnet_model(self) -> nn.Module:
         state_dim: int = self.dim * self.dim
-        nnet = ResnetModel(state_dim, self.dim ** 2, 5000, 1000, 4, 1, True)
+        # gathering fc1 weight columns is only faster than a one-hot input from puzzle24 up
+        nnet = ResnetModel(state_dim, self.dim ** 2, 5000, 1000, 4, 1, True, gather_input=(self.dim >= 5))
 
         return nnet
 
+    def get_cpp_env_name(self) -> Optional[str]:
+        if self.dim in [4, 5, 6, 7]:
+            return "puzzle%i" % (self.dim ** 2 - 1)
+
+        return None
+
     def generate_states(self, num_states: int, backwards_range: Tuple[int, int]) -> Tuple[List[NPuzzleState],
                                                                                           List[int]]:
         assert (num_states > 0)
@@ -133,12 +154,16 @@ class NPuzzle(Environment):
 
         return states, scramble_nums.tolist()
 
-    def expand(self, states: List[State]) -> Tuple[List[List[State]], List[np.ndarray]]:
+    def expand(self, states: List[State],
+               parent_moves: Optional[Sequence[int]] = None) -> Tuple[List[List[State]], List[np.ndarray]]:
         assert self.fixed_actions, "Environments without fixed actions must implement their own method"
+        if self.cpp_expand_name is not None:
+            return self._expand_cpp(states, parent_moves)
 
         # initialize
         num_states: int = len(states)
         num_env_moves: int = self.get_num_moves()
+        moves_allowed: np.ndarray = self.get_moves_allowed(num_states, parent_moves)
 
         states_exp: List[List[State]] = [[] for _ in range(len(states))]
 
@@ -155,22 +180,70 @@ class NPuzzle(Environment):
         move_idx: int
         move: int
         for move_idx in range(num_env_moves):
+            idxs: np.ndarray = np.where(moves_allowed[:, move_idx])[0]
+            if idxs.shape[0] == 0:
+                continue
+
             # next state
             states_next_np: np.ndarray
             tc_move: List[float]
-            states_next_np, _, tc_move = self._move_np(states_np, z_idxs, move_idx)
+            states_next_np, _, tc_move = self._move_np(states_np[idxs], z_idxs[idxs], move_idx)
 
             # transition cost
-            tc[:, move_idx] = np.array(tc_move)
+            tc[idxs, move_idx] = np.array(tc_move)
 
-            for idx in range(len(states)):
-                states_exp[idx].append(NPuzzleState(states_next_np[idx]))
+            for idx, state_next_np in zip(idxs, states_next_np):
+                states_exp[idx].append(NPuzzleState(state_next_np))
 
         # make lists
-        tc_l: List[np.ndarray] = [tc[i] for i in range(num_states)]
+        tc_l: List[np.ndarray] = [tc[i][moves_allowed[i]] for i in range(num_states)]
 
         return states_exp, tc_l
 
+    def expand_np(self, states_np: np.ndarray,
+                  parent_moves: Optional[Sequence[int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        if self.cpp_expand_name is not None:
+            return self._expand_np_cpp(states_np, parent_moves)
+
+        # initialize
+        num_states: int = states_np.shape[0]
+        num_env_moves: int = self.get_num_moves()
+        moves_allowed: np.ndarray = self.get_moves_allowed(num_states, parent_moves)
+
+        states_c_np: np.ndarray = np.empty((num_states, num_env_moves, states_np.shape[1]), dtype=states_np.dtype)
+        tc: np.ndarray = np.full([num_states, num_env_moves], np.inf)
+
+        # Get z_idxs
+        z_idxs: np.ndarray
+        _, z_idxs = np.where(states_np == 0)
+
+        # for each move, get next states and transition costs
+        for move_idx in range(num_env_moves):
+            idxs: np.ndarray = np.where(moves_allowed[:, move_idx])[0]
+            if idxs.shape[0] == 0:
+                continue
+
+            tc_move: List[float]
+            states_c_np[idxs, move_idx], _, tc_move = self._move_np(states_np[idxs], z_idxs[idxs], move_idx)
+
+            tc[idxs, move_idx] = np.array(tc_move)
+
+        return states_c_np, tc
+
+    def get_changed_idxs_np(self, states_np: np.ndarray) -> Optional[np.ndarray]:
+        # the blank and the tile it is swapped with, none for moves that cannot be made
+        z_idxs: np.ndarray = np.argmax(states_np == 0, axis=1)
+        swap_z_idxs: np.ndarray = self.swap_zero_idxs[z_idxs].astype(np.int64)
+        z_idxs_moves: np.ndarray = np.broadcast_to(z_idxs[:, np.newaxis], swap_z_idxs.shape)
+
+        changed_idxs: np.ndarray = np.stack((z_idxs_moves, swap_z_idxs), axis=2)
+        changed_idxs[swap_z_idxs == z_idxs_moves] = -1
+
+        return changed_idxs
+
+    def get_move_prune_table(self) -> np.ndarray:
+        return self.move_prune_table
+
     def _get_swap_zero_idxs(self, n: int) -> np.ndarray:
         swap_zero_idxs: np.ndarray = np.zeros((n ** 2, len(NPuzzle.moves)), dtype=self.dtype)
         for moveIdx, move in enumerate(NPuzzle.moves):
@@ -1,13 +1,22 @@
-from typing import List, Tuple, Dict, Callable, Optional, Any
+from typing import List, Tuple, Dict, Callable, Optional, Any, Sequence
 from environments.environment_abstract import Environment, State
 import numpy as np
-from heapq import heappush, heappop
 from subprocess import Popen, PIPE
+from concurrent.futures import ThreadPoolExecutor, Future
 
 from argparse import ArgumentParser
 import torch
 from utils import env_utils, nnet_utils, search_utils, misc_utils, data_utils
+from search_methods import astar_array
+from search_methods.astar_array import ArrayAStar
+from search_methods.closed_set import FingerprintTable, unique_states
+from search_methods.open_set import get_open_set
+from search_methods.heuristic_cache import HeuristicCache
+from search_methods.cpp_transport import CppTransport
+from utils.shm_utils import get_shm_name
+from search_methods import astar_cpp
 import pickle
+import json
 import time
 import sys
 import os
@@ -29,8 +38,9 @@ class Node:
         self.parent_move: Optional[int] = parent_move
         self.parent: Optional[Node] = parent
 
-        self.transition_costs: List[float] = []
-        self.children: List[Node] = []
+        # only set when children are kept for Bellman backups, see AStar
+        self.transition_costs: Sequence[float] = ()
+        self.children: Sequence[Node] = ()
 
         self.bellman: float = np.inf
 
@@ -44,48 +54,44 @@ class Node:
                 self.bellman = min(self.bellman, tc + node_c.heuristic)
 
 
-OpenSetElem = Tuple[float, int, Node]
-
-
 class Instance:
 
-    def __init__(self, root_node: Node):
-        self.open_set: List[OpenSetElem] = []
-        self.heappush_count: int = 0
-        self.closed_dict: Dict[State, float] = dict()
+    def __init__(self, root_node: Node, open_set: str = "heap", lean: bool = False, canonicalize: bool = False):
+        self.open_set = get_open_set(open_set)
+        self.lean: bool = lean
+        self.canonicalize: bool = canonicalize
+        self.closed_set: FingerprintTable = FingerprintTable()
         self.popped_nodes: List[Node] = []
         self.goal_nodes: List[Node] = []
         self.num_nodes_generated: int = 0
+        self.num_nodes_evaluated: int = 0
 
         self.root_node: Node = root_node
 
         self.push_to_open([self.root_node])
 
     def push_to_open(self, nodes: List[Node]):
-        for node in nodes:
-            heappush(self.open_set, (node.cost, self.heappush_count, node))
-            self.heappush_count += 1
+        self.open_set.push([node.cost for node in nodes], nodes)
 
     def pop_from_open(self, num_nodes: int) -> List[Node]:
-        num_to_pop: int = min(num_nodes, len(self.open_set))
-
-        popped_nodes = [heappop(self.open_set)[2] for _ in range(num_to_pop)]
+        popped_nodes: List[Node] = self.open_set.pop(num_nodes)
         self.goal_nodes.extend([node for node in popped_nodes if node.is_solved])
-        self.popped_nodes.extend(popped_nodes)
+        if not self.lean:
+            self.popped_nodes.extend(popped_nodes)
 
         return popped_nodes
 
-    def remove_in_closed(self, nodes: List[Node]) -> List[Node]:
-        nodes_not_in_closed: List[Node] = []
+    def remove_in_closed(self, nodes: List[Node], env: Environment) -> List[Node]:
+        if len(nodes) == 0:
+            return nodes
 
-        for node in nodes:
-            path_cost_prev: Optional[float] = self.closed_dict.get(node.state)
-            if path_cost_prev is None:
-                nodes_not_in_closed.append(node)
-                self.closed_dict[node.state] = node.path_cost
-            elif path_cost_prev > node.path_cost:
-                nodes_not_in_closed.append(node)
-                self.closed_dict[node.state] = node.path_cost
+        states_np: np.ndarray = env.states_to_np([node.state for node in nodes])
+        if self.canonicalize:
+            states_np, _ = env.canonicalize_np(states_np)
+        path_costs: np.ndarray = np.array([node.path_cost for node in nodes])
+        keep: np.ndarray = self.closed_set.insert_or_improve(states_np, path_costs)
+
+        nodes_not_in_closed: List[Node] = [node for node, keep_node in zip(nodes, keep) if keep_node]
 
         return nodes_not_in_closed
 
@@ -96,7 +102,8 @@ def pop_from_open(instances: List[Instance], batch_size: int) -> List[List[Node]
     return popped_nodes_all
 
 
-def expand_nodes(instances: List[Instance], popped_nodes_all: List[List[Node]], env: Environment):
+def expand_nodes(instances: List[Instance], popped_nodes_all: List[List[Node]], env: Environment,
+                 lean: bool = False, prune_moves: bool = False):
     # Get children of all nodes at once (for speed)
     popped_nodes_flat: List[Node]
     split_idxs: List[int]
@@ -110,9 +117,16 @@ def expand_nodes(instances: List[Instance], popped_nodes_all: List[List[Node]],
     states_c_by_node: List[List[State]]
     tcs_np: List[np.ndarray]
 
-    states_c_by_node, tcs_np = env.expand(states)
+    # moves that are pruned after the move that generated the node are not applied
+    parent_moves: Optional[List[int]] = None
+    if prune_moves:
+        parent_moves = [-1 if node.parent_move is None else node.parent_move for node in popped_nodes_flat]
+    moves_allowed: np.ndarray = env.get_moves_allowed(len(states), parent_moves)
+
+    states_c_by_node, tcs_np = env.expand(states, parent_moves)
 
     tcs_by_node: List[List[float]] = [list(x) for x in tcs_np]
+    moves_c_by_node: List[List[int]] = [np.where(x)[0].tolist() for x in moves_allowed]
 
     # Get is_solved on all states at once (for speed)
     states_c: List[State]
@@ -122,8 +136,8 @@ def expand_nodes(instances: List[Instance], popped_nodes_all: List[List[Node]],
     is_solved_c_by_node: List[List[bool]] = misc_utils.unflatten(is_solved_c, split_idxs_c)
 
     # Update path costs for all states at once (for speed)
-    parent_path_costs = np.expand_dims(np.array([node.path_cost for node in popped_nodes_flat]), 1)
-    path_costs_c: List[float] = (parent_path_costs + np.array(tcs_by_node)).flatten().tolist()
+    path_costs_c: List[float] = np.concatenate([node.path_cost + tcs_node for node, tcs_node in
+                                                zip(popped_nodes_flat, tcs_np)]).tolist()
 
     path_costs_c_by_node: List[List[float]] = misc_utils.unflatten(path_costs_c, split_idxs_c)
 
@@ -132,6 +146,7 @@ def expand_nodes(instances: List[Instance], popped_nodes_all: List[List[Node]],
     patch_costs_c_by_inst_node: List[List[List[float]]] = misc_utils.unflatten(path_costs_c_by_node,
                                                                                split_idxs)
     states_c_by_inst_node: List[List[List[State]]] = misc_utils.unflatten(states_c_by_node, split_idxs)
+    moves_c_by_inst_node: List[List[List[int]]] = misc_utils.unflatten(moves_c_by_node, split_idxs)
     is_solved_c_by_inst_node: List[List[List[bool]]] = misc_utils.unflatten(is_solved_c_by_node, split_idxs)
 
     # Get child nodes
@@ -143,6 +158,7 @@ def expand_nodes(instances: List[Instance], popped_nodes_all: List[List[Node]],
         tcs_by_node: List[List[float]] = tcs_by_inst_node[inst_idx]
         path_costs_c_by_node: List[List[float]] = patch_costs_c_by_inst_node[inst_idx]
         states_c_by_node: List[List[State]] = states_c_by_inst_node[inst_idx]
+        moves_c_by_node: List[List[int]] = moves_c_by_inst_node[inst_idx]
 
         is_solved_c_by_node: List[List[bool]] = is_solved_c_by_inst_node[inst_idx]
 
@@ -150,46 +166,89 @@ def expand_nodes(instances: List[Instance], popped_nodes_all: List[List[Node]],
         tcs_node: List[float]
         states_c: List[State]
         str_reps_c: List[str]
-        for parent_node, tcs_node, path_costs_c, states_c, is_solved_c in zip(parent_nodes, tcs_by_node,
-                                                                              path_costs_c_by_node, states_c_by_node,
-                                                                              is_solved_c_by_node):
+        for parent_node, tcs_node, path_costs_c, states_c, is_solved_c, moves_c in zip(
+                parent_nodes, tcs_by_node, path_costs_c_by_node, states_c_by_node, is_solved_c_by_node,
+                moves_c_by_node):
             state: State
-            for move_idx, state in enumerate(states_c):
-                path_cost: float = path_costs_c[move_idx]
-                is_solved: bool = is_solved_c[move_idx]
-                node_c: Node = Node(state, path_cost, is_solved, move_idx, parent_node)
+            nodes_c: List[Node] = []
+            for c_idx, state in enumerate(states_c):
+                path_cost: float = path_costs_c[c_idx]
+                is_solved: bool = is_solved_c[c_idx]
+                node_c: Node = Node(state, path_cost, is_solved, moves_c[c_idx], parent_node)
 
-                nodes_c_by_inst[inst_idx].append(node_c)
+                nodes_c.append(node_c)
 
-                parent_node.children.append(node_c)
+            nodes_c_by_inst[inst_idx].extend(nodes_c)
 
-            parent_node.transition_costs.extend(tcs_node)
+            # a node is only expanded once
+            if not lean:
+                parent_node.children = nodes_c
+                parent_node.transition_costs = tcs_node
 
         instance.num_nodes_generated += len(nodes_c_by_inst[inst_idx])
 
     return nodes_c_by_inst
 
 
-def remove_in_closed(instances: List[Instance], nodes_c_all: List[List[Node]]) -> List[List[Node]]:
+def remove_in_closed(instances: List[Instance], nodes_c_all: List[List[Node]], env: Environment) -> List[List[Node]]:
     for inst_idx, instance in enumerate(instances):
-        nodes_c_all[inst_idx] = instance.remove_in_closed(nodes_c_all[inst_idx])
+        nodes_c_all[inst_idx] = instance.remove_in_closed(nodes_c_all[inst_idx], env)
 
     return nodes_c_all
 
 
-def add_heuristic_and_cost(nodes: List[Node], heuristic_fn: Callable,
-                           weights: List[float]) -> Tuple[np.ndarray, np.ndarray]:
+def add_heuristic_and_cost(nodes: List[Node], heuristic_fn: Callable, weights: List[float],
+                           env: Optional[Environment] = None,
+                           canonicalize: bool = False) -> Tuple[np.ndarray, np.ndarray]:
     # flatten nodes
     nodes: List[Node]
 
     if len(nodes) == 0:
         return np.zeros(0), np.zeros(0)
 
-    # get heuristic
+    # get heuristic, if env is given then identical states are only evaluated once. With canonicalize, states are
+    # evaluated as their canonical state, so symmetric states are also evaluated once.
     states: List[State] = [node.state for node in nodes]
 
+    if env is None:
+        heuristics = heuristic_fn(states)
+    elif canonicalize:
+        states_np, _ = env.canonicalize_np(env.states_to_np(states))
+        first_idxs, inverse = unique_states(states_np)
+        heuristics = heuristic_fn(env.np_to_states(states_np[first_idxs]))[inverse]
+    else:
+        first_idxs, inverse = unique_states(env.states_to_np(states))
+        heuristics = heuristic_fn([states[idx] for idx in first_idxs])[inverse]
+
+    return set_heuristic_and_cost(nodes, heuristics, weights)
+
+
+def add_children_heuristic_and_cost(nodes: List[Node], nodes_c: List[Node], heuristic_fn_children: Callable,
+                                    weights: List[float], env: Environment) -> Tuple[np.ndarray, np.ndarray]:
+    """ Add heuristic and cost to the children of nodes, evaluated from the nodes (see
+    nnet_utils.get_children_heuristic_fn)
+
+    @param nodes: Expanded nodes
+    @param nodes_c: Their children, in order, one for each move
+    @param heuristic_fn_children: Heuristic function of the children of packed states
+    @param weights: Weight of the path cost of each child
+    @param env: Environment
+    @return: path costs and heuristics of the children
+    """
+    if len(nodes_c) == 0:
+        return np.zeros(0), np.zeros(0)
+
+    states_np: np.ndarray = env.states_to_np([node.state for node in nodes])
+    states_c_np: np.ndarray = env.states_to_np([node_c.state for node_c in nodes_c])
+    states_c_np = states_c_np.reshape((len(nodes), -1) + states_np.shape[1:])
+    heuristics: np.ndarray = heuristic_fn_children(states_np, states_c_np).reshape(-1)
+
+    return set_heuristic_and_cost(nodes_c, heuristics, weights)
+
+
+def set_heuristic_and_cost(nodes: List[Node], heuristics: np.ndarray,
+                           weights: List[float]) -> Tuple[np.ndarray, np.ndarray]:
     # compute node cost
-    heuristics = heuristic_fn(states)
     path_costs: np.ndarray = np.array([node.path_cost for node in nodes])
     is_solved: np.ndarray = np.array([node.is_solved for node in nodes])
 
@@ -229,16 +288,72 @@ def get_path(node: Node) -> Tuple[List[State], List[int], float]:
     return path, moves, node.path_cost
 
 
+def timed_heuristic_and_cost(nodes: List[Node], heuristic_fn: Callable, weights: List[float],
+                             env: Optional[Environment] = None,
+                             canonicalize: bool = False) -> Tuple[np.ndarray, np.ndarray, float]:
+    start_time = time.time()
+    path_costs, heuristics = add_heuristic_and_cost(nodes, heuristic_fn, weights, env=env, canonicalize=canonicalize)
+
+    return path_costs, heuristics, time.time() - start_time
+
+
 class AStar:
+    """ Batch weighted A* search
+
+    open_set selects the open set of each instance, "heap" or "bucket" (see search_methods.open_set). Both give the
+    same results.
 
-    def __init__(self, states: List[State], env: Environment, heuristic_fn: Callable, weights: List[float]):
+    With lean=True, nodes do not keep their children and transition costs and instances do not keep the popped
+    nodes, so only what get_path needs is kept. Children are also checked against closed before the heuristic
+    function is called, so it only evaluates children that are added to open, each unique state once. Bellman
+    backups (Node.compute_bellman, get_popped_nodes) then are not available.
+
+    With pipeline=True, step pops and expands the next batch, and checks its children against closed, while the
+    children of the previous batch are evaluated by the heuristic function on a background thread. Staleness is
+    bounded by one batch: nodes are popped from an open set that is missing at most the children of the previous
+    step. If the open set would otherwise be empty, step waits for those children first. Call finish_pending to add
+    the children still being evaluated to open.
+
+    With prune_moves=True, moves pruned by the move prune table of the environment (Environment.get_move_prune_table)
+    after the move that generated a node are not applied when the node is expanded.
+
+    With canonicalize=True, states are mapped to their canonical state (Environment.canonicalize_np) for the closed
+    set and the heuristic function, so symmetric states are treated as the same state. Nodes keep their own states,
+    so paths do not have to be mapped back. Heuristic values then are those of the canonical states.
+
+    heuristic_fn_children, if given to step, evaluates the children of the popped nodes from the nodes (see
+    nnet_utils.get_children_heuristic_fn). It is only used without lean, pipeline, prune_moves and canonicalize, where
+    all children are evaluated and each node has a child for each move.
+    """
+
+    def __init__(self, states: List[State], env: Environment, heuristic_fn: Callable, weights: List[float],
+                 pipeline: bool = False, open_set: str = "heap", lean: bool = False, prune_moves: bool = False,
+                 canonicalize: bool = False):
         self.env: Environment = env
-        self.weights: List[float] = weights
+        self.open_set: str = open_set
+        self.lean: bool = lean
+        self.prune_moves: bool = prune_moves
+        self.canonicalize: bool = canonicalize
+        self.weights: List[float] = []
         self.step_num: int = 0
 
         self.timings: Dict[str, float] = {"pop": 0.0, "expand": 0.0, "check": 0.0, "heur": 0.0,
                                           "add": 0.0, "itr": 0.0}
 
+        self.pipeline: bool = pipeline
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.pending: Optional[Tuple[List[Instance], List[List[Node]], Future]] = None
+        if self.pipeline:
+            self.executor = ThreadPoolExecutor(max_workers=1)
+            self.timings.update({"wait": 0.0, "overlap": 0.0})
+
+        self.instances: List[Instance] = []
+        self.add_instances(states, heuristic_fn, weights)
+
+    def add_instances(self, states: List[State], heuristic_fn: Callable, weights: List[float]):
+        # the heuristic function must not be called while it evaluates the batch of the pipelined step
+        self.finish_pending()
+
         # compute starting costs
         root_nodes: List[Node] = []
         is_solved_states: np.ndarray = self.env.is_solved(states)
@@ -246,20 +361,29 @@ class AStar:
             root_node: Node = Node(state, 0.0, is_solved, None, None)
             root_nodes.append(root_node)
 
-        add_heuristic_and_cost(root_nodes, heuristic_fn, self.weights)
+        add_heuristic_and_cost(root_nodes, heuristic_fn, weights, env=self.env if self.canonicalize else None,
+                               canonicalize=self.canonicalize)
 
         # initialize instances
-        self.instances: List[Instance] = []
         for root_node in root_nodes:
-            self.instances.append(Instance(root_node))
+            self.instances.append(Instance(root_node, open_set=self.open_set, lean=self.lean,
+                                           canonicalize=self.canonicalize))
+        self.weights.extend(weights)
+
+    def remove_instance(self, inst_idx: int) -> Instance:
+        self.weights.pop(inst_idx)
+
+        return self.instances.pop(inst_idx)
+
+    def step(self, heuristic_fn: Callable, batch_size: int, include_solved: bool = False, verbose: bool = False,
+             heuristic_fn_children: Optional[Callable] = None):
+        if self.pipeline:
+            self._step_pipelined(heuristic_fn, batch_size, include_solved=include_solved, verbose=verbose)
+            return
 
-    def step(self, heuristic_fn: Callable, batch_size: int, include_solved: bool = False, verbose: bool = False):
         start_time_itr = time.time()
-        instances: List[Instance]
-        if include_solved:
-            instances = self.instances
-        else:
-            instances = [instance for instance in self.instances if len(instance.goal_nodes) == 0]
+        inst_idxs: List[int] = self._get_step_inst_idxs(include_solved)
+        instances: List[Instance] = [self.instances[idx] for idx in inst_idxs]
 
         # Pop from open
         start_time = time.time()
@@ -268,20 +392,35 @@ class AStar:
 
         # Expand nodes
         start_time = time.time()
-        nodes_c_all: List[List[Node]] = expand_nodes(instances, popped_nodes_all, self.env)
+        nodes_c_all: List[List[Node]] = expand_nodes(instances, popped_nodes_all, self.env, lean=self.lean,
+                                                     prune_moves=self.prune_moves)
         expand_time = time.time() - start_time
 
-        # Get heuristic of children, do heur before check so we can do backup
-        start_time = time.time()
-        nodes_c_all_flat, _ = misc_utils.flatten(nodes_c_all)
-        weights, _ = misc_utils.flatten([[weight] * len(nodes_c) for weight, nodes_c in zip(self.weights, nodes_c_all)])
-        path_costs, heuristics = add_heuristic_and_cost(nodes_c_all_flat, heuristic_fn, weights)
-        heur_time = time.time() - start_time
+        if self.lean:
+            # Check if children are in closed
+            start_time = time.time()
+            nodes_c_all = remove_in_closed(instances, nodes_c_all, self.env)
+            check_time = time.time() - start_time
 
-        # Check if children are in closed
-        start_time = time.time()
-        nodes_c_all = remove_in_closed(instances, nodes_c_all)
-        check_time = time.time() - start_time
+            # Get heuristic of children added to open
+            start_time = time.time()
+            path_costs, heuristics = self._add_heuristic_and_cost(instances, inst_idxs, nodes_c_all, heuristic_fn)
+            heur_time = time.time() - start_time
+        else:
+            # Get heuristic of children, do heur before check so we can do backup
+            start_time = time.time()
+            if (heuristic_fn_children is not None) and (not self.prune_moves) and (not self.canonicalize):
+                path_costs, heuristics = self._add_children_heuristic_and_cost(instances, inst_idxs, popped_nodes_all,
+                                                                               nodes_c_all, heuristic_fn_children)
+            else:
+                path_costs, heuristics = self._add_heuristic_and_cost(instances, inst_idxs, nodes_c_all,
+                                                                      heuristic_fn)
+            heur_time = time.time() - start_time
+
+            # Check if children are in closed
+            start_time = time.time()
+            nodes_c_all = remove_in_closed(instances, nodes_c_all, self.env)
+            check_time = time.time() - start_time
 
         # Add to open
         start_time = time.time()
@@ -316,6 +455,150 @@ class AStar:
 
         self.step_num += 1
 
+    def finish_pending(self) -> Tuple[np.ndarray, np.ndarray, float, float]:
+        """ Wait for the children being evaluated in pipelined mode and add them to open
+
+        @return: path costs and heuristics of the children, time spent evaluating them, time spent waiting
+        """
+        if self.pending is None:
+            return np.zeros(0), np.zeros(0), 0.0, 0.0
+
+        instances, nodes_c_all, future = self.pending
+        self.pending = None
+
+        start_time = time.time()
+        path_costs, heuristics, heur_time = future.result()
+        wait_time = time.time() - start_time
+
+        add_to_open(instances, nodes_c_all)
+
+        return path_costs, heuristics, heur_time, wait_time
+
+    def close(self):
+        """ Wait for the children being evaluated in pipelined mode, add them to open, and stop the thread that
+        evaluates them. The heuristic function can then be called by another search.
+        """
+        try:
+            self.finish_pending()
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
+
+    def _step_pipelined(self, heuristic_fn: Callable, batch_size: int, include_solved: bool = False,
+                        verbose: bool = False):
+        start_time_itr = time.time()
+        inst_idxs: List[int] = self._get_step_inst_idxs(include_solved)
+        instances: List[Instance] = [self.instances[idx] for idx in inst_idxs]
+
+        # Wait for the batch being evaluated if nothing else can be popped
+        path_costs: np.ndarray = np.zeros(0)
+        heuristics: np.ndarray = np.zeros(0)
+        heur_time: float = 0.0
+        wait_time: float = 0.0
+        add_time: float = 0.0
+        if all(len(instance.open_set) == 0 for instance in instances):
+            start_time = time.time()
+            path_costs, heuristics, heur_time, wait_time = self.finish_pending()
+            add_time = time.time() - start_time - wait_time
+
+        # Pop from open, children of the batch being evaluated are not in open yet
+        start_time = time.time()
+        popped_nodes_all: List[List[Node]] = pop_from_open(instances, batch_size)
+        pop_time = time.time() - start_time
+
+        # Expand nodes
+        start_time = time.time()
+        nodes_c_all: List[List[Node]] = [[] for _ in instances]
+        if sum(len(popped_nodes) for popped_nodes in popped_nodes_all) > 0:
+            nodes_c_all = expand_nodes(instances, popped_nodes_all, self.env, lean=self.lean,
+                                       prune_moves=self.prune_moves)
+        expand_time = time.time() - start_time
+
+        # Check if children are in closed, unless lean heuristics are computed for all children so we can do backup
+        start_time = time.time()
+        nodes_c_eval_all: List[List[Node]] = nodes_c_all
+        nodes_c_all = remove_in_closed(instances, list(nodes_c_all), self.env)
+        if self.lean:
+            nodes_c_eval_all = nodes_c_all
+
+        nodes_c_eval_flat, _ = misc_utils.flatten(nodes_c_eval_all)
+        weights: List[float] = self._get_node_weights(instances, inst_idxs, nodes_c_eval_all)
+        check_time = time.time() - start_time
+
+        # Wait for the previous batch and add its children to open
+        if self.pending is not None:
+            start_time = time.time()
+            path_costs, heuristics, heur_time, wait_time = self.finish_pending()
+            add_time = time.time() - start_time - wait_time
+
+        # Evaluate children of this batch in the background
+        if len(nodes_c_eval_flat) > 0:
+            future: Future = self.executor.submit(timed_heuristic_and_cost, nodes_c_eval_flat, heuristic_fn, weights,
+                                                  env=self._get_heur_env(), canonicalize=self.canonicalize)
+            self.pending = (instances, nodes_c_all, future)
+
+        itr_time = time.time() - start_time_itr
+        overlap_time = max(heur_time - wait_time, 0.0)
+
+        # Print to screen
+        if verbose:
+            astar_array.print_pipelined_step(self.step_num, path_costs, heuristics, pop_time, expand_time, check_time,
+                                             heur_time, wait_time, overlap_time, add_time, itr_time)
+
+        # Update timings
+        self.timings['pop'] += pop_time
+        self.timings['expand'] += expand_time
+        self.timings['check'] += check_time
+        self.timings['heur'] += heur_time
+        self.timings['wait'] += wait_time
+        self.timings['overlap'] += overlap_time
+        self.timings['add'] += add_time
+        self.timings['itr'] += itr_time
+
+        self.step_num += 1
+
+    def _add_heuristic_and_cost(self, instances: List[Instance], inst_idxs: List[int], nodes_c_all: List[List[Node]],
+                                heuristic_fn: Callable) -> Tuple[np.ndarray, np.ndarray]:
+        nodes_c_all_flat, _ = misc_utils.flatten(nodes_c_all)
+        weights: List[float] = self._get_node_weights(instances, inst_idxs, nodes_c_all)
+
+        return add_heuristic_and_cost(nodes_c_all_flat, heuristic_fn, weights, env=self._get_heur_env(),
+                                      canonicalize=self.canonicalize)
+
+    def _add_children_heuristic_and_cost(self, instances: List[Instance], inst_idxs: List[int],
+                                         popped_nodes_all: List[List[Node]], nodes_c_all: List[List[Node]],
+                                         heuristic_fn_children: Callable) -> Tuple[np.ndarray, np.ndarray]:
+        popped_nodes_flat, _ = misc_utils.flatten(popped_nodes_all)
+        nodes_c_all_flat, _ = misc_utils.flatten(nodes_c_all)
+        weights: List[float] = self._get_node_weights(instances, inst_idxs, nodes_c_all)
+
+        return add_children_heuristic_and_cost(popped_nodes_flat, nodes_c_all_flat, heuristic_fn_children, weights,
+                                               self.env)
+
+    def _get_heur_env(self) -> Optional[Environment]:
+        # the environment is needed to evaluate unique or canonical states
+        if self.lean or self.canonicalize:
+            return self.env
+        else:
+            return None
+
+    def _get_node_weights(self, instances: List[Instance], inst_idxs: List[int],
+                          nodes_c_all: List[List[Node]]) -> List[float]:
+        # also counts the nodes sent to the heuristic function
+        weights: List[float] = []
+        for instance, inst_idx, nodes_c in zip(instances, inst_idxs, nodes_c_all):
+            weights.extend([self.weights[inst_idx]] * len(nodes_c))
+            instance.num_nodes_evaluated += len(nodes_c)
+
+        return weights
+
+    def _get_step_inst_idxs(self, include_solved: bool) -> List[int]:
+        if include_solved:
+            return list(range(len(self.instances)))
+        else:
+            return [idx for idx, instance in enumerate(self.instances) if len(instance.goal_nodes) == 0]
+
     def has_found_goal(self) -> List[bool]:
         goal_found: List[bool] = [len(self.get_goal_nodes(idx)) > 0 for idx in range(len(self.instances))]
 
@@ -335,23 +618,86 @@ class AStar:
     def get_num_nodes_generated(self, inst_idx: int) -> int:
         return self.instances[inst_idx].num_nodes_generated
 
+    def get_num_nodes_evaluated(self, inst_idx: int) -> int:
+        return self.instances[inst_idx].num_nodes_evaluated
+
     def get_popped_nodes(self) -> List[List[Node]]:
         popped_nodes_all: List[List[Node]] = [instance.popped_nodes for instance in self.instances]
         return popped_nodes_all
 
 
-def main():
-    # parse arguments
-    parser: ArgumentParser = ArgumentParser()
-    parser.add_argument('--states', type=str, required=True, help="File containing states to solve")
+def create_astar(engine: str, states: List[State], env: Environment, heuristic_fn: Callable, weights: List[float],
+                 pipeline: bool = False, open_set: str = "heap", prune_moves: bool = False, canonicalize: bool = False):
+    """ Create the search of an engine, "object" for a lean AStar or "array" for ArrayAStar
+
+    @return: AStar or ArrayAStar
+    """
+    if engine == "object":
+        return AStar(states, env, heuristic_fn, weights, pipeline=pipeline, open_set=open_set, lean=True,
+                     prune_moves=prune_moves, canonicalize=canonicalize)
+    elif engine == "array":
+        return ArrayAStar(states, env, heuristic_fn, weights, pipeline=pipeline, open_set=open_set,
+                          prune_moves=prune_moves, canonicalize=canonicalize)
+    else:
+        raise ValueError("Unknown engine %s" % engine)
+
+
+def get_instance_path(astar, inst_idx: int, env: Environment) -> Tuple[List[State], List[int], float]:
+    """ Path to the goal node with the smallest path cost of a solved instance of AStar or ArrayAStar
+
+    @param astar: AStar or ArrayAStar
+    @param inst_idx: Index of the instance
+    @param env: Environment
+    @return: States on the path, moves, and path cost
+    """
+    if isinstance(astar, ArrayAStar):
+        goal_node_id: int = astar.get_goal_node_smallest_path_cost(inst_idx)
+        return astar_array.get_path(astar.instances[inst_idx], goal_node_id, env)
+    else:
+        goal_node: Node = astar.get_goal_node_smallest_path_cost(inst_idx)
+        return get_path(goal_node)
+
+
+def add_search_args(parser: ArgumentParser):
+    """ Add the arguments of the search, shared by astar.py and the solver daemon
+
+    @param parser: Argument parser
+    """
     parser.add_argument('--model_dir', type=str, required=True, help="Directory of nnet model")
     parser.add_argument('--env', type=str, required=True, help="Environment: cube3, 15-puzzle, 24-puzzle")
     parser.add_argument('--batch_size', type=int, default=1, help="Batch size for BWAS")
     parser.add_argument('--weight', type=float, default=1.0, help="Weight of path cost")
     parser.add_argument('--language', type=str, default="python", help="python or cpp")
-
-    parser.add_argument('--results_dir', type=str, required=True, help="Directory to save results")
-    parser.add_argument('--start_idx', type=int, default=0, help="")
+    parser.add_argument('--cpp_transport', type=str, default="shm", help="How the cpp search sends states to the "
+                                                                         "DNN. shm: shared memory. socket: the "
+                                                                         "states are sent over the socket. lib: the "
+                                                                         "search runs in this process through "
+                                                                         "cpp/libweighted_astar.so. nnet: the cpp "
+                                                                         "search evaluates the DNN itself on the "
+                                                                         "CPU, with no heuristic server.")
+    parser.add_argument('--engine', type=str, default="object", help="Node storage for the python search. "
+                                                                    "object: one Node object per node. "
+                                                                    "array: nodes stored in numpy arrays. "
+                                                                    "Both give the same solutions.")
+    parser.add_argument('--num_instances', type=int, default=1, help="Number of states solved at the same time. "
+                                                                         "Their children are evaluated by the "
+                                                                         "heuristic function together.")
+    parser.add_argument('--open_set', type=str, default="heap", help="Open set for the python search. heap: binary "
+                                                                      "heap. bucket: costs grouped into buckets "
+                                                                      "that are pushed to and popped from in bulk. "
+                                                                      "Both give the same solutions.")
+    parser.add_argument('--heur_cache_mb', type=float, default=0, help="Size in MB of a cache of heuristic values "
+                                                                         "for the python search. 0 for no cache.")
+    parser.add_argument('--pipeline', action='store_true', default=False, help="Set to expand the next batch "
+                                                                               "while the heuristic function "
+                                                                               "evaluates the previous one")
+    parser.add_argument('--canonicalize', action='store_true', default=False, help="Set to treat symmetric states "
+                                                                                   "as the same state in the "
+                                                                                   "closed set and the heuristic "
+                                                                                   "function (cube3)")
+    parser.add_argument('--prune_moves', action='store_true', default=False, help="Set to not apply moves that "
+                                                                                  "undo the previous move or that "
+                                                                                  "only reorder commuting moves")
     parser.add_argument('--nnet_batch_size', type=int, default=None, help="Set to control how many states per GPU are "
                                                                           "evaluated by the neural network at a time. "
                                                                           "Does not affect final results, "
@@ -359,6 +705,16 @@ def main():
                                                                           "memory.")
 
     parser.add_argument('--verbose', action='store_true', default=False, help="Set for verbose")
+
+
+def main():
+    # parse arguments
+    parser: ArgumentParser = ArgumentParser()
+    parser.add_argument('--states', type=str, required=True, help="File containing states to solve")
+    add_search_args(parser)
+
+    parser.add_argument('--results_dir', type=str, required=True, help="Directory to save results")
+    parser.add_argument('--start_idx', type=int, default=0, help="")
     parser.add_argument('--debug', action='store_true', default=False, help="Set when debugging")
 
     args = parser.parse_args()
@@ -397,7 +753,14 @@ def main():
     pickle.dump(results, open(results_file, "wb"), protocol=-1)
 
 
-def bwas_python(args, env: Environment, states: List[State]):
+def load_search_heuristic_fn(args, env: Environment, model_dir: str) -> Callable:
+    """ Load the heuristic function used by the search, with a cache in front of it if --heur_cache_mb is set
+
+    @param args: Search arguments
+    @param env: Environment
+    @param model_dir: Directory of nnet model
+    @return: Heuristic function
+    """
     # get device
     on_gpu: bool
     device: torch.device
@@ -405,51 +768,101 @@ def bwas_python(args, env: Environment, states: List[State]):
 
     print("device: %s, devices: %s, on_gpu: %s" % (device, devices, on_gpu))
 
-    heuristic_fn = nnet_utils.load_heuristic_fn(args.model_dir, device, on_gpu, env.get_nnet_model(),
+    heuristic_fn = nnet_utils.load_heuristic_fn(model_dir, device, on_gpu, env.get_nnet_model(),
                                                 env, clip_zero=True, batch_size=args.nnet_batch_size)
-
-    solns: List[List[int]] = []
-    paths: List[List[State]] = []
-    times: List = []
-    num_nodes_gen: List[int] = []
-
-    for state_idx, state in enumerate(states):
-        start_time = time.time()
-
-        num_itrs: int = 0
-        astar = AStar([state], env, heuristic_fn, [args.weight])
-        while not min(astar.has_found_goal()):
-            astar.step(heuristic_fn, args.batch_size, verbose=args.verbose)
-            num_itrs += 1
-
-        path: List[State]
-        soln: List[int]
-        path_cost: float
-        num_nodes_gen_idx: int
-        goal_node: Node = astar.get_goal_node_smallest_path_cost(0)
-        path, soln, path_cost = get_path(goal_node)
-
-        num_nodes_gen_idx: int = astar.get_num_nodes_generated(0)
-
-        solve_time = time.time() - start_time
-
-        # record solution information
-        solns.append(soln)
-        paths.append(path)
-        times.append(solve_time)
-        num_nodes_gen.append(num_nodes_gen_idx)
-
-        # check soln
-        assert search_utils.is_valid_soln(state, soln, env)
-
-        # print to screen
-        timing_str = ", ".join(["%s: %.2f" % (key, val) for key, val in astar.timings.items()])
-        print("Times - %s, num_itrs: %i" % (timing_str, num_itrs))
-
-        print("State: %i, SolnCost: %.2f, # Moves: %i, "
-              "# Nodes Gen: %s, Time: %.2f" % (state_idx, path_cost, len(soln),
-                                               format(num_nodes_gen_idx, ","),
-                                               solve_time))
+    if args.heur_cache_mb > 0:
+        heuristic_fn = HeuristicCache(heuristic_fn, env, int(args.heur_cache_mb * (2 ** 20)))
+
+    return heuristic_fn
+
+
+def bwas_python(args, env: Environment, states: List[State], heuristic_fn: Optional[Callable] = None):
+    if heuristic_fn is None:
+        heuristic_fn = load_search_heuristic_fn(args, env, args.model_dir)
+
+    solns: List[Optional[List[int]]] = [None] * len(states)
+    paths: List[Optional[List[State]]] = [None] * len(states)
+    times: List = [None] * len(states)
+    num_nodes_gen: List[Optional[int]] = [None] * len(states)
+
+    # keep a window of up to num_instances unsolved states in one search, refilling it as states are solved
+    astar = None
+    inst_state_idxs: List[int] = []
+    inst_start_times: List[float] = []
+    inst_num_itrs: List[int] = []
+    next_state_idx: int = 0
+    while (next_state_idx < len(states)) or (len(inst_state_idxs) > 0):
+        num_add: int = min(args.num_instances - len(inst_state_idxs), len(states) - next_state_idx)
+        if num_add > 0:
+            start_time = time.time()
+            states_add: List[State] = states[next_state_idx:(next_state_idx + num_add)]
+            weights_add: List[float] = [args.weight] * num_add
+            if astar is not None:
+                astar.add_instances(states_add, heuristic_fn, weights_add)
+            else:
+                astar = create_astar(args.engine, states_add, env, heuristic_fn, weights_add, pipeline=args.pipeline,
+                                     open_set=args.open_set, prune_moves=args.prune_moves,
+                                     canonicalize=args.canonicalize)
+
+            inst_state_idxs.extend(range(next_state_idx, next_state_idx + num_add))
+            inst_start_times.extend([start_time] * num_add)
+            inst_num_itrs.extend([0] * num_add)
+            next_state_idx += num_add
+
+        astar.step(heuristic_fn, args.batch_size, verbose=args.verbose)
+        inst_num_itrs = [num_itrs + 1 for num_itrs in inst_num_itrs]
+
+        # record and remove solved instances
+        solved_inst_idxs: List[int] = [inst_idx for inst_idx, found in enumerate(astar.has_found_goal()) if found]
+        for inst_idx in solved_inst_idxs:
+            state_idx: int = inst_state_idxs[inst_idx]
+            state: State = states[state_idx]
+
+            path: List[State]
+            soln: List[int]
+            path_cost: float
+            path, soln, path_cost = get_instance_path(astar, inst_idx, env)
+
+            num_nodes_gen_idx: int = astar.get_num_nodes_generated(inst_idx)
+            num_nodes_eval_idx: int = astar.get_num_nodes_evaluated(inst_idx)
+
+            solve_time = time.time() - inst_start_times[inst_idx]
+
+            # record solution information
+            solns[state_idx] = soln
+            paths[state_idx] = path
+            times[state_idx] = solve_time
+            num_nodes_gen[state_idx] = num_nodes_gen_idx
+
+            # check soln
+            assert search_utils.is_valid_soln(state, soln, env)
+
+            # print to screen
+            print("State: %i, SolnCost: %.2f, # Moves: %i, # Itrs: %i, "
+                  "# Nodes Gen: %s, # Nodes Eval: %s, Time: %.2f" % (state_idx, path_cost, len(soln),
+                                                                     inst_num_itrs[inst_idx],
+                                                                     format(num_nodes_gen_idx, ","),
+                                                                     format(num_nodes_eval_idx, ","),
+                                                                     solve_time))
+
+        for inst_idx in solved_inst_idxs[::-1]:
+            astar.remove_instance(inst_idx)
+            inst_state_idxs.pop(inst_idx)
+            inst_start_times.pop(inst_idx)
+            inst_num_itrs.pop(inst_idx)
+
+        # the states of the search share its timings, print them once the search is done
+        if len(inst_state_idxs) == 0:
+            astar.close()
+            timing_str = ", ".join(["%s: %.2f" % (key, val) for key, val in astar.timings.items()])
+            print("Times of the search (cumulative over its states) - %s, num_itrs: %i" % (timing_str,
+                                                                                          astar.step_num))
+            if isinstance(heuristic_fn, HeuristicCache):
+                print("Heuristic cache (cumulative) - hits: %s, misses: %s, hit rate: %.2f" % (
+                    format(heuristic_fn.num_hits, ","), format(heuristic_fn.num_misses, ","),
+                    heuristic_fn.get_hit_rate()))
+
+            astar = None
 
     return solns, paths, times, num_nodes_gen
 
@@ -457,56 +870,68 @@ def bwas_python(args, env: Environment, states: List[State]):
 def bwas_cpp(args, env: Environment, states: List[State], results_file: str):
     assert (args.env.upper() in ['CUBE3', 'CUBE2', 'CUBE3_SOLVED_CORNERS', 'CUBE4', 'PUZZLE15', 'PUZZLE24', 'PUZZLE35', 'PUZZLE48', 'LIGHTSOUT7'])
 
-    # Make c++ socket
-    socket_name: str = "%s_cpp_socket" % results_file.split(".")[0]
-
-    try:
-        os.unlink(socket_name)
-    except OSError:
-        if os.path.exists(socket_name):
-            raise
-
-    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-    sock.bind(socket_name)
-
-    # Get state dimension
-    if args.env.upper() in ['CUBE2', 'CUBE3_SOLVED_CORNERS', 'CUBE3']:
-        state_dim: int = 54
-    elif args.env.upper() == 'PUZZLE15':
-        state_dim: int = 16
-    elif args.env.upper() == 'PUZZLE24':
-        state_dim: int = 25
-    elif args.env.upper() == 'PUZZLE35':
-        state_dim: int = 36
-    elif args.env.upper() == 'PUZZLE48':
-        state_dim: int = 49
-    elif args.env.upper() == 'LIGHTSOUT7':
-        state_dim: int = 49
-    else:
-        raise ValueError("Unknown c++ environment: %s" % args.env)
+    if args.cpp_transport == "lib":
+        return bwas_cpp_lib(args, env, states)
 
-    # start heuristic proc
-    num_parallel: int = len(os.environ['CUDA_VISIBLE_DEVICES'].split(","))
-    device, devices, on_gpu = nnet_utils.get_device()
-    heur_fn_i_q, heur_fn_o_qs, heur_procs = nnet_utils.start_heur_fn_runners(num_parallel, args.model_dir, device,
-                                                                             on_gpu, env, all_zeros=False,
-                                                                             clip_zero=True,
-                                                                             batch_size=args.nnet_batch_size)
-    nnet_utils.heuristic_fn_par(states, env, heur_fn_i_q, heur_fn_o_qs)  # initialize
+    shm_name: Optional[str] = None
+    if args.cpp_transport == "nnet":
+        # the c++ search evaluates the nnet itself, on the cpu
+        heuristic_name: str = "%s_cpp_nnet.bin" % results_file.split(".")[0]
+        nnet = nnet_utils.load_nnet("%s/model_state_dict.pt" % args.model_dir, env.get_nnet_model(),
+                                    device=torch.device("cpu"))
+        nnet_utils.export_resnet(nnet, env, heuristic_name)
+    else:
+        # Make c++ socket
+        heuristic_name: str = "%s_cpp_socket" % results_file.split(".")[0]
 
-    heur_proc = Process(target=cpp_listener, args=(sock, args, env, state_dim, heur_fn_i_q, heur_fn_o_qs))
-    heur_proc.daemon = True
-    heur_proc.start()
+        try:
+            os.unlink(heuristic_name)
+        except OSError:
+            if os.path.exists(heuristic_name):
+                raise
 
-    time.sleep(2)  # give socket time to intialize
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(heuristic_name)
 
-    solns: List[List[int]] = []
-    paths: List[List[State]] = []
-    times: List = []
-    num_nodes_gen: List[int] = []
+        # Get state dimension
+        if args.env.upper() in ['CUBE2', 'CUBE3_SOLVED_CORNERS', 'CUBE3']:
+            state_dim: int = 54
+        elif args.env.upper() == 'PUZZLE15':
+            state_dim: int = 16
+        elif args.env.upper() == 'PUZZLE24':
+            state_dim: int = 25
+        elif args.env.upper() == 'PUZZLE35':
+            state_dim: int = 36
+        elif args.env.upper() == 'PUZZLE48':
+            state_dim: int = 49
+        elif args.env.upper() == 'LIGHTSOUT7':
+            state_dim: int = 49
+        else:
+            raise ValueError("Unknown c++ environment: %s" % args.env)
 
-    for state_idx, state in enumerate(states):
-        # Get string rep of state
+        # start heuristic proc
+        num_parallel: int = len(os.environ['CUDA_VISIBLE_DEVICES'].split(","))
+        device, devices, on_gpu = nnet_utils.get_device()
+        heur_fn_i_q, heur_fn_o_qs, heur_procs = nnet_utils.start_heur_fn_runners(num_parallel, args.model_dir, device,
+                                                                                 on_gpu, env, all_zeros=False,
+                                                                                 clip_zero=True,
+                                                                                 batch_size=args.nnet_batch_size)
+        nnet_utils.heuristic_fn_par(states, env, heur_fn_i_q, heur_fn_o_qs,
+                                    batch_size=args.nnet_batch_size)  # initialize
+
+        if args.cpp_transport == "shm":
+            shm_name = get_shm_name("%s_cpp_shm" % results_file.split(".")[0])
+
+        heur_proc = Process(target=cpp_listener, args=(sock, args, env, state_dim, heur_fn_i_q, heur_fn_o_qs,
+                                                       shm_name))
+        heur_proc.daemon = True
+        heur_proc.start()
+
+        time.sleep(2)  # give socket time to intialize
+
+    # Get string rep of states
+    state_strs: List[str] = []
+    for state in states:
         if args.env.upper() in ['CUBE2', 'CUBE3_SOLVED_CORNERS', 'CUBE3']:
             state_str: str = " ".join([str(x) for x in state.colors])
         elif args.env.upper() in ["PUZZLE15", "PUZZLE24", "PUZZLE35", "PUZZLE48"]:
@@ -516,84 +941,127 @@ def bwas_cpp(args, env: Environment, states: List[State], results_file: str):
         else:
             raise ValueError("Unknown c++ environment: %s" % args.env)
 
-        popen = Popen(['./cpp/parallel_weighted_astar', state_str, str(args.weight), str(args.batch_size),
-                       socket_name, args.env, "0"], stdout=PIPE, stderr=PIPE, bufsize=1, universal_newlines=True)
-        lines = []
-        for stdout_line in iter(popen.stdout.readline, ""):
-            stdout_line = stdout_line.strip('\n')
-            lines.append(stdout_line)
+        state_strs.append(state_str)
+
+    # one process solves all states, num_instances at a time, and prints a result record for each state
+    cmd: List[str] = ['./cpp/parallel_weighted_astar', "-", str(args.weight), str(args.batch_size), heuristic_name,
+                      args.env, str(int(args.verbose)), str(args.num_instances)]
+    if shm_name is not None:
+        cmd.append(shm_name)
+
+    popen = Popen(cmd, stdin=PIPE, stdout=PIPE, bufsize=1, universal_newlines=True)
+    popen.stdin.write("".join(["%s\n" % state_str for state_str in state_strs]))
+    popen.stdin.close()
+
+    solns: List[Optional[List[int]]] = [None] * len(states)
+    paths: List[Optional[List[State]]] = [None] * len(states)
+    times: List[Optional[float]] = [None] * len(states)
+    num_nodes_gen: List[Optional[int]] = [None] * len(states)
+
+    for stdout_line in iter(popen.stdout.readline, ""):
+        stdout_line = stdout_line.strip('\n')
+        if not stdout_line.startswith("Result: "):
             if args.verbose:
                 sys.stdout.write("%s\n" % stdout_line)
                 sys.stdout.flush()
+            continue
 
-        moves = [int(x) for x in lines[-5].split(" ")[:-1]]
-        soln = [x for x in moves][::-1]
-        num_nodes_gen_idx = int(lines[-3])
-        solve_time = float(lines[-1])
+        record_cpp_result(json.loads(stdout_line[len("Result: "):]), env, states, solns, paths, times, num_nodes_gen)
 
-        # record solution information
-        path: List[State] = [state]
-        next_state: State = state
-        transition_costs: List[float] = []
+    popen.wait()
+    assert popen.returncode == 0, "parallel_weighted_astar exited with code %i" % popen.returncode
 
-        for move in soln:
-            next_states, tcs = env.next_state([next_state], move)
+    missing: List[int] = [state_idx for state_idx, soln in enumerate(solns) if soln is None]
+    assert len(missing) == 0, "No result for states %s" % missing
 
-            next_state = next_states[0]
-            tc = tcs[0]
+    os.unlink(heuristic_name)
 
-            path.append(next_state)
-            transition_costs.append(tc)
+    if args.cpp_transport != "nnet":
+        nnet_utils.stop_heuristic_fn_runners(heur_procs, heur_fn_i_q)
 
-        solns.append(soln)
-        paths.append(path)
-        times.append(solve_time)
-        num_nodes_gen.append(num_nodes_gen_idx)
+    return solns, paths, times, num_nodes_gen
 
-        path_cost: float = sum(transition_costs)
 
-        # check soln
-        assert search_utils.is_valid_soln(state, soln, env)
+def bwas_cpp_lib(args, env: Environment, states: List[State], heuristic_fn: Optional[Callable] = None):
+    # the search runs in this process and calls the heuristic function directly
+    if heuristic_fn is None:
+        heuristic_fn = load_search_heuristic_fn(args, env, args.model_dir)
 
-        # print to screen
-        print("State: %i, SolnCost: %.2f, # Moves: %i, "
-              "# Nodes Gen: %s, Time: %.2f" % (state_idx, path_cost, len(soln),
-                                               format(num_nodes_gen_idx, ","),
-                                               solve_time))
+    solns: List[Optional[List[int]]] = [None] * len(states)
+    paths: List[Optional[List[State]]] = [None] * len(states)
+    times: List[Optional[float]] = [None] * len(states)
+    num_nodes_gen: List[Optional[int]] = [None] * len(states)
 
-    os.unlink(socket_name)
+    astar_cpp.solve(args.env, env, states, args.weight, args.batch_size, heuristic_fn,
+                    num_instances=args.num_instances, verbose=args.verbose,
+                    on_result=lambda result: record_cpp_result(result, env, states, solns, paths, times,
+                                                               num_nodes_gen))
 
-    nnet_utils.stop_heuristic_fn_runners(heur_procs, heur_fn_i_q)
+    missing: List[int] = [state_idx for state_idx, soln in enumerate(solns) if soln is None]
+    assert len(missing) == 0, "No result for states %s" % missing
 
     return solns, paths, times, num_nodes_gen
 
 
-def cpp_listener(sock, args, env: Environment, state_dim: int, heur_fn_i_q, heur_fn_o_qs):
+def record_cpp_result(result: Dict[str, Any], env: Environment, states: List[State], solns: List, paths: List,
+                      times: List, num_nodes_gen: List):
+    """ Check and record the result of a state solved by the c++ search, and print it to screen """
+    state_idx: int = result["state"]
+    state: State = states[state_idx]
+    assert result["solved"], "State %i was not solved" % state_idx
+
+    soln: List[int] = result["moves"]
+    num_nodes_gen_idx: int = result["nodes_generated"]
+    num_nodes_eval_idx: int = result["nodes_evaluated"]
+    solve_time: float = result["time"]
+
+    # record solution information
+    path: List[State] = [state]
+    next_state: State = state
+    transition_costs: List[float] = []
+
+    for move in soln:
+        next_states, tcs = env.next_state([next_state], move)
+
+        next_state = next_states[0]
+        tc = tcs[0]
+
+        path.append(next_state)
+        transition_costs.append(tc)
+
+    solns[state_idx] = soln
+    paths[state_idx] = path
+    times[state_idx] = solve_time
+    num_nodes_gen[state_idx] = num_nodes_gen_idx
+
+    path_cost: float = sum(transition_costs)
+
+    # check soln
+    assert search_utils.is_valid_soln(state, soln, env)
+
+    # print to screen
+    print("State: %i, SolnCost: %.2f, # Moves: %i, "
+          "# Nodes Gen: %s, # Nodes Eval: %s, Time: %.2f" % (state_idx, path_cost, len(soln),
+                                                             format(num_nodes_gen_idx, ","),
+                                                             format(num_nodes_eval_idx, ","),
+                                                             solve_time))
+
+
+def cpp_listener(sock, args, env: Environment, state_dim: int, heur_fn_i_q, heur_fn_o_qs,
+                 shm_name: Optional[str] = None):
+    transport: CppTransport = CppTransport(sock, state_dim, env.dtype, shm_name=shm_name)
     sock.listen(1)
-    connection, client_address = sock.accept()
+    transport.accept()
 
     # device, devices, on_gpu = nnet_utils.get_device()
     # heuristic_fn = nnet_utils.load_heuristic_fn(args.model_dir, device, on_gpu, env.get_nnet_model(),
     #                                             env, clip_zero=True, batch_size=args.nnet_batch_size)
 
-    max_bytes: int = 4096
     while True:
-        data_rec = connection.recv(8)
-        while not data_rec:
-            connection, client_address = sock.accept()
-            data_rec = connection.recv(8)
-
-        num_bytes_recv = np.frombuffer(data_rec, dtype=np.int64)[0]
-
-        num_bytes_seen = 0
-        data_rec = b""
-        while num_bytes_seen < num_bytes_recv:
-            con_rec = connection.recv(max_bytes)
-            data_rec = data_rec + con_rec
-            num_bytes_seen = num_bytes_seen + len(con_rec)
-
-        states_np = np.frombuffer(data_rec, dtype=env.dtype)
-        states_np = states_np.reshape(int(len(states_np)/state_dim), state_dim)
+        states_np = transport.recv_states()
+        while states_np is None:
+            transport.accept()
+            states_np = transport.recv_states()
 
         # Get nnet representation of state
         if args.env.upper() in ['CUBE2', 'CUBE3_SOLVED_CORNERS', 'CUBE3']:
@@ -610,31 +1078,11 @@ def cpp_listener(sock, args, env: Environment, state_dim: int, heur_fn_i_q, heur
             raise ValueError("Unknown c++ environment %s" % args.env)
 
         # get heuristic
-        results = heuristic_fn_par(states_nnet, heur_fn_i_q, heur_fn_o_qs)
+        results = nnet_utils.heuristic_fn_par_nnet(states_nnet, heur_fn_i_q, heur_fn_o_qs,
+                                                   batch_size=args.nnet_batch_size)
 
         # send results
-        connection.sendall(results.astype(np.float32))
-
-
-def heuristic_fn_par(states_nnet: List[np.ndarray], heur_fn_i_q, heur_fn_o_qs):
-    num_parallel: int = len(heur_fn_o_qs)
-
-    num_states: int = states_nnet[0].shape[0]
-
-    parallel_nums = range(min(num_parallel, num_states))
-    split_idxs = np.array_split(np.arange(num_states), len(parallel_nums))
-    for idx in parallel_nums:
-        states_nnet_idx = [x[split_idxs[idx]] for x in states_nnet]
-        heur_fn_i_q.put((idx, states_nnet_idx))
-
-    # Check until all data is obtaied
-    results = [None]*len(parallel_nums)
-    for idx in parallel_nums:
-        results[idx] = heur_fn_o_qs[idx].get()
-
-    results = np.concatenate(results, axis=0)
-
-    return results
+        transport.send_heuristics(results)
 
 
 if __name__ == "__main__":
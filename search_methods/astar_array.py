@@ -0,0 +1,511 @@
+from typing import List, Tuple, Dict, Callable, Optional
+from environments.environment_abstract import Environment, State
+from search_methods.closed_set import FingerprintTable, unique_states
+from search_methods.open_set import get_open_set
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, Future
+import time
+
+
+class NodeStore:
+    """ Search nodes stored as growable numpy arrays (struct-of-arrays). A node is referred to by its integer id,
+    which is its index in the arrays.
+    """
+    fields: List[str] = ['states', 'path_costs', 'heuristics', 'costs', 'parents', 'parent_moves', 'is_solved']
+
+    def __init__(self, state_shape: Tuple[int, ...], state_dtype, capacity: int = 1024):
+        self.num_nodes: int = 0
+        self.capacity: int = capacity
+
+        self.states: np.ndarray = np.zeros((capacity,) + tuple(state_shape), dtype=state_dtype)
+        self.path_costs: np.ndarray = np.zeros(capacity, dtype=np.float64)
+        self.heuristics: np.ndarray = np.zeros(capacity, dtype=np.float64)
+        self.costs: np.ndarray = np.zeros(capacity, dtype=np.float64)
+        self.parents: np.ndarray = np.zeros(capacity, dtype=np.int64)
+        self.parent_moves: np.ndarray = np.zeros(capacity, dtype=np.int32)
+        self.is_solved: np.ndarray = np.zeros(capacity, dtype=bool)
+
+    def add(self, states_np: np.ndarray, path_costs: np.ndarray, heuristics: np.ndarray, costs: np.ndarray,
+            is_solved: np.ndarray, parents: np.ndarray, parent_moves: np.ndarray) -> np.ndarray:
+        num_add: int = states_np.shape[0]
+        self._reserve(self.num_nodes + num_add)
+
+        start_idx: int = self.num_nodes
+        end_idx: int = start_idx + num_add
+
+        self.states[start_idx:end_idx] = states_np
+        self.path_costs[start_idx:end_idx] = path_costs
+        self.heuristics[start_idx:end_idx] = heuristics
+        self.costs[start_idx:end_idx] = costs
+        self.is_solved[start_idx:end_idx] = is_solved
+        self.parents[start_idx:end_idx] = parents
+        self.parent_moves[start_idx:end_idx] = parent_moves
+
+        self.num_nodes = end_idx
+
+        return np.arange(start_idx, end_idx)
+
+    def get_node_ids_to_root(self, node_id: int) -> List[int]:
+        node_ids: List[int] = []
+        while node_id >= 0:
+            node_ids.append(node_id)
+            node_id = int(self.parents[node_id])
+
+        return node_ids[::-1]
+
+    def _reserve(self, num_nodes: int):
+        if num_nodes <= self.capacity:
+            return
+
+        capacity_new: int = max(num_nodes, 2 * self.capacity)
+        for field in self.fields:
+            arr: np.ndarray = getattr(self, field)
+            arr_new: np.ndarray = np.zeros((capacity_new,) + arr.shape[1:], dtype=arr.dtype)
+            arr_new[:self.num_nodes] = arr[:self.num_nodes]
+            setattr(self, field, arr_new)
+
+        self.capacity = capacity_new
+
+
+class ArrayInstance:
+
+    def __init__(self, root_state_np: np.ndarray, root_is_solved: bool, root_heuristic: float, root_cost: float,
+                 open_set: str = "heap", canonicalize: bool = False, env: Optional[Environment] = None):
+        self.nodes: NodeStore = NodeStore(root_state_np.shape, root_state_np.dtype)
+        self.open_set = get_open_set(open_set)
+        self.canonicalize: bool = canonicalize
+        self.env: Optional[Environment] = env
+        self.closed_set: FingerprintTable = FingerprintTable()
+        self.goal_node_ids: List[int] = []
+        self.num_nodes_generated: int = 0
+        self.num_nodes_evaluated: int = 0
+
+        root_ids: np.ndarray = self.nodes.add(np.expand_dims(root_state_np, 0), np.zeros(1), np.array([root_heuristic]),
+                                              np.array([root_cost]), np.array([root_is_solved]), np.array([-1]),
+                                              np.array([-1]))
+        self.root_node_id: int = int(root_ids[0])
+
+        self.push_to_open(root_ids)
+
+    def push_to_open(self, node_ids: np.ndarray):
+        self.open_set.push(self.nodes.costs[node_ids].tolist(), node_ids.tolist())
+
+    def pop_from_open(self, num_nodes: int) -> np.ndarray:
+        popped_ids: np.ndarray = np.array(self.open_set.pop(num_nodes), dtype=np.int64)
+        self.goal_node_ids.extend(popped_ids[self.nodes.is_solved[popped_ids]].tolist())
+
+        return popped_ids
+
+    def remove_in_closed(self, states_np: np.ndarray, path_costs: np.ndarray) -> np.ndarray:
+        if self.canonicalize:
+            states_np, _ = self.env.canonicalize_np(states_np)
+
+        return self.closed_set.insert_or_improve(states_np, path_costs)
+
+
+class Children:
+    """ Children of the nodes popped from one instance, flattened in (parent, move) order """
+    __slots__ = ['states', 'path_costs', 'is_solved', 'parents', 'parent_moves']
+
+    def __init__(self, states: np.ndarray, path_costs: np.ndarray, is_solved: np.ndarray, parents: np.ndarray,
+                 parent_moves: np.ndarray):
+        self.states: np.ndarray = states
+        self.path_costs: np.ndarray = path_costs
+        self.is_solved: np.ndarray = is_solved
+        self.parents: np.ndarray = parents
+        self.parent_moves: np.ndarray = parent_moves
+
+    def get_subset(self, mask: np.ndarray):
+        return Children(self.states[mask], self.path_costs[mask], self.is_solved[mask], self.parents[mask],
+                        self.parent_moves[mask])
+
+
+def expand_nodes(instances: List[ArrayInstance], popped_ids_all: List[np.ndarray], env: Environment,
+                 prune_moves: bool = False) -> List[Children]:
+    # Get children of all nodes at once (for speed)
+    num_popped: List[int] = [len(popped_ids) for popped_ids in popped_ids_all]
+    if sum(num_popped) == 0:
+        return [Children(np.zeros((0,) + instance.nodes.states.shape[1:], dtype=instance.nodes.states.dtype),
+                         np.zeros(0), np.zeros(0, dtype=bool), np.zeros(0, dtype=np.int64),
+                         np.zeros(0, dtype=np.int32)) for instance in instances]
+
+    states_np: np.ndarray = np.concatenate([instance.nodes.states[popped_ids] for instance, popped_ids in
+                                            zip(instances, popped_ids_all)], axis=0)
+    path_costs: np.ndarray = np.concatenate([instance.nodes.path_costs[popped_ids] for instance, popped_ids in
+                                             zip(instances, popped_ids_all)], axis=0)
+
+    # moves that are pruned after the move that generated the node are not applied
+    parent_moves: Optional[np.ndarray] = None
+    if prune_moves:
+        parent_moves = np.concatenate([instance.nodes.parent_moves[popped_ids] for instance, popped_ids in
+                                       zip(instances, popped_ids_all)], axis=0)
+    moves_allowed: np.ndarray = env.get_moves_allowed(states_np.shape[0], parent_moves)
+
+    states_c_np: np.ndarray
+    tcs: np.ndarray
+    states_c_np, tcs = env.expand_np(states_np, parent_moves)
+    num_moves: int = tcs.shape[1]
+
+    # Flatten children and get is_solved and path costs on all states at once (for speed)
+    is_child: np.ndarray = moves_allowed.flatten()
+    states_c_np = states_c_np.reshape((-1,) + states_c_np.shape[2:])[is_child]
+    is_solved_c: np.ndarray = env.is_solved_np(states_c_np)
+    path_costs_c: np.ndarray = (np.expand_dims(path_costs, 1) + tcs).flatten()[is_child]
+    parents_c: np.ndarray = np.repeat(np.concatenate(popped_ids_all), num_moves)[is_child]
+    parent_moves_c: np.ndarray = np.tile(np.arange(num_moves, dtype=np.int32), states_np.shape[0])[is_child]
+
+    # Split by instance
+    num_children_cum: np.ndarray = np.concatenate(([0], np.cumsum(np.sum(moves_allowed, axis=1))))
+    split_idxs: np.ndarray = num_children_cum[np.cumsum(num_popped)[:-1]]
+    children_all: List[Children] = []
+    for inst_idx, (states_c_inst, path_costs_c_inst, is_solved_c_inst, parents, parent_moves_inst) in enumerate(zip(
+            np.split(states_c_np, split_idxs), np.split(path_costs_c, split_idxs), np.split(is_solved_c, split_idxs),
+            np.split(parents_c, split_idxs), np.split(parent_moves_c, split_idxs))):
+        children_all.append(Children(states_c_inst, path_costs_c_inst, is_solved_c_inst, parents, parent_moves_inst))
+
+        instances[inst_idx].num_nodes_generated += states_c_inst.shape[0]
+
+    return children_all
+
+
+def compute_heuristic_and_cost(states_np: np.ndarray, path_costs: np.ndarray, is_solved: np.ndarray,
+                               heuristic_fn: Callable, env: Environment,
+                               weights: np.ndarray, canonicalize: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    if states_np.shape[0] == 0:
+        return np.zeros(0), np.zeros(0)
+
+    # identical states are only evaluated once, with canonicalize states are evaluated as their canonical state
+    if canonicalize:
+        states_np, _ = env.canonicalize_np(states_np)
+    first_idxs, inverse = unique_states(states_np)
+    heuristics: np.ndarray = heuristic_fn(env.np_to_nnet_input(states_np[first_idxs]), is_nnet_format=True)[inverse]
+    costs: np.ndarray = weights * path_costs + heuristics * np.logical_not(is_solved)
+
+    return heuristics, costs
+
+
+def timed_heuristic_and_cost(states_np: np.ndarray, path_costs: np.ndarray, is_solved: np.ndarray,
+                             heuristic_fn: Callable, env: Environment,
+                             weights: np.ndarray, canonicalize: bool = False) -> Tuple[np.ndarray, np.ndarray, float]:
+    start_time = time.time()
+    heuristics, costs = compute_heuristic_and_cost(states_np, path_costs, is_solved, heuristic_fn, env, weights,
+                                                   canonicalize=canonicalize)
+
+    return heuristics, costs, time.time() - start_time
+
+
+def remove_in_closed(instances: List[ArrayInstance], children_all: List[Children]) -> List[Children]:
+    return [children.get_subset(instance.remove_in_closed(children.states, children.path_costs))
+            for instance, children in zip(instances, children_all)]
+
+
+def add_children(instances: List[ArrayInstance], children_all: List[Children], heuristics: np.ndarray,
+                 costs: np.ndarray):
+    split_idxs: np.ndarray = np.cumsum([children.states.shape[0] for children in children_all])[:-1]
+    for instance, children, heuristics_inst, costs_inst in zip(instances, children_all,
+                                                               np.split(heuristics, split_idxs),
+                                                               np.split(costs, split_idxs)):
+        node_ids: np.ndarray = instance.nodes.add(children.states, children.path_costs, heuristics_inst, costs_inst,
+                                                  children.is_solved, children.parents, children.parent_moves)
+        instance.push_to_open(node_ids)
+
+
+def get_path(instance: ArrayInstance, node_id: int, env: Environment) -> Tuple[List[State], List[int], float]:
+    node_ids: List[int] = instance.nodes.get_node_ids_to_root(node_id)
+
+    path: List[State] = env.np_to_states(instance.nodes.states[node_ids])
+    moves: List[int] = instance.nodes.parent_moves[node_ids[1:]].tolist()
+
+    return path, moves, float(instance.nodes.path_costs[node_id])
+
+
+def print_pipelined_step(step_num: int, path_costs: np.ndarray, heuristics: np.ndarray, pop_time: float,
+                         expand_time: float, check_time: float, heur_time: float, wait_time: float,
+                         overlap_time: float, add_time: float, itr_time: float):
+    """ Print a step of a pipelined A* search (AStar or ArrayAStar), where the children added to open are those of the
+    previous step
+
+    @param step_num: Step number
+    @param path_costs: Path costs of the children added to open
+    @param heuristics: Their heuristic values
+    """
+    if heuristics.shape[0] > 0:
+        min_heur = np.min(heuristics)
+        min_heur_pc = path_costs[np.argmin(heuristics)]
+        max_heur = np.max(heuristics)
+        max_heur_pc = path_costs[np.argmax(heuristics)]
+
+        print("Itr: %i, Added to OPEN - Min/Max Heur(PathCost): "
+              "%.2f(%.2f)/%.2f(%.2f) " % (step_num, min_heur, min_heur_pc, max_heur, max_heur_pc))
+
+    print("Times - pop: %.2f, expand: %.2f, check: %.2f, heur: %.2f, wait: %.2f, overlap: %.2f, "
+          "add: %.2f, itr: %.2f" % (pop_time, expand_time, check_time, heur_time, wait_time, overlap_time,
+                                    add_time, itr_time))
+
+    print("")
+
+
+class ArrayAStar:
+    """ Batch weighted A* search that stores nodes in numpy arrays instead of Node objects. Produces the same
+    results as search_methods.astar.AStar, including in pipelined mode.
+
+    Nodes do not keep their children, so, as with AStar(lean=True), children are checked against closed before the
+    heuristic function is called and only children added to open are evaluated, each unique state once.
+
+    With prune_moves=True, moves pruned by the move prune table of the environment (Environment.get_move_prune_table)
+    after the move that generated a node are not applied when the node is expanded.
+
+    With canonicalize=True, symmetric states are treated as the same state in the closed set and the heuristic
+    function, as with AStar(canonicalize=True).
+    """
+
+    def __init__(self, states: List[State], env: Environment, heuristic_fn: Callable, weights: List[float],
+                 pipeline: bool = False, open_set: str = "heap", prune_moves: bool = False,
+                 canonicalize: bool = False):
+        self.env: Environment = env
+        self.open_set: str = open_set
+        self.prune_moves: bool = prune_moves
+        self.canonicalize: bool = canonicalize
+        self.weights: List[float] = []
+        self.step_num: int = 0
+
+        self.timings: Dict[str, float] = {"pop": 0.0, "expand": 0.0, "check": 0.0, "heur": 0.0,
+                                          "add": 0.0, "itr": 0.0}
+
+        self.pipeline: bool = pipeline
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.pending: Optional[Tuple[List[ArrayInstance], List[Children], np.ndarray, Future]] = None
+        if self.pipeline:
+            self.executor = ThreadPoolExecutor(max_workers=1)
+            self.timings.update({"wait": 0.0, "overlap": 0.0})
+
+        self.instances: List[ArrayInstance] = []
+        self.add_instances(states, heuristic_fn, weights)
+
+    def add_instances(self, states: List[State], heuristic_fn: Callable, weights: List[float]):
+        # the heuristic function must not be called while it evaluates the batch of the pipelined step
+        self.finish_pending()
+
+        # compute starting costs
+        states_np: np.ndarray = self.env.states_to_np(states)
+        is_solved_states: np.ndarray = self.env.is_solved_np(states_np)
+        heuristics, costs = compute_heuristic_and_cost(states_np, np.zeros(len(states)), is_solved_states,
+                                                       heuristic_fn, self.env, np.array(weights),
+                                                       canonicalize=self.canonicalize)
+
+        # initialize instances
+        for state_np, is_solved, heuristic, cost in zip(states_np, is_solved_states, heuristics, costs):
+            self.instances.append(ArrayInstance(state_np, is_solved, heuristic, cost, open_set=self.open_set,
+                                                canonicalize=self.canonicalize, env=self.env))
+        self.weights.extend(weights)
+
+    def remove_instance(self, inst_idx: int) -> ArrayInstance:
+        self.weights.pop(inst_idx)
+
+        return self.instances.pop(inst_idx)
+
+    def step(self, heuristic_fn: Callable, batch_size: int, include_solved: bool = False, verbose: bool = False):
+        if self.pipeline:
+            self._step_pipelined(heuristic_fn, batch_size, include_solved=include_solved, verbose=verbose)
+            return
+
+        start_time_itr = time.time()
+        inst_idxs: List[int] = self._get_step_inst_idxs(include_solved)
+        instances: List[ArrayInstance] = [self.instances[idx] for idx in inst_idxs]
+        if len(inst_idxs) == 0:
+            # every instance is solved
+            self.step_num += 1
+            return
+
+        # Pop from open
+        start_time = time.time()
+        popped_ids_all: List[np.ndarray] = [instance.pop_from_open(batch_size) for instance in instances]
+        pop_time = time.time() - start_time
+
+        # Expand nodes
+        start_time = time.time()
+        children_all: List[Children] = expand_nodes(instances, popped_ids_all, self.env, prune_moves=self.prune_moves)
+        expand_time = time.time() - start_time
+
+        # Check if children are in closed
+        start_time = time.time()
+        children_all = remove_in_closed(instances, children_all)
+        check_time = time.time() - start_time
+
+        # Get heuristic of children added to open
+        start_time = time.time()
+        states_np, path_costs, is_solved, weights = self._concat_children(instances, inst_idxs, children_all)
+        heuristics, costs = compute_heuristic_and_cost(states_np, path_costs, is_solved, heuristic_fn, self.env,
+                                                       weights, canonicalize=self.canonicalize)
+        heur_time = time.time() - start_time
+
+        # Add to node store and open
+        start_time = time.time()
+        add_children(instances, children_all, heuristics, costs)
+        add_time = time.time() - start_time
+
+        itr_time = time.time() - start_time_itr
+
+        # Print to screen
+        if verbose:
+            if heuristics.shape[0] > 0:
+                min_heur = np.min(heuristics)
+                min_heur_pc = path_costs[np.argmin(heuristics)]
+                max_heur = np.max(heuristics)
+                max_heur_pc = path_costs[np.argmax(heuristics)]
+
+                print("Itr: %i, Added to OPEN - Min/Max Heur(PathCost): "
+                      "%.2f(%.2f)/%.2f(%.2f) " % (self.step_num, min_heur, min_heur_pc, max_heur, max_heur_pc))
+
+            print("Times - pop: %.2f, expand: %.2f, check: %.2f, heur: %.2f, "
+                  "add: %.2f, itr: %.2f" % (pop_time, expand_time, check_time, heur_time, add_time, itr_time))
+
+            print("")
+
+        # Update timings
+        self.timings['pop'] += pop_time
+        self.timings['expand'] += expand_time
+        self.timings['check'] += check_time
+        self.timings['heur'] += heur_time
+        self.timings['add'] += add_time
+        self.timings['itr'] += itr_time
+
+        self.step_num += 1
+
+    def finish_pending(self) -> Tuple[np.ndarray, np.ndarray, float, float]:
+        """ Wait for the children being evaluated in pipelined mode and add them to the node store and open
+
+        @return: path costs and heuristics of the children, time spent evaluating them, time spent waiting
+        """
+        if self.pending is None:
+            return np.zeros(0), np.zeros(0), 0.0, 0.0
+
+        instances, children_all, path_costs, future = self.pending
+        self.pending = None
+
+        start_time = time.time()
+        heuristics, costs, heur_time = future.result()
+        wait_time = time.time() - start_time
+
+        add_children(instances, children_all, heuristics, costs)
+
+        return path_costs, heuristics, heur_time, wait_time
+
+    def close(self):
+        """ Wait for the children being evaluated in pipelined mode, add them to the node store and open, and stop the
+        thread that evaluates them. The heuristic function can then be called by another search.
+        """
+        try:
+            self.finish_pending()
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
+
+    def _step_pipelined(self, heuristic_fn: Callable, batch_size: int, include_solved: bool = False,
+                        verbose: bool = False):
+        start_time_itr = time.time()
+        inst_idxs: List[int] = self._get_step_inst_idxs(include_solved)
+        instances: List[ArrayInstance] = [self.instances[idx] for idx in inst_idxs]
+        if len(inst_idxs) == 0:
+            # every instance is solved, the batch being evaluated can still add children to them
+            self.finish_pending()
+            self.step_num += 1
+            return
+
+        # Wait for the batch being evaluated if nothing else can be popped
+        path_costs: np.ndarray = np.zeros(0)
+        heuristics: np.ndarray = np.zeros(0)
+        heur_time: float = 0.0
+        wait_time: float = 0.0
+        add_time: float = 0.0
+        if all(len(instance.open_set) == 0 for instance in instances):
+            start_time = time.time()
+            path_costs, heuristics, heur_time, wait_time = self.finish_pending()
+            add_time = time.time() - start_time - wait_time
+
+        # Pop from open, children of the batch being evaluated are not in open yet
+        start_time = time.time()
+        popped_ids_all: List[np.ndarray] = [instance.pop_from_open(batch_size) for instance in instances]
+        pop_time = time.time() - start_time
+
+        # Expand nodes
+        start_time = time.time()
+        children_all: List[Children] = expand_nodes(instances, popped_ids_all, self.env, prune_moves=self.prune_moves)
+        expand_time = time.time() - start_time
+
+        # Check if children are in closed
+        start_time = time.time()
+        children_all = remove_in_closed(instances, children_all)
+        check_time = time.time() - start_time
+
+        # Wait for the previous batch and add its children to the node store and open
+        if self.pending is not None:
+            start_time = time.time()
+            path_costs, heuristics, heur_time, wait_time = self.finish_pending()
+            add_time = time.time() - start_time - wait_time
+
+        # Evaluate children of this batch in the background
+        states_np, path_costs_c, is_solved, weights = self._concat_children(instances, inst_idxs, children_all)
+        if states_np.shape[0] > 0:
+            future: Future = self.executor.submit(timed_heuristic_and_cost, states_np, path_costs_c, is_solved,
+                                                  heuristic_fn, self.env, weights, canonicalize=self.canonicalize)
+            self.pending = (instances, children_all, path_costs_c, future)
+
+        itr_time = time.time() - start_time_itr
+        overlap_time = max(heur_time - wait_time, 0.0)
+
+        # Print to screen
+        if verbose:
+            print_pipelined_step(self.step_num, path_costs, heuristics, pop_time, expand_time, check_time,
+                                 heur_time, wait_time, overlap_time, add_time, itr_time)
+
+        # Update timings
+        self.timings['pop'] += pop_time
+        self.timings['expand'] += expand_time
+        self.timings['check'] += check_time
+        self.timings['heur'] += heur_time
+        self.timings['wait'] += wait_time
+        self.timings['overlap'] += overlap_time
+        self.timings['add'] += add_time
+        self.timings['itr'] += itr_time
+
+        self.step_num += 1
+
+    def _get_step_inst_idxs(self, include_solved: bool) -> List[int]:
+        if include_solved:
+            return list(range(len(self.instances)))
+        else:
+            return [idx for idx, instance in enumerate(self.instances) if len(instance.goal_node_ids) == 0]
+
+    def _concat_children(self, instances: List[ArrayInstance], inst_idxs: List[int],
+                         children_all: List[Children]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        # also counts the nodes sent to the heuristic function
+        num_children: List[int] = [children.states.shape[0] for children in children_all]
+        for instance, num_children_inst in zip(instances, num_children):
+            instance.num_nodes_evaluated += num_children_inst
+
+        weights: np.ndarray = np.repeat(np.array([self.weights[idx] for idx in inst_idxs], dtype=np.float64),
+                                        num_children)
+        states_np: np.ndarray = np.concatenate([children.states for children in children_all])
+        path_costs: np.ndarray = np.concatenate([children.path_costs for children in children_all])
+        is_solved: np.ndarray = np.concatenate([children.is_solved for children in children_all])
+
+        return states_np, path_costs, is_solved, weights
+
+    def has_found_goal(self) -> List[bool]:
+        goal_found: List[bool] = [len(instance.goal_node_ids) > 0 for instance in self.instances]
+
+        return goal_found
+
+    def get_goal_node_smallest_path_cost(self, inst_idx: int) -> int:
+        instance: ArrayInstance = self.instances[inst_idx]
+        path_costs: np.ndarray = instance.nodes.path_costs[instance.goal_node_ids]
+
+        return instance.goal_node_ids[int(np.argmin(path_costs))]
+
+    def get_num_nodes_generated(self, inst_idx: int) -> int:
+        return self.instances[inst_idx].num_nodes_generated
+
+    def get_num_nodes_evaluated(self, inst_idx: int) -> int:
+        return self.instances[inst_idx].num_nodes_evaluated
@@ -0,0 +1,187 @@
+from typing import List, Dict, Any, Callable, Optional, Tuple, Union, Sequence
+from environments.environment_abstract import Environment, State
+import numpy as np
+import ctypes
+import os
+
+
+_lib_path: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cpp", "libweighted_astar.so")
+_lib: Optional[ctypes.CDLL] = None
+
+_heuristic_callback_t = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.POINTER(ctypes.c_uint8), ctypes.c_size_t,
+                                         ctypes.c_size_t, ctypes.POINTER(ctypes.c_float))
+_result_callback_t = ctypes.CFUNCTYPE(None, ctypes.c_int, ctypes.c_int, ctypes.POINTER(ctypes.c_int), ctypes.c_int,
+                                      ctypes.c_long, ctypes.c_long, ctypes.c_int, ctypes.c_double,
+                                      ctypes.POINTER(ctypes.c_uint8), ctypes.POINTER(ctypes.c_float), ctypes.c_int)
+
+
+def _load_lib() -> ctypes.CDLL:
+    global _lib
+    if _lib is None:
+        if not os.path.isfile(_lib_path):
+            raise FileNotFoundError("%s not found, build it with make in cpp/" % os.path.normpath(_lib_path))
+
+        _lib = ctypes.CDLL(_lib_path)
+        _lib.solve.argtypes = [ctypes.c_char_p, ctypes.POINTER(ctypes.c_uint8), ctypes.c_size_t, ctypes.c_size_t,
+                               ctypes.POINTER(ctypes.c_float), ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                               ctypes.c_int, _heuristic_callback_t, _result_callback_t]
+        _lib.solve.restype = ctypes.c_int
+        _lib.nnet_heuristics.argtypes = [ctypes.c_char_p, ctypes.POINTER(ctypes.c_uint8), ctypes.c_size_t,
+                                         ctypes.c_size_t, ctypes.POINTER(ctypes.c_float)]
+        _lib.nnet_heuristics.restype = ctypes.c_int
+        _lib.get_num_actions.argtypes = [ctypes.c_char_p, ctypes.c_size_t]
+        _lib.get_num_actions.restype = ctypes.c_int
+        _lib.expand_batch.argtypes = [ctypes.c_char_p, ctypes.POINTER(ctypes.c_uint8), ctypes.c_size_t,
+                                      ctypes.c_size_t, ctypes.POINTER(ctypes.c_uint8),
+                                      ctypes.POINTER(ctypes.c_double), ctypes.POINTER(ctypes.c_uint8)]
+        _lib.expand_batch.restype = ctypes.c_int
+
+    return _lib
+
+
+def lib_available() -> bool:
+    """ Whether cpp/libweighted_astar.so is built """
+    return os.path.isfile(_lib_path)
+
+
+def solve(env_name: str, env: Environment, states: List[State], weight: Union[float, Sequence[float]], batch_size: int,
+          heuristic_fn: Callable, num_instances: int = 1, verbose: bool = False,
+          on_result: Optional[Callable[[Dict[str, Any]], None]] = None, max_iterations: int = 0,
+          record_popped: bool = False) -> List[Dict[str, Any]]:
+    """ Solve states with the C++ weighted A* search (cpp/libweighted_astar.so) in this process. The heuristic function
+    gets a view of the children that are evaluated, with no copy.
+
+    @param env_name: Name of the C++ environment (e.g. cube3, puzzle15)
+    @param env: Environment
+    @param states: States to solve
+    @param weight: Weight on the path cost, for all states or for each state
+    @param batch_size: Number of nodes expanded by each search at each iteration
+    @param heuristic_fn: Heuristic function
+    @param num_instances: Number of states searched at the same time
+    @param verbose: Print information about each iteration
+    @param on_result: Called with the result of each state when its search is done
+    @param max_iterations: If greater than 0, each search stops after this many iterations, solved or not
+    @param record_popped: Also return the nodes popped by each search, see the return value
+    @return: Result of each state, with keys state, solved, moves, nodes_generated, nodes_evaluated, iterations and
+    time. With record_popped, also popped_states_np, the packed states of the expanded nodes and of the popped solved
+    nodes, and popped_bellman, their Bellman backups: 0 if solved, else the minimum over children of the transition
+    cost plus the heuristic value of the child.
+    """
+    lib: ctypes.CDLL = _load_lib()
+    if len(states) == 0:
+        return []
+
+    states_np_env: np.ndarray = env.states_to_np(states)
+    states_np: np.ndarray = np.ascontiguousarray(states_np_env.astype(np.uint8))
+    weights_np: np.ndarray = np.ascontiguousarray(np.broadcast_to(np.asarray(weight, dtype=np.float32),
+                                                                  (len(states),)))
+    results: List[Optional[Dict[str, Any]]] = [None] * len(states)
+    errors: List[BaseException] = []
+
+    def heuristic_callback(states_ptr, num_states: int, state_dim: int, values_ptr) -> int:
+        if num_states == 0:
+            return 0
+
+        try:
+            states_c_np: np.ndarray = np.ctypeslib.as_array(states_ptr, shape=(num_states, state_dim))
+            values_np: np.ndarray = np.ctypeslib.as_array(values_ptr, shape=(num_states,))
+            values_np[:] = heuristic_fn(env.np_to_nnet_input(states_c_np), is_nnet_format=True)
+        except BaseException as e:
+            errors.append(e)
+            return 1
+
+        return 0
+
+    def result_callback(state_idx: int, solved: int, moves_ptr, num_moves: int, num_nodes_gen: int,
+                        num_nodes_eval: int, num_itrs: int, solve_time: float, popped_states_ptr, popped_bellman_ptr,
+                        num_popped: int):
+        result: Dict[str, Any] = {"state": state_idx, "solved": bool(solved),
+                                  "moves": [int(moves_ptr[i]) for i in range(num_moves)],
+                                  "nodes_generated": num_nodes_gen, "nodes_evaluated": num_nodes_eval,
+                                  "iterations": num_itrs, "time": solve_time}
+        if record_popped:
+            # the buffers are freed when the callback returns, so they are copied
+            popped_states_np: np.ndarray = np.zeros((num_popped, states_np.shape[1]), dtype=states_np_env.dtype)
+            popped_bellman: np.ndarray = np.zeros(num_popped, dtype=np.float32)
+            if num_popped > 0:
+                popped_states_np[:] = np.ctypeslib.as_array(popped_states_ptr, shape=popped_states_np.shape)
+                popped_bellman[:] = np.ctypeslib.as_array(popped_bellman_ptr, shape=(num_popped,))
+            result["popped_states_np"] = popped_states_np
+            result["popped_bellman"] = popped_bellman
+        results[state_idx] = result
+
+        if on_result is not None:
+            try:
+                on_result(result)
+            except BaseException as e:
+                errors.append(e)
+
+    # keep references to the callbacks for as long as the search runs
+    heuristic_callback_c = _heuristic_callback_t(heuristic_callback)
+    result_callback_c = _result_callback_t(result_callback)
+
+    ret: int = lib.solve(env_name.encode(), states_np.ctypes.data_as(ctypes.POINTER(ctypes.c_uint8)),
+                         states_np.shape[0], states_np.shape[1],
+                         weights_np.ctypes.data_as(ctypes.POINTER(ctypes.c_float)), batch_size, num_instances,
+                         max_iterations, int(record_popped), int(verbose), heuristic_callback_c, result_callback_c)
+
+    if len(errors) > 0:
+        raise errors[0]
+    if ret == 1:
+        raise ValueError("Unknown c++ environment: %s" % env_name)
+    assert ret == 0, "solve returned %i" % ret
+
+    return results
+
+
+def nnet_heuristics(nnet_file: str, states_np: np.ndarray) -> np.ndarray:
+    """ Heuristic values given by the C++ evaluation of a nnet exported with nnet_utils.export_resnet
+
+    @param nnet_file: Exported nnet
+    @param states_np: Packed states
+    @return: float32 numpy array of heuristic values, clipped at zero
+    """
+    lib: ctypes.CDLL = _load_lib()
+
+    states_np = np.ascontiguousarray(states_np.astype(np.uint8))
+    values_np: np.ndarray = np.zeros(states_np.shape[0], dtype=np.float32)
+    ret: int = lib.nnet_heuristics(nnet_file.encode(), states_np.ctypes.data_as(ctypes.POINTER(ctypes.c_uint8)),
+                                   states_np.shape[0], states_np.shape[1],
+                                   values_np.ctypes.data_as(ctypes.POINTER(ctypes.c_float)))
+    if ret == 1:
+        raise ValueError("Could not read nnet file %s" % nnet_file)
+    elif ret == 2:
+        raise ValueError("States do not match the nnet in %s" % nnet_file)
+
+    return values_np
+
+
+def expand_batch(env_name: str, states_np: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ Expand packed states with the C++ environment (cpp/environments.cpp). Every move costs 1.
+
+    @param env_name: Name of the C++ environment (e.g. cube3, puzzle15)
+    @param states_np: Packed states of the C++ environment, with shape (num_states, state_dim)
+    @return: Children with shape (num_states, num_moves, state_dim), transition costs and whether each child is
+    solved, with shape (num_states, num_moves)
+    """
+    lib: ctypes.CDLL = _load_lib()
+
+    num_states: int = states_np.shape[0]
+    state_dim: int = states_np.shape[1]
+    num_moves: int = lib.get_num_actions(env_name.encode(), state_dim)
+    if num_moves < 0:
+        raise ValueError("Unknown c++ environment: %s" % env_name)
+
+    states_np = np.ascontiguousarray(states_np.astype(np.uint8))
+    states_c_np: np.ndarray = np.empty((num_states, num_moves, state_dim), dtype=np.uint8)
+    tc: np.ndarray = np.empty((num_states, num_moves), dtype=np.float64)
+    is_solved: np.ndarray = np.empty((num_states, num_moves), dtype=np.uint8)
+    if num_states == 0:
+        return states_c_np, tc, is_solved.astype(bool)
+
+    lib.expand_batch(env_name.encode(), states_np.ctypes.data_as(ctypes.POINTER(ctypes.c_uint8)), num_states,
+                     state_dim, states_c_np.ctypes.data_as(ctypes.POINTER(ctypes.c_uint8)),
+                     tc.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
+                     is_solved.ctypes.data_as(ctypes.POINTER(ctypes.c_uint8)))
+
+    return states_c_np, tc, is_solved.view(bool)
@@ -0,0 +1,259 @@
+from typing import List, Dict, Any, Optional, Callable, Deque
+from collections import deque
+from concurrent.futures import Future
+from environments.environment_abstract import Environment, State
+from search_methods import astar as astar_module
+import numpy as np
+import threading
+import asyncio
+import time
+
+
+class _Request:
+    def __init__(self, state: State, weight: float, deadline: Optional[float]):
+        self.state: State = state
+        self.weight: float = weight
+        self.deadline: Optional[float] = deadline
+        self.future: Future = Future()
+        self.submit_time: float = time.time()
+        self.start_time: float = 0.0
+        self.num_itrs: int = 0
+
+    def is_expired(self, curr_time: float) -> bool:
+        return (self.deadline is not None) and (curr_time >= self.deadline)
+
+
+def _set_exception(future: Future, exception: BaseException):
+    # a request that was not admitted is still pending, set_running_or_notify_cancel is False if it was cancelled
+    if future.done():
+        return
+
+    if future.running() or future.set_running_or_notify_cancel():
+        future.set_exception(exception)
+
+
+class AsyncSolver:
+    """ Solves states submitted by concurrent callers in one batch weighted A* search (see astar.AStar)
+
+    A worker thread admits submitted states as new instances of the search between steps, up to max_instances at a
+    time, and retires instances as soon as they are solved, so states of all requests share each batch given to the
+    heuristic function. States wait in a queue while all instances are in use.
+
+    Each state is searched with its own weight. A request whose deadline passes before its state is solved raises
+    TimeoutError. A request cancelled while it waits in the queue is never searched. Once admitted, its future is
+    running and can no longer be cancelled.
+
+    get_metrics gives the queue depth and how full the batches were.
+    """
+
+    def __init__(self, env: Environment, heuristic_fn: Callable, batch_size: int, weight: float = 1.0,
+                 max_instances: int = 100, engine: str = "object", open_set: str = "heap", pipeline: bool = False,
+                 prune_moves: bool = False, canonicalize: bool = False):
+        """
+        @param env: Environment
+        @param heuristic_fn: Heuristic function
+        @param batch_size: Number of nodes popped from each instance at each step
+        @param weight: Weight of path cost of states submitted without a weight
+        @param max_instances: Largest number of states searched at once
+        @param engine: "object" or "array", see astar.create_astar
+        """
+        self.env: Environment = env
+        self.heuristic_fn: Callable = heuristic_fn
+        self.batch_size: int = batch_size
+        self.weight: float = weight
+        self.max_instances: int = max_instances
+        self.engine: str = engine
+        self.search_kwargs: Dict[str, Any] = {"open_set": open_set, "pipeline": pipeline, "prune_moves": prune_moves,
+                                              "canonicalize": canonicalize}
+
+        self.cond = threading.Condition()
+        self.queue: Deque[_Request] = deque()
+        self.running: bool = True
+        self.max_queue_depth: int = 0
+
+        # only used by the worker thread, requests[i] is searched by instance i of astar
+        self.astar = None
+        self.requests: List[_Request] = []
+
+        self.metrics_lock = threading.Lock()
+        self.num_steps: int = 0
+        self.num_active_sum: int = 0
+        self.num_heur_calls: int = 0
+        self.num_heur_states: int = 0
+        self.num_solved: int = 0
+        self.num_timed_out: int = 0
+        self.num_cancelled: int = 0
+
+        self.worker: threading.Thread = threading.Thread(target=self._run)
+        self.worker.daemon = True
+        self.worker.start()
+
+    def submit(self, state: State, weight: Optional[float] = None, deadline: Optional[float] = None) -> Future:
+        """ Submit a state to solve
+
+        @param state: State to solve
+        @param weight: Weight of path cost, the weight of the solver if None
+        @param deadline: Time (time.time()) by which the state must be solved, no deadline if None
+        @return: Future of the result, a dictionary with the solution, path cost, number of nodes generated, time
+        spent searching, and time spent in the queue
+        """
+        request: _Request = _Request(state, self.weight if weight is None else weight, deadline)
+        with self.cond:
+            if not self.running:
+                raise RuntimeError("Solver is closed")
+
+            self.queue.append(request)
+            self.max_queue_depth = max(self.max_queue_depth, len(self.queue))
+            self.cond.notify()
+
+        return request.future
+
+    async def solve(self, state: State, weight: Optional[float] = None,
+                    deadline: Optional[float] = None) -> Dict[str, Any]:
+        """ Solve a state, see submit """
+        return await asyncio.wrap_future(self.submit(state, weight=weight, deadline=deadline))
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """ Metrics of the solver
+
+        @return: queue_depth: states waiting to be admitted, max_queue_depth: most states waiting at once, num_active:
+        states being searched, instance_fill: mean fraction of max_instances searched at each step,
+        mean_heur_batch_size: mean number of states given to the heuristic function at once, and numbers of steps and
+        of states solved, timed out and cancelled
+        """
+        with self.cond:
+            queue_depth: int = len(self.queue)
+            max_queue_depth: int = self.max_queue_depth
+
+        with self.metrics_lock:
+            num_steps: int = self.num_steps
+            return {"queue_depth": queue_depth, "max_queue_depth": max_queue_depth, "num_active": len(self.requests),
+                    "num_steps": num_steps,
+                    "instance_fill": self.num_active_sum / max(num_steps * self.max_instances, 1),
+                    "mean_heur_batch_size": self.num_heur_states / max(self.num_heur_calls, 1),
+                    "num_solved": self.num_solved, "num_timed_out": self.num_timed_out,
+                    "num_cancelled": self.num_cancelled}
+
+    def close(self):
+        """ Stop the worker thread. Requests that have not been solved raise RuntimeError. """
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+
+        self.worker.join()
+
+    def _counted_heuristic_fn(self, *args, **kwargs) -> np.ndarray:
+        heuristics: np.ndarray = self.heuristic_fn(*args, **kwargs)
+        with self.metrics_lock:
+            self.num_heur_calls += 1
+            self.num_heur_states += heuristics.shape[0]
+
+        return heuristics
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.running and (len(self.queue) == 0) and (len(self.requests) == 0):
+                    self.cond.wait()
+
+                if not self.running:
+                    requests: List[_Request] = self.requests + list(self.queue)
+                    self.queue.clear()
+                    break
+
+                requests_add: List[_Request] = []
+                while (len(self.queue) > 0) and (len(self.requests) + len(requests_add) < self.max_instances):
+                    requests_add.append(self.queue.popleft())
+
+            try:
+                self._admit(requests_add)
+                if len(self.requests) > 0:
+                    self.astar.step(self._counted_heuristic_fn, self.batch_size)
+                    with self.metrics_lock:
+                        self.num_steps += 1
+                        self.num_active_sum += len(self.requests)
+
+                    for request in self.requests:
+                        request.num_itrs += 1
+
+                    self._retire()
+            except Exception as e:
+                for request in self.requests + requests_add:
+                    _set_exception(request.future, e)
+                self.requests = []
+                self._close_astar()
+
+        for request in requests:
+            _set_exception(request.future, RuntimeError("Solver is closed"))
+        self.requests = []
+        self._close_astar()
+
+    def _admit(self, requests_add: List[_Request]):
+        curr_time: float = time.time()
+        requests_admit: List[_Request] = []
+        for request in requests_add:
+            if not request.future.set_running_or_notify_cancel():
+                self._count("num_cancelled")
+            elif request.is_expired(curr_time):
+                self._count("num_timed_out")
+                _set_exception(request.future, TimeoutError("Deadline passed before the state was searched"))
+            else:
+                request.start_time = curr_time
+                requests_admit.append(request)
+
+        if len(requests_admit) == 0:
+            return
+
+        states: List[State] = [request.state for request in requests_admit]
+        weights: List[float] = [request.weight for request in requests_admit]
+        if self.astar is None:
+            self.astar = astar_module.create_astar(self.engine, states, self.env, self._counted_heuristic_fn, weights,
+                                                   **self.search_kwargs)
+        else:
+            self.astar.add_instances(states, self._counted_heuristic_fn, weights)
+        self.requests.extend(requests_admit)
+
+    def _retire(self):
+        curr_time: float = time.time()
+        inst_idxs_remove: List[int] = []
+        for inst_idx, (request, found) in enumerate(zip(self.requests, self.astar.has_found_goal())):
+            if found:
+                soln: List[int]
+                path_cost: float
+                _, soln, path_cost = astar_module.get_instance_path(self.astar, inst_idx, self.env)
+                self._count("num_solved")
+                request.future.set_result({"solution": soln, "path_cost": path_cost,
+                                           "num_nodes_generated": self.astar.get_num_nodes_generated(inst_idx),
+                                           "num_itrs": request.num_itrs, "time": curr_time - request.start_time,
+                                           "queue_time": request.start_time - request.submit_time})
+            elif request.is_expired(curr_time):
+                self._count("num_timed_out")
+                _set_exception(request.future, TimeoutError("Deadline passed before the state was solved"))
+            else:
+                continue
+
+            inst_idxs_remove.append(inst_idx)
+
+        for inst_idx in inst_idxs_remove[::-1]:
+            self.astar.remove_instance(inst_idx)
+            self.requests.pop(inst_idx)
+
+        if len(self.requests) == 0:
+            self._close_astar()
+
+    def _close_astar(self):
+        # with pipeline, a batch can still be evaluated, the next search must not call the heuristic function until it
+        # is done. No request is left to get its children, so its errors are dropped.
+        if self.astar is None:
+            return
+
+        astar = self.astar
+        self.astar = None
+        try:
+            astar.close()
+        except Exception:
+            pass
+
+    def _count(self, name: str):
+        with self.metrics_lock:
+            setattr(self, name, getattr(self, name) + 1)
@@ -0,0 +1,209 @@
+from typing import Tuple
+import numpy as np
+
+
+_seeds: Tuple[int, ...] = (0xcbf29ce484222325, 0x84222325cbf29ce4, 0x9e3779b97f4a7c15, 0x6a09e667f3bcc909)
+_prime = np.uint64(0x100000001b3)
+_mix1 = np.uint64(0xff51afd7ed558ccd)
+_mix2 = np.uint64(0xc4ceb9fe1a85ec53)
+_shift = np.uint64(33)
+
+
+def fingerprint(states_np: np.ndarray, num_words: int = 2) -> np.ndarray:
+    """ Fingerprint a batch of packed states in one vectorized pass
+
+    @param states_np: Packed states, the first dimension is the batch dimension
+    @param num_words: Number of 64-bit words in each fingerprint (2 gives a 128-bit fingerprint)
+    @return: Array of shape (num_states, num_words) and dtype uint64. The first word is never zero.
+    """
+    num_states: int = states_np.shape[0]
+
+    # view each state as 64-bit words
+    states_bytes: np.ndarray = np.ascontiguousarray(states_np).reshape(num_states, -1).view(np.uint8)
+    num_pad: int = (-states_bytes.shape[1]) % 8
+    if num_pad > 0:
+        states_bytes = np.concatenate((states_bytes, np.zeros((num_states, num_pad), dtype=np.uint8)), axis=1)
+    words: np.ndarray = np.ascontiguousarray(states_bytes).view(np.uint64)
+
+    # hash words with a different seed for each fingerprint word
+    fps: np.ndarray = np.empty((num_states, num_words), dtype=np.uint64)
+    for word_idx in range(num_words):
+        h: np.ndarray = np.full(num_states, _seeds[word_idx % len(_seeds)] + word_idx // len(_seeds),
+                                dtype=np.uint64)
+        for col in range(words.shape[1]):
+            h ^= words[:, col]
+            h *= _prime
+            h ^= h >> _shift
+
+        # finalize
+        h ^= h >> _shift
+        h *= _mix1
+        h ^= h >> _shift
+        h *= _mix2
+        h ^= h >> _shift
+
+        fps[:, word_idx] = h
+
+    # zero marks an empty slot in FingerprintTable
+    fps[fps[:, 0] == 0, 0] = 1
+
+    return fps
+
+
+def unique_states(states_np: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """ Find identical states in a batch of packed states
+
+    @param states_np: Packed states
+    @return: Index of the first occurrence of each unique state, index of the unique state of each state
+    """
+    fps: np.ndarray = fingerprint(states_np)
+    first_idxs: np.ndarray
+    inverse: np.ndarray
+    _, first_idxs, inverse = np.unique(fps, axis=0, return_index=True, return_inverse=True)
+
+    return first_idxs, inverse.reshape(-1)
+
+
+class FingerprintTable:
+    """ Set of states with the best path cost seen for each. States are stored as fingerprints in an
+    open-addressing (linear probing) hash table held in numpy arrays, so each state costs a few bytes instead of a
+    State object.
+    """
+
+    def __init__(self, num_words: int = 2, capacity: int = 1024, max_load: float = 0.5):
+        self.num_words: int = num_words
+        self.max_load: float = max_load
+        self.num_entries: int = 0
+
+        capacity = 1 << max(int(np.ceil(np.log2(max(capacity, 2)))), 1)
+        self.fps: np.ndarray = np.zeros((capacity, num_words), dtype=np.uint64)
+        self.path_costs: np.ndarray = np.zeros(capacity, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return self.num_entries
+
+    def insert_or_improve(self, states_np: np.ndarray, path_costs: np.ndarray) -> np.ndarray:
+        """ Add states that have not been seen and update states that are reached with a smaller path cost.
+        States are processed as if one at a time, in order.
+
+        @param states_np: Packed states
+        @param path_costs: Path cost of each state
+        @return: Boolean numpy array, True if the state was not seen or was seen with a larger path cost
+        """
+        num_states: int = states_np.shape[0]
+        keep: np.ndarray = np.zeros(num_states, dtype=bool)
+        if num_states == 0:
+            return keep
+
+        path_costs = np.asarray(path_costs, dtype=np.float64)
+
+        # collapse duplicates within the batch
+        fps: np.ndarray = fingerprint(states_np, self.num_words)
+        fps_uniq, inverse, counts = np.unique(fps, axis=0, return_inverse=True, return_counts=True)
+        inverse = inverse.reshape(-1)
+
+        # look up unique fingerprints, grow first if inserting could go over the max load
+        slots, found = self._lookup(fps_uniq)
+        num_new: int = int(np.sum(np.logical_not(found)))
+        if (self.num_entries + num_new) > self.max_load * self.fps.shape[0]:
+            self._grow(self.num_entries + num_new)
+            slots, found = self._lookup(fps_uniq)
+
+        path_costs_prev: np.ndarray = np.full(fps_uniq.shape[0], np.inf)
+        path_costs_prev[found] = self.path_costs[slots[found]]
+
+        # states that are unique in the batch only compare against the table
+        is_dup: np.ndarray = counts[inverse] > 1
+        not_dup: np.ndarray = np.logical_not(is_dup)
+        keep[not_dup] = path_costs[not_dup] < path_costs_prev[inverse[not_dup]]
+
+        path_costs_best: np.ndarray = path_costs_prev.copy()
+        path_costs_best[inverse[not_dup]] = np.minimum(path_costs_prev[inverse[not_dup]], path_costs[not_dup])
+
+        # states that repeat in the batch also compare against their earlier copies
+        for idx in np.where(is_dup)[0]:
+            uniq_idx: int = inverse[idx]
+            if path_costs[idx] < path_costs_best[uniq_idx]:
+                keep[idx] = True
+                path_costs_best[uniq_idx] = path_costs[idx]
+
+        # update existing entries and insert new ones
+        self.path_costs[slots[found]] = path_costs_best[found]
+
+        not_found: np.ndarray = np.logical_not(found)
+        self._insert(fps_uniq[not_found], path_costs_best[not_found], slots[not_found])
+
+        return keep
+
+    def add(self, states_np: np.ndarray) -> None:
+        """ Add states without path costs
+
+        @param states_np: Packed states
+        """
+        self.insert_or_improve(states_np, np.zeros(states_np.shape[0]))
+
+    def contains(self, states_np: np.ndarray) -> np.ndarray:
+        """ Check if states are in the table
+
+        @param states_np: Packed states
+        @return: Boolean numpy array
+        """
+        if states_np.shape[0] == 0:
+            return np.zeros(0, dtype=bool)
+
+        found: np.ndarray
+        _, found = self._lookup(fingerprint(states_np, self.num_words))
+
+        return found
+
+    def _lookup(self, fps: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """ Returns the slot holding each fingerprint, or the first empty slot on its probe sequence, and whether
+        it was found """
+        mask = np.uint64(self.fps.shape[0] - 1)
+        slots: np.ndarray = (fps[:, 0] & mask).astype(np.int64)
+        found: np.ndarray = np.zeros(fps.shape[0], dtype=bool)
+
+        active: np.ndarray = np.arange(fps.shape[0])
+        while active.shape[0] > 0:
+            fps_table: np.ndarray = self.fps[slots[active]]
+            is_match: np.ndarray = np.all(fps_table == fps[active], axis=1)
+            is_empty: np.ndarray = fps_table[:, 0] == 0
+            found[active[is_match]] = True
+
+            active = active[np.logical_not(np.logical_or(is_match, is_empty))]
+            slots[active] = (slots[active] + 1) & (self.fps.shape[0] - 1)
+
+        return slots, found
+
+    def _insert(self, fps: np.ndarray, path_costs: np.ndarray, slots: np.ndarray) -> None:
+        """ Insert fingerprints that are not in the table, given the empty slots returned by _lookup """
+        while fps.shape[0] > 0:
+            # when fingerprints land on the same empty slot, the first one gets it and the rest probe again
+            first_idxs: np.ndarray
+            _, first_idxs = np.unique(slots, return_index=True)
+            self.fps[slots[first_idxs]] = fps[first_idxs]
+            self.path_costs[slots[first_idxs]] = path_costs[first_idxs]
+            self.num_entries += first_idxs.shape[0]
+
+            retry: np.ndarray = np.ones(fps.shape[0], dtype=bool)
+            retry[first_idxs] = False
+            fps = fps[retry]
+            path_costs = path_costs[retry]
+            slots, _ = self._lookup(fps)
+
+    def _grow(self, num_entries: int) -> None:
+        capacity: int = self.fps.shape[0]
+        while num_entries > self.max_load * capacity:
+            capacity *= 2
+
+        is_used: np.ndarray = self.fps[:, 0] != 0
+        fps_used: np.ndarray = self.fps[is_used]
+        path_costs_used: np.ndarray = self.path_costs[is_used]
+
+        self.fps = np.zeros((capacity, self.num_words), dtype=np.uint64)
+        self.path_costs = np.zeros(capacity, dtype=np.float64)
+        self.num_entries = 0
+
+        slots: np.ndarray
+        slots, _ = self._lookup(fps_used)
+        self._insert(fps_used, path_costs_used, slots)
@@ -0,0 +1,98 @@
+from typing import Optional
+import numpy as np
+import mmap
+import os
+import socket
+
+
+class CppTransport:
+    """ Server side of HeuristicTransport in cpp/transport.h. Receives batches of packed states from the c++ search
+    and sends back their heuristic values.
+
+    With shm_name, states are read from and values are written to a file mapped into memory by both processes, and
+    only a doorbell goes over the socket. Otherwise, data goes over the socket.
+    """
+
+    def __init__(self, sock: socket.socket, state_dim: int, dtype, shm_name: Optional[str] = None):
+        self.sock: socket.socket = sock
+        self.state_dim: int = state_dim
+        self.dtype = dtype
+        self.shm_name: Optional[str] = shm_name
+
+        self.connection: Optional[socket.socket] = None
+        self.shm: Optional[mmap.mmap] = None
+        self.recv_buf: bytearray = bytearray(0)
+        self.values_np: Optional[np.ndarray] = None
+
+    def accept(self):
+        self.connection, _ = self.sock.accept()
+
+    def recv_states(self) -> Optional[np.ndarray]:
+        """ Wait for the next batch of states
+
+        @return: Packed states, or None if the c++ search closed the connection. The array is a view of the receive
+        buffer or of the shared memory that is only valid until the next call.
+        """
+        if self.shm_name is None:
+            header: Optional[memoryview] = self._recv_exact(8)
+            if header is None:
+                return None
+            num_bytes: int = int(np.frombuffer(header, dtype=np.int64)[0])
+
+            data: Optional[memoryview] = self._recv_exact(num_bytes)
+            if data is None:
+                return None
+
+            return np.frombuffer(data, dtype=self.dtype, count=num_bytes).reshape(-1, self.state_dim)
+
+        doorbell: Optional[memoryview] = self._recv_exact(24)
+        if doorbell is None:
+            return None
+        num_bytes, num_states, values_offset = [int(x) for x in np.frombuffer(doorbell, dtype=np.int64)]
+
+        # the c++ search grows the file when it needs more room
+        size_needed: int = values_offset + 4 * num_states
+        if (self.shm is None) or (len(self.shm) < size_needed):
+            if self.shm is not None:
+                self._close_shm()
+
+            fd: int = os.open(self.shm_name, os.O_RDWR)
+            self.shm = mmap.mmap(fd, os.fstat(fd).st_size)
+            os.close(fd)
+
+        self.values_np = np.frombuffer(self.shm, dtype=np.float32, count=num_states, offset=values_offset)
+
+        return np.frombuffer(self.shm, dtype=self.dtype, count=num_bytes).reshape(-1, self.state_dim)
+
+    def send_heuristics(self, heuristics: np.ndarray):
+        if self.shm_name is None:
+            self.connection.sendall(heuristics.astype(np.float32).tobytes())
+        else:
+            self.values_np[:] = heuristics
+            self.values_np = None
+            self.connection.sendall(b"\x01")
+
+    def _close_shm(self):
+        # views of the previous batch are no longer valid
+        self.values_np = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # the caller still holds a view, the mapping is removed when the view is freed
+            pass
+        self.shm = None
+
+    def _recv_exact(self, num_bytes: int) -> Optional[memoryview]:
+        # receive into a preallocated buffer instead of concatenating chunks
+        if len(self.recv_buf) < num_bytes:
+            self.recv_buf = bytearray(num_bytes)
+        view: memoryview = memoryview(self.recv_buf)
+
+        num_bytes_seen: int = 0
+        while num_bytes_seen < num_bytes:
+            num_recv: int = self.connection.recv_into(view[num_bytes_seen:num_bytes])
+            if num_recv == 0:
+                return None
+            num_bytes_seen += num_recv
+
+        return view[:num_bytes]
@@ -1,5 +1,6 @@
-from typing import List, Tuple, Set, Callable, Optional
+from typing import List, Tuple, Callable, Optional
 from environments.environment_abstract import Environment, State
+from search_methods.closed_set import FingerprintTable
 import numpy as np
 from utils import search_utils, env_utils, nnet_utils, misc_utils
 from argparse import ArgumentParser
@@ -14,13 +15,11 @@ class Instance:
         self.is_solved: bool = False
         self.num_steps: int = 0
         self.trajs: List[Tuple[State, float]] = []
-        self.seen_states: Set[State] = set()
 
         self.eps = eps
 
     def add_to_traj(self, state: State, cost_to_go: float):
         self.trajs.append((state, cost_to_go))
-        self.seen_states.add(state)
 
     def next_state(self, state: State):
         self.curr_state = state
@@ -28,9 +27,20 @@ class Instance:
 
 
 class GBFS:
-    def __init__(self, states: List[State], env: Environment, eps: Optional[List[float]] = None):
+    """ Greedy best-first search that takes the move with the lowest transition cost plus heuristic
+
+    The states seen by all instances are kept in one FingerprintTable, keyed on the index of the instance and the
+    state, so that each step checks and adds them in one batched call.
+
+    With canonicalize=True, states are mapped to their canonical state (Environment.canonicalize_np) for the states
+    already seen and the heuristic function, so symmetric states are treated as the same state.
+    """
+
+    def __init__(self, states: List[State], env: Environment, eps: Optional[List[float]] = None,
+                 canonicalize: bool = False):
         self.curr_states: List[State] = states
         self.env: Environment = env
+        self.canonicalize: bool = canonicalize
 
         if eps is None:
             eps = [0] * len(self.curr_states)
@@ -40,12 +50,20 @@ class GBFS:
             instance: Instance = Instance(state, eps_inst)
             self.instances.append(instance)
 
-    def step(self, heuristic_fn: Callable) -> None:
+        self.seen_states: FingerprintTable = FingerprintTable(capacity=2 * len(self.instances))
+
+    def step(self, heuristic_fn: Callable, heuristic_fn_children: Optional[Callable] = None) -> None:
+        """ Take a step
+
+        @param heuristic_fn: Heuristic function
+        @param heuristic_fn_children: If given, evaluates the children of the current states instead of heuristic_fn
+        (see nnet_utils.get_children_heuristic_fn). Not used with canonicalize=True.
+        """
         # check which are solved
         self._record_solved()
 
         # take a step for unsolved states
-        self._move(heuristic_fn)
+        self._move(heuristic_fn, heuristic_fn_children)
 
     def get_trajs(self) -> List[List[Tuple[State, float]]]:
         trajs_all: List[List[Tuple[State, float]]] = []
@@ -66,35 +84,49 @@ class GBFS:
 
     def _record_solved(self) -> None:
         # get unsolved instances
-        instances: List[Instance] = self._get_unsolved_instances()
-        if len(instances) == 0:
+        inst_idxs: List[int] = self._get_unsolved_idxs()
+        if len(inst_idxs) == 0:
             return
 
-        states: List[State] = [instance.curr_state for instance in instances]
+        states: List[State] = [self.instances[inst_idx].curr_state for inst_idx in inst_idxs]
 
         is_solved: np.ndarray = self.env.is_solved(states)
 
         solved_idxs: List[int] = list(np.where(is_solved)[0])
         if len(solved_idxs) > 0:
-            instances_solved: List[Instance] = [instances[idx] for idx in solved_idxs]
-            states_solved: List[State] = [instance.curr_state for instance in instances_solved]
+            inst_idxs_solved: List[int] = [inst_idxs[idx] for idx in solved_idxs]
+            states_solved: List[State] = [states[idx] for idx in solved_idxs]
+            self.seen_states.add(self._get_seen_keys(inst_idxs_solved, states_solved))
 
-            for instance, state in zip(instances_solved, states_solved):
+            for inst_idx, state in zip(inst_idxs_solved, states_solved):
+                instance: Instance = self.instances[inst_idx]
                 instance.add_to_traj(state, 0.0)
                 instance.is_solved = True
 
-    def _move(self, heuristic_fn: Callable) -> None:
+    def _move(self, heuristic_fn: Callable, heuristic_fn_children: Optional[Callable]) -> None:
         # get unsolved instances
-        instances: List[Instance] = self._get_unsolved_instances()
-        if len(instances) == 0:
+        inst_idxs: List[int] = self._get_unsolved_idxs()
+        if len(inst_idxs) == 0:
             return
+        instances: List[Instance] = [self.instances[inst_idx] for inst_idx in inst_idxs]
         states: List[State] = [instance.curr_state for instance in instances]
 
         # get backed-up ctg and cost of each move
         ctg_backups: np.ndarray
         ctg_next_p_tcs: List[np.ndarray]
         states_exp: List[List[State]]
-        ctg_backups, ctg_next_p_tcs, states_exp = search_utils.bellman(states, heuristic_fn, self.env)
+        if self.canonicalize:
+            # children of canonical states are not the canonical children
+            heuristic_fn = search_utils.canonical_heuristic_fn(heuristic_fn, self.env)
+            heuristic_fn_children = None
+        ctg_backups, ctg_next_p_tcs, states_exp = search_utils.bellman(states, heuristic_fn, self.env,
+                                                                       heuristic_fn_children=heuristic_fn_children)
+
+        # add states to the states seen, then check the best next states against them
+        self.seen_states.add(self._get_seen_keys(inst_idxs, states))
+        states_next: List[State] = [state_exp[int(np.argmin(ctg_next_p_tc))]
+                                    for state_exp, ctg_next_p_tc in zip(states_exp, ctg_next_p_tcs)]
+        seen_next: np.ndarray = self.seen_states.contains(self._get_seen_keys(inst_idxs, states_next))
 
         # make move
         for idx in range(len(instances)):
@@ -106,26 +138,37 @@ class GBFS:
             instance.add_to_traj(state, ctg_backup)
 
             # get next state
-            ctg_next_p_tc: np.ndarray = ctg_next_p_tcs[idx]
             state_exp: List[State] = states_exp[idx]
-            state_next: State = state_exp[int(np.argmin(ctg_next_p_tc))]
+            state_next: State = states_next[idx]
 
             # make random move with probability eps
             eps_rand_move = np.random.random(1)[0] < instance.eps
-            seen_state: bool = state_next in instance.seen_states
+            seen_state: bool = seen_next[idx]
             if eps_rand_move or seen_state:
                 rand_state_idx = np.random.choice(len(state_exp))
                 state_next = state_exp[rand_state_idx]
 
             instance.next_state(state_next)
 
-    def _get_unsolved_instances(self) -> List[Instance]:
-        instances_unsolved: List[Instance] = [instance for instance in self.instances if not instance.is_solved]
-        return instances_unsolved
+    def _get_seen_keys(self, inst_idxs: List[int], states: List[State]) -> np.ndarray:
+        # packed states, followed by the index of their instance, used to check if a state was already seen
+        states_np: np.ndarray = self.env.states_to_np(states)
+        if self.canonicalize:
+            states_np, _ = self.env.canonicalize_np(states_np)
+
+        states_bytes: np.ndarray = np.ascontiguousarray(states_np).reshape(len(states), -1).view(np.uint8)
+        inst_idxs_bytes: np.ndarray = np.array(inst_idxs, dtype=np.int64).reshape(-1, 1).view(np.uint8)
+
+        return np.concatenate((states_bytes, inst_idxs_bytes), axis=1)
+
+    def _get_unsolved_idxs(self) -> List[int]:
+        inst_idxs_unsolved: List[int] = [inst_idx for inst_idx, instance in enumerate(self.instances)
+                                         if not instance.is_solved]
+        return inst_idxs_unsolved
 
 
 def gbfs_test(num_states: int, back_max: int, env: Environment, heuristic_fn: Callable,
-              max_solve_steps: Optional[int] = None):
+              max_solve_steps: Optional[int] = None, heuristic_fn_children: Optional[Callable] = None):
     # get data
     back_steps: List[int] = list(np.linspace(0, back_max, 30, dtype=np.int))
     num_states_per_back_step: List[int] = misc_utils.split_evenly(num_states, len(back_steps))
@@ -149,7 +192,7 @@ def gbfs_test(num_states: int, back_max: int, env: Environment, heuristic_fn: Ca
     # Solve with GBFS
     gbfs = GBFS(states, env, eps=None)
     for _ in range(max_solve_steps):
-        gbfs.step(heuristic_fn)
+        gbfs.step(heuristic_fn, heuristic_fn_children=heuristic_fn_children)
 
     is_solved_all: np.ndarray = np.array(gbfs.get_is_solved())
     num_steps_all: np.ndarray = np.array(gbfs.get_num_steps())
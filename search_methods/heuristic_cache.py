@@ -0,0 +1,109 @@
+from typing import List, Callable, Tuple
+from environments.environment_abstract import Environment
+from search_methods.closed_set import fingerprint
+import numpy as np
+import threading
+
+
+class HeuristicCache:
+    """ Bounded cache in front of a heuristic function. Can be used anywhere a heuristic function is used (AStar,
+    ArrayAStar, GBFS, search_utils.bellman).
+
+    States are keyed by a 128-bit fingerprint of their nnet input. The cache is set-associative: a fingerprint can
+    only be stored in the num_ways slots of its set, and the least recently used of them is evicted when the set is
+    full. Repeated states within a batch are evaluated once.
+
+    It can be called from several threads. The table is locked while it is read and written, but not while the
+    heuristic function evaluates the misses, so the heuristic function can be called by several threads at once.
+    """
+    bytes_per_entry: int = 32
+
+    def __init__(self, heuristic_fn: Callable, env: Environment, max_bytes: int, num_ways: int = 8):
+        self.heuristic_fn: Callable = heuristic_fn
+        self.env: Environment = env
+
+        num_sets: int = max(max_bytes // (self.bytes_per_entry * num_ways), 1)
+        num_sets = 1 << int(np.floor(np.log2(num_sets)))
+
+        self.fps: np.ndarray = np.zeros((num_sets, num_ways, 2), dtype=np.uint64)
+        self.values: np.ndarray = np.zeros((num_sets, num_ways), dtype=np.float64)
+        self.last_used: np.ndarray = np.zeros((num_sets, num_ways), dtype=np.int64)
+        self.clock: int = 0
+
+        self.num_hits: int = 0
+        self.num_misses: int = 0
+
+        self.lock: threading.Lock = threading.Lock()
+
+    def __call__(self, states: List, is_nnet_format: bool = False) -> np.ndarray:
+        states_nnet: List[np.ndarray]
+        if is_nnet_format:
+            states_nnet = states
+        else:
+            states_nnet = self.env.state_to_nnet_input(states)
+
+        num_states: int = states_nnet[0].shape[0]
+        if num_states == 0:
+            return self.heuristic_fn(states_nnet, is_nnet_format=True)
+
+        states_bytes: np.ndarray = np.concatenate([np.ascontiguousarray(x).reshape(num_states, -1).view(np.uint8)
+                                                   for x in states_nnet], axis=1)
+        fps: np.ndarray = fingerprint(states_bytes, 2)
+        set_idxs: np.ndarray = (fps[:, 0] & np.uint64(self.fps.shape[0] - 1)).astype(np.int64)
+
+        # look up
+        heuristics: np.ndarray = np.zeros(num_states, dtype=np.float64)
+        with self.lock:
+            self.clock += 1
+
+            is_match: np.ndarray = np.all(self.fps[set_idxs] == np.expand_dims(fps, 1), axis=2)
+            is_hit: np.ndarray = np.any(is_match, axis=1)
+            ways: np.ndarray = np.argmax(is_match, axis=1)
+
+            heuristics[is_hit] = self.values[set_idxs[is_hit], ways[is_hit]]
+            self.last_used[set_idxs[is_hit], ways[is_hit]] = self.clock
+
+            self.num_hits += int(np.sum(is_hit))
+            self.num_misses += int(np.sum(np.logical_not(is_hit)))
+
+        # evaluate misses, once per unique state
+        miss_idxs: np.ndarray = np.where(np.logical_not(is_hit))[0]
+        if miss_idxs.shape[0] > 0:
+            fps_miss, first_idxs, inverse = np.unique(fps[miss_idxs], axis=0, return_index=True, return_inverse=True)
+            eval_idxs: np.ndarray = miss_idxs[first_idxs]
+
+            values: np.ndarray = self.heuristic_fn([x[eval_idxs] for x in states_nnet], is_nnet_format=True)
+            heuristics[miss_idxs] = values[inverse.reshape(-1)]
+
+            with self.lock:
+                self._insert(fps_miss, values, set_idxs[eval_idxs])
+
+        return heuristics
+
+    def get_hit_rate(self) -> float:
+        num_lookups: int = self.num_hits + self.num_misses
+        if num_lookups == 0:
+            return 0.0
+
+        return self.num_hits / num_lookups
+
+    def get_stats(self) -> Tuple[int, int, float]:
+        return self.num_hits, self.num_misses, self.get_hit_rate()
+
+    def _insert(self, fps: np.ndarray, values: np.ndarray, set_idxs: np.ndarray):
+        while fps.shape[0] > 0:
+            # one insert per set at a time, replacing its least recently used way
+            first_idxs: np.ndarray
+            _, first_idxs = np.unique(set_idxs, return_index=True)
+            set_idxs_ins: np.ndarray = set_idxs[first_idxs]
+            ways: np.ndarray = np.argmin(self.last_used[set_idxs_ins], axis=1)
+
+            self.fps[set_idxs_ins, ways] = fps[first_idxs]
+            self.values[set_idxs_ins, ways] = values[first_idxs]
+            self.last_used[set_idxs_ins, ways] = self.clock
+
+            retry: np.ndarray = np.ones(fps.shape[0], dtype=bool)
+            retry[first_idxs] = False
+            fps = fps[retry]
+            values = values[retry]
+            set_idxs = set_idxs[retry]
@@ -0,0 +1,200 @@
+from typing import List, Dict, Any
+import numpy as np
+from heapq import heappush, heappop
+
+
+class HeapOpenSet:
+    """ Open set as a binary heap of (cost, counter, item) tuples """
+
+    def __init__(self):
+        self.heap: List = []
+        self.heappush_count: int = 0
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def push(self, costs: np.ndarray, items: List[Any]):
+        for cost, item in zip(costs, items):
+            heappush(self.heap, (cost, self.heappush_count, item))
+            self.heappush_count += 1
+
+    def pop(self, num_items: int) -> List[Any]:
+        num_to_pop: int = min(num_items, len(self.heap))
+
+        return [heappop(self.heap)[2] for _ in range(num_to_pop)]
+
+
+class _Bucket:
+    """ Entries of BucketOpenSet whose costs fall in the same bucket. Entries are kept in runs sorted by cost and, for
+    equal costs, in the order they were pushed. Each run holds entries pushed after those of the run before it.
+    Entries added since the last pop are sorted into a new run on the next pop, and a run is merged with the one
+    before it while it is at least half as long, so there are few runs and the entries already sorted are rarely
+    sorted again. A pop merges only the first entries of each run. """
+    __slots__ = ['runs_costs', 'runs_slots', 'runs_start', 'costs_add', 'slots_add', 'num_add', 'num_runs_items']
+
+    def __init__(self):
+        self.runs_costs: List[np.ndarray] = []
+        self.runs_slots: List[np.ndarray] = []
+        self.runs_start: List[int] = []
+        self.num_runs_items: int = 0
+
+        self.costs_add: List[np.ndarray] = []
+        self.slots_add: List[np.ndarray] = []
+        self.num_add: int = 0
+
+    def __len__(self) -> int:
+        return self.num_runs_items + self.num_add
+
+    def add(self, costs: np.ndarray, slots: np.ndarray):
+        self.costs_add.append(costs)
+        self.slots_add.append(slots)
+        self.num_add += costs.shape[0]
+
+    def pop(self, num_items: int) -> np.ndarray:
+        if self.num_add > 0:
+            self._add_run()
+
+        # the best entries are among the first num_items of each run. Runs are in push order, so a stable sort keeps
+        # equal costs in push order.
+        costs_first: List[np.ndarray] = []
+        slots_first: List[np.ndarray] = []
+        for costs, slots, start_idx in zip(self.runs_costs, self.runs_slots, self.runs_start):
+            costs_first.append(costs[start_idx:start_idx + num_items])
+            slots_first.append(slots[start_idx:start_idx + num_items])
+
+        run_idxs: np.ndarray = np.repeat(np.arange(len(costs_first)), [x.shape[0] for x in costs_first])
+        sort_idxs: np.ndarray = np.argsort(np.concatenate(costs_first), kind='stable')[:num_items]
+        slots_popped: np.ndarray = np.concatenate(slots_first)[sort_idxs]
+
+        # advance the runs past the popped entries and drop the empty ones
+        num_popped_runs: np.ndarray = np.bincount(run_idxs[sort_idxs], minlength=len(costs_first))
+        for run_idx in range(len(costs_first) - 1, -1, -1):
+            self.runs_start[run_idx] += int(num_popped_runs[run_idx])
+            if self.runs_start[run_idx] == self.runs_costs[run_idx].shape[0]:
+                del self.runs_costs[run_idx], self.runs_slots[run_idx], self.runs_start[run_idx]
+        self.num_runs_items -= slots_popped.shape[0]
+
+        return slots_popped
+
+    def _add_run(self):
+        # the added entries are in push order, so a stable sort keeps equal costs in push order
+        costs: np.ndarray = np.concatenate(self.costs_add)
+        slots: np.ndarray = np.concatenate(self.slots_add)
+        sort_idxs: np.ndarray = np.argsort(costs, kind='stable')
+        self.runs_costs.append(costs[sort_idxs])
+        self.runs_slots.append(slots[sort_idxs])
+        self.runs_start.append(0)
+        self.num_runs_items += self.num_add
+
+        self.costs_add = []
+        self.slots_add = []
+        self.num_add = 0
+
+        # merge the last run into the one before it while it is at least half as long. Entries of the run before it
+        # were pushed first, so they go first for equal costs.
+        while len(self.runs_costs) > 1:
+            num_last: int = self.runs_costs[-1].shape[0] - self.runs_start[-1]
+            num_prev: int = self.runs_costs[-2].shape[0] - self.runs_start[-2]
+            if 2 * num_last < num_prev:
+                break
+
+            costs = np.concatenate((self.runs_costs[-2][self.runs_start[-2]:],
+                                    self.runs_costs[-1][self.runs_start[-1]:]))
+            slots = np.concatenate((self.runs_slots[-2][self.runs_start[-2]:],
+                                    self.runs_slots[-1][self.runs_start[-1]:]))
+            sort_idxs = np.argsort(costs, kind='stable')
+
+            del self.runs_costs[-1], self.runs_slots[-1], self.runs_start[-1]
+            self.runs_costs[-1] = costs[sort_idxs]
+            self.runs_slots[-1] = slots[sort_idxs]
+            self.runs_start[-1] = 0
+
+
+class BucketOpenSet:
+    """ Open set that groups entries into buckets of costs of width bucket_width. A push inserts a whole array of
+    costs at once and a pop takes the best entries from the lowest buckets, sorting a bucket only when it is popped
+    from. Entries come out in the same order as HeapOpenSet.
+
+    Items are kept in a list and buckets store the index of their slot. Slots of popped items are reused by later
+    pushes, so the list is as long as the largest the open set has been, not the number of pushes.
+    """
+
+    def __init__(self, bucket_width: float = 1.0):
+        self.bucket_width: float = bucket_width
+        self.buckets: Dict[int, _Bucket] = dict()
+        self.bucket_keys: List[int] = []
+
+        self.items: List[Any] = []
+        self.free_slots: List[int] = []
+        self.num_items: int = 0
+
+    def __len__(self) -> int:
+        return self.num_items
+
+    def push(self, costs: np.ndarray, items: List[Any]):
+        num_push: int = len(items)
+        if num_push == 0:
+            return
+
+        costs = np.asarray(costs, dtype=np.float64)
+
+        # reuse the slots of popped items before growing the list
+        num_reuse: int = min(num_push, len(self.free_slots))
+        slots_reuse: List[int] = self.free_slots[len(self.free_slots) - num_reuse:]
+        del self.free_slots[len(self.free_slots) - num_reuse:]
+        for slot, item in zip(slots_reuse, items[:num_reuse]):
+            self.items[slot] = item
+
+        slots: np.ndarray = np.array(slots_reuse + list(range(len(self.items), len(self.items) + num_push - num_reuse)),
+                                     dtype=np.int64)
+        self.items.extend(items[num_reuse:])
+        self.num_items += num_push
+
+        # group by bucket
+        keys: np.ndarray = np.floor(costs / self.bucket_width).astype(np.int64)
+        sort_idxs: np.ndarray = np.argsort(keys, kind='stable')
+        keys_uniq, start_idxs = np.unique(keys[sort_idxs], return_index=True)
+
+        for key, bucket_idxs in zip(keys_uniq.tolist(), np.split(sort_idxs, start_idxs[1:])):
+            bucket: _Bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = _Bucket()
+                self.buckets[key] = bucket
+                heappush(self.bucket_keys, key)
+
+            bucket.add(costs[bucket_idxs], slots[bucket_idxs])
+
+    def pop(self, num_items: int) -> List[Any]:
+        slots_popped: List[np.ndarray] = []
+        num_left: int = num_items
+        while (num_left > 0) and (len(self.bucket_keys) > 0):
+            key: int = self.bucket_keys[0]
+            bucket: _Bucket = self.buckets[key]
+
+            slots_bucket: np.ndarray = bucket.pop(num_left)
+            slots_popped.append(slots_bucket)
+            num_left -= slots_bucket.shape[0]
+
+            if len(bucket) == 0:
+                heappop(self.bucket_keys)
+                del self.buckets[key]
+
+        # get items, release references to them and free their slots
+        slots: List[int] = np.concatenate(slots_popped).tolist() if len(slots_popped) > 0 else []
+        items_popped: List[Any] = []
+        for slot in slots:
+            items_popped.append(self.items[slot])
+            self.items[slot] = None
+        self.free_slots.extend(slots)
+        self.num_items -= len(items_popped)
+
+        return items_popped
+
+
+def get_open_set(open_set_name: str):
+    if open_set_name == "heap":
+        return HeapOpenSet()
+    elif open_set_name == "bucket":
+        return BucketOpenSet()
+    else:
+        raise ValueError("Unknown open set %s" % open_set_name)
@@ -0,0 +1,451 @@
+from typing import List, Dict, Any, Optional, Callable, Tuple
+from argparse import ArgumentParser, Namespace
+from concurrent.futures import Future
+from environments.environment_abstract import Environment, State
+from utils import env_utils
+from search_methods import astar, astar_cpp
+from search_methods.async_solver import AsyncSolver
+import numpy as np
+import threading
+import socket
+import struct
+import pickle
+import time
+import os
+
+# largest message recv_msg accepts, so that a bad size does not allocate arbitrary memory
+MAX_MSG_SIZE: int = 2 ** 30
+
+
+def send_msg(sock: socket.socket, msg: Any):
+    """ Send a message as an 8 byte size followed by the pickled message """
+    data: bytes = pickle.dumps(msg, protocol=-1)
+    sock.sendall(struct.pack("<q", len(data)))
+    sock.sendall(data)
+
+
+def recv_msg(sock: socket.socket, max_size: int = MAX_MSG_SIZE) -> Optional[Any]:
+    """ Receive a message sent with send_msg, None if the connection is closed. Raises ValueError if the size is
+    negative or larger than max_size, the rest of the message is then not read. """
+    header: Optional[bytearray] = _recv_exact(sock, 8)
+    if header is None:
+        return None
+
+    size: int = struct.unpack("<q", header)[0]
+    if (size < 0) or (size > max_size):
+        raise ValueError("Message size %i is not in [0, %i]" % (size, max_size))
+
+    data: Optional[bytearray] = _recv_exact(sock, size)
+    if data is None:
+        return None
+
+    return pickle.loads(data)
+
+
+def _recv_exact(sock: socket.socket, num_bytes: int) -> Optional[bytearray]:
+    data: bytearray = bytearray(num_bytes)
+    view: memoryview = memoryview(data)
+    while num_bytes > 0:
+        num_read: int = sock.recv_into(view, num_bytes)
+        if num_read == 0:
+            return None
+        view = view[num_read:]
+        num_bytes -= num_read
+
+    return data
+
+
+def get_latency_stats(latencies: List[float]) -> Dict[str, float]:
+    if len(latencies) == 0:
+        return {"num": 0}
+
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+    return {"num": len(latencies), "p50": float(p50), "p90": float(p90), "p99": float(p99),
+            "max": float(np.max(latencies))}
+
+
+def format_stats(stats: Dict[str, Any]) -> str:
+    lines: List[str] = ["Model: %s (loaded in %.2f secs), reloads: %i" % (stats["model_dir"], stats["model_load_time"],
+                                                                         stats["num_reloads"]),
+                        "Uptime: %.2f secs, requests: %i, states solved: %i" % (stats["uptime"], stats["num_requests"],
+                                                                               stats["num_states_solved"])]
+    for name in ["cold", "warm"]:
+        latency: Dict[str, float] = stats["latency"][name]
+        if latency["num"] == 0:
+            lines.append("%s: no requests" % name.capitalize())
+        else:
+            lines.append("%s: %i requests, latency (secs) - p50: %.3f, p90: %.3f, p99: %.3f, max: %.3f" % (
+                name.capitalize(), latency["num"], latency["p50"], latency["p90"], latency["p99"], latency["max"]))
+
+    return "\n".join(lines)
+
+
+class _CppSolver:
+    """ Solves submitted states with the C++ search (cpp/libweighted_astar.so) on a worker thread, with the submit and
+    close of AsyncSolver. The C++ search cannot take new states while it runs, so the states submitted during a search
+    are solved together by the next one.
+    """
+
+    def __init__(self, env_name: str, env: Environment, heuristic_fn: Callable, batch_size: int, weight: float,
+                 max_instances: int):
+        self.env_name: str = env_name
+        self.env: Environment = env
+        self.heuristic_fn: Callable = heuristic_fn
+        self.batch_size: int = batch_size
+        self.weight: float = weight
+        self.max_instances: int = max_instances
+
+        self.cond = threading.Condition()
+        self.queue: List[Tuple[State, float, Future]] = []
+        self.running: bool = True
+
+        self.worker: threading.Thread = threading.Thread(target=self._run)
+        self.worker.daemon = True
+        self.worker.start()
+
+    def submit(self, state: State, weight: Optional[float] = None) -> Future:
+        future: Future = Future()
+        with self.cond:
+            if not self.running:
+                raise RuntimeError("Solver is closed")
+
+            self.queue.append((state, self.weight if weight is None else weight, future))
+            self.cond.notify()
+
+        return future
+
+    def close(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+
+        self.worker.join()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.running and (len(self.queue) == 0):
+                    self.cond.wait()
+
+                requests: List[Tuple[State, float, Future]] = self.queue
+                self.queue = []
+                if not self.running:
+                    break
+
+            requests = [request for request in requests if request[2].set_running_or_notify_cancel()]
+            if len(requests) == 0:
+                continue
+
+            futures: List[Future] = [future for _, _, future in requests]
+
+            def on_result(result: Dict[str, Any]):
+                future_res: Future = futures[result["state"]]
+                if result["solved"]:
+                    future_res.set_result({"solution": result["moves"],
+                                           "num_nodes_generated": result["nodes_generated"], "time": result["time"]})
+                else:
+                    future_res.set_exception(RuntimeError("State was not solved"))
+
+            try:
+                astar_cpp.solve(self.env_name, self.env, [state for state, _, _ in requests],
+                                [weight for _, weight, _ in requests], self.batch_size, self.heuristic_fn,
+                                num_instances=self.max_instances, on_result=on_result)
+            except Exception as e:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+
+        for _, _, future in requests:
+            if future.set_running_or_notify_cancel():
+                future.set_exception(RuntimeError("Solver is closed"))
+
+
+class _Model:
+    """ A model and its solvers, one per batch size, created when first used """
+
+    def __init__(self, args: Namespace, env: Environment, model_dir: str):
+        start_time = time.time()
+        self.args: Namespace = args
+        self.env: Environment = env
+        self.model_dir: str = model_dir
+        self.heuristic_fn: Callable = astar.load_search_heuristic_fn(args, env, model_dir)
+        self.load_time: float = time.time() - start_time
+        self.warm: bool = False
+
+        # requests that have not finished, guarded by the model lock of the daemon
+        self.num_active: int = 0
+
+        self.solvers_lock = threading.Lock()
+        self.solvers: Dict[int, Any] = dict()
+
+    def get_solver(self, batch_size: int):
+        """ AsyncSolver, or _CppSolver with --language cpp, that searches with this batch size """
+        with self.solvers_lock:
+            if batch_size not in self.solvers:
+                args: Namespace = self.args
+                if args.language == "python":
+                    self.solvers[batch_size] = AsyncSolver(self.env, self.heuristic_fn, batch_size,
+                                                           weight=args.weight, max_instances=args.num_instances,
+                                                           engine=args.engine, open_set=args.open_set,
+                                                           pipeline=args.pipeline, prune_moves=args.prune_moves,
+                                                           canonicalize=args.canonicalize)
+                else:
+                    self.solvers[batch_size] = _CppSolver(args.env, self.env, self.heuristic_fn, batch_size,
+                                                          args.weight, args.num_instances)
+
+            return self.solvers[batch_size]
+
+    def close(self):
+        with self.solvers_lock:
+            solvers: List[Any] = list(self.solvers.values())
+            self.solvers = dict()
+
+        for solver in solvers:
+            solver.close()
+
+
+class SolverDaemon:
+    """ Keeps the environment and the heuristic function loaded, and solves states sent by clients over a UNIX
+    socket. Each client is served by its own thread.
+
+    The states of all requests are solved by one batch weighted A* search (see AsyncSolver), which admits the states of
+    new requests between steps and retires states as they are solved, up to --num_instances states at a time. Requests
+    with a different batch size are solved by another search. With --language cpp, the C++ search runs in this process
+    (cpp/libweighted_astar.so). It cannot take new states while it runs, so the states of requests that arrive during a
+    search are solved together by the next one.
+
+    A new model is loaded while searches go on with the current one, then swapped in. Requests that have started
+    finish with the model they started with.
+
+    Requests that start before a request has been solved with a model are cold, the others are warm. Latency is the
+    time from when the request is received to when its results are ready.
+    """
+
+    def __init__(self, args: Namespace, socket_name: str):
+        if args.language not in ["python", "cpp"]:
+            raise ValueError("Unknown language %s" % args.language)
+
+        self.args: Namespace = args
+        self.socket_name: str = socket_name
+        self.env: Environment = env_utils.get_environment(args.env)
+
+        self.model_lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+
+        self.model: _Model = _Model(args, self.env, args.model_dir)
+        self.num_reloads: int = 0
+
+        self.latencies: Dict[str, List[float]] = {"cold": [], "warm": []}
+        self.num_requests: int = 0
+        self.num_states_solved: int = 0
+        self.start_time: float = time.time()
+
+        self.sock: Optional[socket.socket] = None
+        self.running: bool = False
+
+    def solve(self, states: List[State], weight: Optional[float] = None,
+              batch_size: Optional[int] = None) -> List[Dict[str, Any]]:
+        """ Solve states with the current model
+
+        @param states: States to solve
+        @param weight: Weight of path cost, the weight of the daemon if None
+        @param batch_size: Batch size for BWAS, the batch size of the daemon if None
+        @return: For each state, its solution, the number of nodes generated and the time taken
+        """
+        start_time = time.time()
+
+        if weight is None:
+            weight = self.args.weight
+        if batch_size is None:
+            batch_size = self.args.batch_size
+
+        with self.model_lock:
+            model: _Model = self.model
+            model.num_active += 1
+
+        try:
+            cold: bool = not model.warm
+            futures: List[Future] = [model.get_solver(batch_size).submit(state, weight=weight) for state in states]
+            results_solver: List[Dict[str, Any]] = [future.result() for future in futures]
+            model.warm = True
+        finally:
+            self._release(model)
+
+        latency: float = time.time() - start_time
+        with self.stats_lock:
+            self.latencies["cold" if cold else "warm"].append(latency)
+            self.num_requests += 1
+            self.num_states_solved += len(states)
+
+        results: List[Dict[str, Any]] = []
+        for result in results_solver:
+            results.append({"solution": result["solution"], "num_nodes_generated": result["num_nodes_generated"],
+                            "time": result["time"], "model_dir": model.model_dir})
+
+        return results
+
+    def reload(self, model_dir: str):
+        """ Load the model in model_dir and use it for requests that start after this returns
+
+        @param model_dir: Directory of nnet model
+        """
+        model: _Model = _Model(self.args, self.env, model_dir)
+        with self.model_lock:
+            model_prev: _Model = self.model
+            self.model = model
+            self.num_reloads += 1
+            close_prev: bool = model_prev.num_active == 0
+
+        if close_prev:
+            model_prev.close()
+
+        print("Reloaded model from %s" % model_dir)
+
+    def _release(self, model: _Model):
+        # the searches of a replaced model are stopped when its last request finishes
+        with self.model_lock:
+            model.num_active -= 1
+            close: bool = (model is not self.model) and (model.num_active == 0)
+
+        if close:
+            model.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.model_lock:
+            model: _Model = self.model
+            num_reloads: int = self.num_reloads
+
+        with self.stats_lock:
+            return {"model_dir": model.model_dir, "model_load_time": model.load_time, "num_reloads": num_reloads,
+                    "uptime": time.time() - self.start_time,
+                    "num_requests": self.num_requests, "num_states_solved": self.num_states_solved,
+                    "latency": {name: get_latency_stats(latencies) for name, latencies in self.latencies.items()}}
+
+    def serve_forever(self):
+        if os.path.exists(self.socket_name):
+            os.unlink(self.socket_name)
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.socket_name)
+        os.chmod(self.socket_name, 0o600)
+        self.sock.listen()
+        self.running = True
+        print("Solver daemon listening on %s" % self.socket_name)
+
+        try:
+            while self.running:
+                try:
+                    conn, _ = self.sock.accept()
+                except OSError:
+                    break
+
+                client_thread = threading.Thread(target=self._serve_client, args=(conn,))
+                client_thread.daemon = True
+                client_thread.start()
+        finally:
+            self.running = False
+            self.sock.close()
+            with self.model_lock:
+                model: _Model = self.model
+            model.close()
+            if os.path.exists(self.socket_name):
+                os.unlink(self.socket_name)
+
+    def shutdown(self):
+        self.running = False
+        if self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _serve_client(self, conn: socket.socket):
+        with conn:
+            while True:
+                try:
+                    request: Optional[Dict[str, Any]] = recv_msg(conn)
+                except Exception as e:
+                    # bad size or data, the rest of the stream cannot be parsed
+                    print("Closing client connection: %s" % e)
+                    break
+
+                if request is None:
+                    break
+
+                cmd: Optional[str] = None
+                try:
+                    cmd = request["cmd"]
+                    if cmd == "solve":
+                        response = {"ok": True, "results": self.solve(request["states"], request.get("weight"),
+                                                                      request.get("batch_size"))}
+                    elif cmd == "reload":
+                        self.reload(request["model_dir"])
+                        response = {"ok": True}
+                    elif cmd == "stats":
+                        response = {"ok": True, "stats": self.get_stats()}
+                    elif cmd == "shutdown":
+                        response = {"ok": True}
+                    else:
+                        raise ValueError("Unknown command %s" % cmd)
+                except Exception as e:
+                    response = {"ok": False, "error": "%s: %s" % (type(e).__name__, e)}
+
+                send_msg(conn, response)
+                if cmd == "shutdown":
+                    self.shutdown()
+                    break
+
+
+class SolverClient:
+    """ Client of a SolverDaemon. Requests of one client are handled in order. """
+
+    def __init__(self, socket_name: str):
+        self.sock: socket.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socket_name)
+
+    def solve(self, states: List[State], weight: Optional[float] = None,
+              batch_size: Optional[int] = None) -> List[Dict[str, Any]]:
+        return self._request({"cmd": "solve", "states": states, "weight": weight, "batch_size": batch_size})["results"]
+
+    def reload(self, model_dir: str):
+        self._request({"cmd": "reload", "model_dir": model_dir})
+
+    def get_stats(self) -> Dict[str, Any]:
+        return self._request({"cmd": "stats"})["stats"]
+
+    def shutdown(self):
+        self._request({"cmd": "shutdown"})
+
+    def close(self):
+        self.sock.close()
+
+    def _request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        send_msg(self.sock, request)
+        response: Optional[Dict[str, Any]] = recv_msg(self.sock)
+        if response is None:
+            raise ConnectionError("Solver daemon closed the connection")
+        if not response["ok"]:
+            raise RuntimeError(response["error"])
+
+        return response
+
+
+def main():
+    # parse arguments
+    parser: ArgumentParser = ArgumentParser()
+    astar.add_search_args(parser)
+    parser.add_argument('--socket', type=str, required=True, help="UNIX socket the daemon listens on")
+
+    args = parser.parse_args()
+
+    daemon: SolverDaemon = SolverDaemon(args, args.socket)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+    print(format_stats(daemon.get_stats()))
+
+
+if __name__ == "__main__":
+    main()
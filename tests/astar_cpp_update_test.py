@@ -0,0 +1,68 @@
+from typing import List, Dict
+from argparse import ArgumentParser
+import numpy as np
+
+from environments.environment_abstract import Environment, State
+from utils import env_utils
+from updaters.updater import astar_update, astar_cpp_update
+
+import time
+
+
+def get_ctg_by_state(env: Environment, states: List[State], cost_to_go: np.ndarray) -> Dict[bytes, float]:
+    states_np: np.ndarray = env.states_to_np(states)
+    return {state_np.tobytes(): float(ctg) for state_np, ctg in zip(states_np, cost_to_go)}
+
+
+def main():
+    # parse arguments
+    parser: ArgumentParser = ArgumentParser()
+    parser.add_argument('--env', type=str, required=True, help="")
+    parser.add_argument('--num_states', type=int, default=200, help="")
+    parser.add_argument('--back_max', type=int, default=30, help="")
+    parser.add_argument('--num_steps', type=int, default=10, help="")
+
+    args = parser.parse_args()
+
+    env: Environment = env_utils.get_environment(args.env)
+
+    # deterministic heuristic with few ties, so that the backups depend on which children are seen
+    def heuristic_fn(states_h, is_nnet_format: bool = False) -> np.ndarray:
+        states_nnet: np.ndarray = states_h[0] if is_nnet_format else env.state_to_nnet_input(states_h)[0]
+        coeffs: np.ndarray = np.arange(1, states_nnet.shape[1] + 1) * 7919
+        return ((states_nnet.astype(np.int64) * coeffs).sum(axis=1) % 13).astype(np.float64)
+
+    states: List[State]
+    states, _ = env.generate_states(args.num_states, (0, args.back_max))
+
+    for num_steps in [1, args.num_steps]:
+        np.random.seed(0)
+        start_time = time.time()
+        states_py, ctg_py, is_solved_py = astar_update(states, env, num_steps, heuristic_fn)
+        py_time = time.time() - start_time
+
+        np.random.seed(0)
+        start_time = time.time()
+        states_cpp, ctg_cpp, is_solved_cpp = astar_cpp_update(states, env, num_steps, heuristic_fn)
+        cpp_time = time.time() - start_time
+
+        # the searches break ties differently, so after the first step they can pop different nodes, but a state
+        # popped by both has the same backup
+        ctg_by_state_py: Dict[bytes, float] = get_ctg_by_state(env, states_py, ctg_py)
+        ctg_by_state_cpp: Dict[bytes, float] = get_ctg_by_state(env, states_cpp, ctg_cpp)
+        states_both: List[bytes] = [x for x in ctg_by_state_py.keys() if x in ctg_by_state_cpp]
+        for state_bytes in states_both:
+            assert abs(ctg_by_state_py[state_bytes] - ctg_by_state_cpp[state_bytes]) < 1e-5, \
+                "Bellman backups of the same state differ"
+
+        if num_steps == 1:
+            assert sorted(ctg_by_state_py.items()) == sorted(ctg_by_state_cpp.items()), "First step differs"
+            assert np.array_equal(is_solved_py, is_solved_cpp), "Solved states differ"
+
+        print("%i step(s) - python: %i states, %i solved (%.3f secs), c++: %i states, %i solved (%.3f secs), "
+              "%i popped by both" % (num_steps, len(states_py), int(np.sum(is_solved_py)), py_time, len(states_cpp),
+                                     int(np.sum(is_solved_cpp)), cpp_time, len(states_both)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+from typing import List, Dict, Any
+from argparse import ArgumentParser
+import numpy as np
+import pickle
+
+from environments.environment_abstract import Environment, State
+from utils import env_utils, search_utils
+from search_methods.astar import create_astar, get_instance_path
+
+import time
+
+
+def get_move_idx(env: Environment, move) -> int:
+    # moves in the test sets are names, or [face, direction] for the cubes
+    if isinstance(move, str):
+        return env.moves.index(move)
+    else:
+        return env.moves.index("%s%i" % (move[0], move[1]))
+
+
+def load_test_states(env: Environment, data_file: str, num_states: int, depth: int) -> List[State]:
+    """ States of a test set, moved along their solution until at most depth moves are left """
+    data: Dict[str, Any] = pickle.load(open(data_file, "rb"))
+
+    states: List[State] = []
+    for state, soln in zip(data['states'][:num_states], data['solutions'][:num_states]):
+        for move in soln[:max(len(soln) - depth, 0)]:
+            state = env.next_state([state], get_move_idx(env, move))[0][0]
+        states.append(state)
+
+    return states
+
+
+def solve(engine: str, pipeline: bool, states: List[State], env: Environment, heuristic_fn, weight: float,
+          batch_size: int, max_steps: int) -> List[List[int]]:
+    search_name: str = "%s%s" % (engine, " pipeline" if pipeline else "")
+    start_time = time.time()
+    astar = create_astar(engine, states, env, heuristic_fn, [weight] * len(states), pipeline=pipeline)
+    num_steps: int = 0
+    while (not all(astar.has_found_goal())) and (num_steps < max_steps):
+        astar.step(heuristic_fn, batch_size)
+        num_steps += 1
+
+    astar.close()
+    assert all(astar.has_found_goal()), "%s search did not solve all states" % search_name
+
+    solns: List[List[int]] = []
+    for inst_idx, state in enumerate(states):
+        soln: List[int] = get_instance_path(astar, inst_idx, env)[1]
+        assert search_utils.is_valid_soln(state, soln, env), "%s search gave an invalid solution" % search_name
+        solns.append(soln)
+
+    num_nodes_gen: int = sum(astar.get_num_nodes_generated(inst_idx) for inst_idx in range(len(states)))
+    print("%s - %i steps, %i nodes generated, %.2f seconds, solution lengths: %s" % (
+        search_name, num_steps, num_nodes_gen, time.time() - start_time, [len(soln) for soln in solns]))
+
+    return solns
+
+
+def main():
+    # parse arguments
+    parser: ArgumentParser = ArgumentParser()
+    parser.add_argument('--envs', type=str, default="puzzle15,cube3", help="Comma separated environments")
+    parser.add_argument('--depths', type=str, default="20,5", help="Number of moves of the solution of each test "
+                                                                  "state that are left, for each environment")
+    parser.add_argument('--pipeline_depths', type=str, default="12,4", help="Number of moves left of the states "
+                                                                             "that the pipelined and serial "
+                                                                             "search solve")
+    parser.add_argument('--num_states', type=int, default=8, help="")
+    parser.add_argument('--weight', type=float, default=0.2, help="")
+    parser.add_argument('--batch_size', type=int, default=100, help="")
+    parser.add_argument('--max_steps', type=int, default=10000, help="")
+
+    args = parser.parse_args()
+
+    for env_name, depth, pipeline_depth in zip(args.envs.split(","), args.depths.split(","),
+                                               args.pipeline_depths.split(",")):
+        env: Environment = env_utils.get_environment(env_name)
+        states: List[State] = load_test_states(env, "data/%s/test/data_0.pkl" % env_name, args.num_states,
+                                               int(depth))
+
+        # number of nnet inputs that differ from those of the goal, so that the search does not depend on a trained
+        # model
+        goal_nnet: np.ndarray = env.state_to_nnet_input(env.generate_goal_states(1))[0]
+
+        def heuristic_fn(states_h, is_nnet_format: bool = False) -> np.ndarray:
+            states_h_nnet: np.ndarray = states_h[0] if is_nnet_format else env.state_to_nnet_input(states_h)[0]
+            return np.sum(states_h_nnet != goal_nnet, axis=1).astype(np.float64)
+
+        print(env_name)
+        solns_engines: List[List[List[int]]] = []
+        for engine in ["object", "array"]:
+            solns_engines.append(solve(engine, False, states, env, heuristic_fn, args.weight, args.batch_size,
+                                       args.max_steps))
+
+        assert solns_engines[0] == solns_engines[1], "The object and array engines give different solutions"
+
+        # the pipelined search pops from an open set that is missing the children of one batch, so it can find other
+        # solutions. With weight 1 and a heuristic that does not overestimate (no move changes more than
+        # max_changed inputs), the serial search finds the shortest solutions, and the pipelined one should as well
+        # for states this close to the goal.
+        states = load_test_states(env, "data/%s/test/data_0.pkl" % env_name, args.num_states, int(pipeline_depth))
+        goal_states: List[State] = env.generate_goal_states(1)
+        max_changed: int = max(int(np.sum(env.state_to_nnet_input(env.next_state(goal_states, move)[0])[0] !=
+                                          goal_nnet)) for move in range(env.get_num_moves()))
+
+        def heuristic_fn_adm(states_h, is_nnet_format: bool = False) -> np.ndarray:
+            return heuristic_fn(states_h, is_nnet_format=is_nnet_format) / max_changed
+
+        print("%s shortest solutions" % env_name)
+        for engine in ["object", "array"]:
+            solns_serial: List[List[int]] = solve(engine, False, states, env, heuristic_fn_adm, 1.0, args.batch_size,
+                                                  args.max_steps)
+            solns_pipeline: List[List[int]] = solve(engine, True, states, env, heuristic_fn_adm, 1.0, args.batch_size,
+                                                    args.max_steps)
+            assert [len(soln) for soln in solns_serial] == [len(soln) for soln in solns_pipeline], \
+                "The pipelined %s search gives solutions of different lengths than the serial one" % engine
+
+        print("")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+from typing import List
+from argparse import ArgumentParser
+import numpy as np
+
+from environments.environment_abstract import Environment, State
+from utils import env_utils
+from search_methods.astar import AStar
+from search_methods.astar_array import ArrayAStar
+
+import tracemalloc
+import time
+
+
+def main():
+    # parse arguments
+    parser: ArgumentParser = ArgumentParser()
+    parser.add_argument('--env', type=str, required=True, help="")
+    parser.add_argument('--back_max', type=int, default=30, help="")
+    parser.add_argument('--batch_size', type=int, default=1000, help="")
+    parser.add_argument('--num_steps', type=int, default=50, help="")
+
+    args = parser.parse_args()
+
+    # get environment
+    env: Environment = env_utils.get_environment(args.env)
+
+    states: List[State]
+    states, _ = env.generate_states(1, (args.back_max, args.back_max))
+
+    # random heuristic, so that the memory of the search, not of the nnet, is measured
+    def heuristic_fn(states_h, is_nnet_format: bool = False) -> np.ndarray:
+        num_states: int = states_h[0].shape[0] if is_nnet_format else len(states_h)
+        return np.random.rand(num_states) * args.back_max
+
+    for name, make_astar in [("object", lambda: AStar(states, env, heuristic_fn, [1.0])),
+                             ("object lean", lambda: AStar(states, env, heuristic_fn, [1.0], lean=True)),
+                             ("object lean bucket", lambda: AStar(states, env, heuristic_fn, [1.0], lean=True,
+                                                                  open_set="bucket")),
+                             ("array", lambda: ArrayAStar(states, env, heuristic_fn, [1.0]))]:
+        np.random.seed(0)
+        tracemalloc.start()
+        start_time = time.time()
+
+        astar = make_astar()
+        for _ in range(args.num_steps):
+            astar.step(heuristic_fn, args.batch_size)
+
+        num_bytes, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        elapsed_time = time.time() - start_time
+        num_nodes_gen: int = astar.get_num_nodes_generated(0)
+        print("%s - Generated %i nodes in %.2f seconds, memory: %.2f MB (%.2f bytes/node)" % (
+            name, num_nodes_gen, elapsed_time, num_bytes / 1e6, num_bytes / num_nodes_gen))
+
+        del astar
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+from typing import List, Dict
+from argparse import ArgumentParser
+import pickle
+import torch
+
+from environments.environment_abstract import Environment, State
+from utils import env_utils, nnet_utils
+from search_methods.astar import create_astar
+
+import time
+
+
+def time_search(engine: str, pipeline: bool, states: List[State], env: Environment, heuristic_fn, weight: float,
+                batch_size: int, num_steps: int) -> Dict[str, float]:
+    astar = create_astar(engine, states, env, heuristic_fn, [weight] * len(states), pipeline=pipeline)
+
+    start_time = time.time()
+    for _ in range(num_steps):
+        astar.step(heuristic_fn, batch_size, include_solved=True)
+
+    astar.finish_pending()
+    elapsed_time = time.time() - start_time
+
+    timing_str = ", ".join(["%s: %.2f" % (key, val) for key, val in astar.timings.items()])
+    print("%s %s - %s, total: %.2f" % (engine, "pipeline" if pipeline else "serial", timing_str, elapsed_time))
+
+    return astar.timings
+
+
+def main():
+    # parse arguments
+    parser: ArgumentParser = ArgumentParser()
+    parser.add_argument('--env', type=str, required=True, help="")
+    parser.add_argument('--states', type=str, required=True, help="File containing states to solve")
+    parser.add_argument('--num_states', type=int, default=10, help="Number of states solved at the same time")
+    parser.add_argument('--batch_size', type=int, default=100, help="Batch size for BWAS")
+    parser.add_argument('--num_steps', type=int, default=50, help="")
+    parser.add_argument('--weight', type=float, default=0.6, help="")
+    parser.add_argument('--engines', type=str, default="object,array", help="Comma separated engines")
+
+    args = parser.parse_args()
+
+    env: Environment = env_utils.get_environment(args.env)
+    states: List[State] = pickle.load(open(args.states, "rb"))['states'][:args.num_states]
+
+    # untrained nnet, the time to evaluate it does not depend on its weights
+    torch.manual_seed(0)
+    device = torch.device("cpu")
+    nnet = env.get_nnet_model()
+    nnet.to(device)
+    nnet.eval()
+    heuristic_fn = nnet_utils.get_heuristic_fn(nnet, device, env)
+
+    for engine in args.engines.split(","):
+        timings_serial: Dict[str, float] = time_search(engine, False, states, env, heuristic_fn, args.weight,
+                                                       args.batch_size, args.num_steps)
+        timings_pipeline: Dict[str, float] = time_search(engine, True, states, env, heuristic_fn, args.weight,
+                                                         args.batch_size, args.num_steps)
+
+        print("%s speedup: %.2f" % (engine, timings_serial["itr"] / timings_pipeline["itr"]))
+        print("")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+from typing import List, Dict, Any, Callable
+from argparse import ArgumentParser
+from torch import nn
+import numpy as np
+import threading
+import asyncio
+import torch
+import time
+
+from environments.environment_abstract import Environment, State
+from utils import env_utils, nnet_utils, search_utils
+from search_methods.async_solver import AsyncSolver
+
+
+async def solve_all(solver: AsyncSolver, states: List[State], weights: List[float], arrival_times: List[float],
+                    timeout: float) -> List[Any]:
+    async def solve_one(state: State, weight: float, arrival_time: float):
+        await asyncio.sleep(arrival_time)
+        return await solver.solve(state, weight=weight, deadline=time.time() + timeout)
+
+    return await asyncio.gather(*[solve_one(state, weight, arrival_time) for state, weight, arrival_time in
+                                  zip(states, weights, arrival_times)], return_exceptions=True)
+
+
+def exclusive_heuristic_fn(heuristic_fn: Callable) -> Callable:
+    # fails if the heuristic function is called while it is already running, such as by a new search while the
+    # pipelined search before it still evaluates a batch
+    lock = threading.Lock()
+
+    def heuristic_fn_excl(*args, **kwargs):
+        assert lock.acquire(blocking=False), "Heuristic function called while it is running"
+        try:
+            return heuristic_fn(*args, **kwargs)
+        finally:
+            lock.release()
+
+    return heuristic_fn_excl
+
+
+def main():
+    # parse arguments
+    parser: ArgumentParser = ArgumentParser()
+    parser.add_argument('--env', type=str, default="puzzle15", help="")
+    parser.add_argument('--model_dir', type=str, default="", help="Directory of a trained nnet. A random nnet is "
+                                                                  "used if not given.")
+    parser.add_argument('--num_states', type=int, default=50, help="")
+    parser.add_argument('--back_max', type=int, default=10, help="")
+    parser.add_argument('--batch_size', type=int, default=10, help="")
+    parser.add_argument('--max_instances', type=int, default=20, help="")
+    parser.add_argument('--arrival_rate', type=float, default=100.0, help="Mean number of requests per second")
+    parser.add_argument('--engine', type=str, default="object", help="object or array")
+    parser.add_argument('--pipeline', action='store_true', default=False, help="")
+
+    args = parser.parse_args()
+
+    env: Environment = env_utils.get_environment(args.env)
+    device = torch.device("cpu")
+    nnet: nn.Module = env.get_nnet_model()
+    if len(args.model_dir) > 0:
+        nnet = nnet_utils.load_nnet("%s/model_state_dict.pt" % args.model_dir, nnet, device=device)
+    else:
+        torch.manual_seed(0)
+    heuristic_fn = exclusive_heuristic_fn(nnet_utils.get_heuristic_fn(nnet, device, env, clip_zero=True))
+
+    np.random.seed(0)
+    states: List[State]
+    states, _ = env.generate_states(args.num_states, (0, args.back_max))
+    weights: List[float] = list(np.random.choice([0.2, 0.6, 1.0], size=len(states)))
+    arrival_times: List[float] = list(np.cumsum(np.random.exponential(1.0 / args.arrival_rate, size=len(states))))
+
+    solver: AsyncSolver = AsyncSolver(env, heuristic_fn, args.batch_size, max_instances=args.max_instances,
+                                      engine=args.engine, pipeline=args.pipeline)
+
+    # a deadline that has already passed times out
+    start_time = time.time()
+    results: List[Any] = asyncio.run(solve_all(solver, states, weights, arrival_times, 1000.0))
+    timed_out = asyncio.run(solve_all(solver, states[:1], [1.0], [0.0], -1.0))[0]
+    elapsed_time = time.time() - start_time
+
+    for state, result in zip(states, results):
+        assert not isinstance(result, BaseException), result
+        assert search_utils.is_valid_soln(state, result["solution"], env)
+    assert isinstance(timed_out, TimeoutError), "Request with a passed deadline did not time out"
+
+    metrics: Dict[str, Any] = solver.get_metrics()
+    solver.close()
+
+    results_w: Dict[float, List[Dict[str, Any]]] = dict()
+    for weight, result in zip(weights, results):
+        results_w.setdefault(weight, []).append(result)
+
+    print("Solved %i states in %.2f secs" % (len(results), elapsed_time))
+    for weight in sorted(results_w.keys()):
+        print("Weight %.1f - mean path cost: %.2f, mean nodes generated: %.1f, mean time: %.3f secs, "
+              "mean queue time: %.3f secs" % (weight, np.mean([result["path_cost"] for result in results_w[weight]]),
+                                              np.mean([result["num_nodes_generated"]
+                                                       for result in results_w[weight]]),
+                                              np.mean([result["time"] for result in results_w[weight]]),
+                                              np.mean([result["queue_time"] for result in results_w[weight]])))
+    print("Steps: %i, max queue depth: %i, instance fill: %.2f, mean heuristic batch size: %.1f, solved: %i, "
+          "timed out: %i" % (metrics["num_steps"], metrics["max_queue_depth"], metrics["instance_fill"],
+                             metrics["mean_heur_batch_size"], metrics["num_solved"], metrics["num_timed_out"]))
+    assert metrics["num_timed_out"] == 1
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+from typing import List
+from argparse import ArgumentParser
+import numpy as np
+import torch
+
+from environments.environment_abstract import Environment, State
+from search_methods.astar import AStar
+from utils import env_utils, nnet_utils, search_utils
+
+import time
+
+
+def main():
+    # parse arguments
+    parser: ArgumentParser = ArgumentParser()
+    parser.add_argument('--envs', type=str, default="cube3,puzzle15,puzzle48,lightsout7",
+                        help="Comma separated environments")
+    parser.add_argument('--num_states', type=int, default=500, help="")
+    parser.add_argument('--back_max', type=int, default=30, help="")
+    parser.add_argument('--num_threads', type=int, default=0, help="Number of CPU threads, the pytorch default if 0")
+
+    args = parser.parse_args()
+
+    if args.num_threads > 0:
+        torch.set_num_threads(args.num_threads)
+    device = torch.device("cpu")
+
+    for env_name in args.envs.split(","):
+        env: Environment = env_utils.get_environment(env_name)
+        print("%s" % env_name)
+
+        states: List[State]
+        states, _ = env.generate_states(args.num_states, (0, args.back_max))
+        states_np: np.ndarray = env.states_to_np(states)
+        states_c_np, _ = env.expand_np(states_np)
+        states_c_nnet: List[np.ndarray] = env.np_to_nnet_input(states_c_np.reshape((-1,) + states_np.shape[1:]))
+
+        torch.manual_seed(0)
+        nnet: torch.nn.Module = env.get_nnet_model()
+        nnet_utils.randomize_batch_norm(nnet)
+
+        heuristic_fn = nnet_utils.get_heuristic_fn(nnet, device, env)
+        heuristic_fn_children = nnet_utils.get_children_heuristic_fn(nnet, device, env)
+
+        # children evaluated from scratch and from their parents
+        start_time = time.time()
+        ctg_full: np.ndarray = heuristic_fn(states_c_nnet, is_nnet_format=True)
+        full_time = time.time() - start_time
+
+        start_time = time.time()
+        ctg_children: np.ndarray = heuristic_fn_children(states_np, states_c_np)
+        children_time = time.time() - start_time
+
+        max_diff: float = float(np.max(np.abs(ctg_full - ctg_children.reshape(-1))))
+        assert np.allclose(ctg_full, ctg_children.reshape(-1), rtol=1e-5, atol=1e-4), \
+            "Heuristic values of children computed from their parents differ"
+
+        # Bellman backups
+        start_time = time.time()
+        ctg_backup, _, _ = search_utils.bellman(states, heuristic_fn, env)
+        bellman_time = time.time() - start_time
+
+        start_time = time.time()
+        ctg_backup_children, _, _ = search_utils.bellman(states, heuristic_fn, env,
+                                                         heuristic_fn_children=heuristic_fn_children)
+        bellman_children_time = time.time() - start_time
+
+        assert np.allclose(ctg_backup, ctg_backup_children, rtol=1e-5, atol=1e-4), "Bellman backups differ"
+
+        # a step of A* that keeps the children of the nodes it expands
+        heurs_astar: List[np.ndarray] = []
+        astar_times: List[float] = []
+        for heuristic_fn_children_astar in [None, heuristic_fn_children]:
+            astar: AStar = AStar(states, env, heuristic_fn, [1.0] * len(states))
+            start_time = time.time()
+            astar.step(heuristic_fn, 1, include_solved=True, heuristic_fn_children=heuristic_fn_children_astar)
+            astar_times.append(time.time() - start_time)
+
+            heurs_astar.append(np.array([node_c.heuristic for instance in astar.instances
+                                         for node_c in instance.root_node.children]))
+
+        assert np.allclose(heurs_astar[0], heurs_astar[1], rtol=1e-5, atol=1e-4), "A* heuristic values differ"
+
+        print("%i children, max difference: %.2E" % (ctg_full.shape[0], max_diff))
+        print("Heuristic - full: %.3f secs, from parents: %.3f secs" % (full_time, children_time))
+        print("Bellman - full: %.3f secs, from parents: %.3f secs" % (bellman_time, bellman_children_time))
+        print("A* step - full: %.3f secs, from parents: %.3f secs" % (astar_times[0], astar_times[1]))
+        print("")
+
+
+if __name__ == "__main__":
+    main()
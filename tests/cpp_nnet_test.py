@@ -0,0 +1,76 @@
+from typing import List
+from argparse import ArgumentParser
+from torch import nn
+import numpy as np
+import torch
+import time
+import os
+
+from environments.environment_abstract import Environment, State
+from utils import env_utils, nnet_utils
+from search_methods import astar_cpp
+
+
+def main():
+    # parse arguments
+    parser: ArgumentParser = ArgumentParser()
+    parser.add_argument('--env', type=str, default="cube3", help="Environment")
+    parser.add_argument('--model_dir', type=str, default="", help="Directory of a trained nnet. A random nnet is "
+                                                                  "used if not given.")
+    parser.add_argument('--num_states', type=int, default=2000, help="")
+    parser.add_argument('--back_max', type=int, default=30, help="")
+    parser.add_argument('--nnet_file', type=str, default="cpp_nnet_test.bin", help="")
+    parser.add_argument('--tol', type=float, default=1e-3, help="Largest difference to the pytorch values, relative "
+                                                                "to the largest pytorch value")
+
+    args = parser.parse_args()
+
+    env: Environment = env_utils.get_environment(args.env)
+    device = torch.device("cpu")
+
+    nnet: nn.Module = env.get_nnet_model()
+    if len(args.model_dir) > 0:
+        nnet = nnet_utils.load_nnet("%s/model_state_dict.pt" % args.model_dir, nnet, device=device)
+    else:
+        torch.manual_seed(0)
+        nnet_utils.randomize_batch_norm(nnet)
+        nnet.fc_out.bias.data.fill_(10.0)
+    nnet.eval()
+
+    nnet_utils.export_resnet(nnet, env, args.nnet_file)
+    heuristic_fn = nnet_utils.get_heuristic_fn(nnet, device, env, clip_zero=True)
+
+    states: List[State]
+    states, _ = env.generate_states(args.num_states, (0, args.back_max))
+    states_np: np.ndarray = env.states_to_np(states)
+
+    with torch.no_grad():
+        start_time = time.time()
+        heurs_torch: np.ndarray = heuristic_fn(env.np_to_nnet_input(states_np), is_nnet_format=True)
+        torch_time = time.time() - start_time
+
+    start_time = time.time()
+    heurs_cpp: np.ndarray = astar_cpp.nnet_heuristics(args.nnet_file, states_np)
+    cpp_time = time.time() - start_time
+
+    # a value outside of the one-hot input is an error, as in pytorch
+    if nnet.one_hot_depth > 0:
+        states_bad_np: np.ndarray = states_np[:1].copy()
+        states_bad_np[0, 0] = 255
+        try:
+            astar_cpp.nnet_heuristics(args.nnet_file, states_bad_np)
+            raise AssertionError("C++ nnet accepted a value outside of the one-hot input")
+        except ValueError:
+            pass
+
+    os.remove(args.nnet_file)
+
+    max_diff: float = float(np.max(np.abs(heurs_cpp - heurs_torch)))
+    scale: float = max(float(np.max(np.abs(heurs_torch))), 1.0)
+    print("%i states - pytorch: %.3f secs, c++: %.3f secs, max difference: %.2E (mean value %.2f)" % (
+        len(states), torch_time, cpp_time, max_diff, float(np.mean(heurs_torch))))
+    assert max_diff <= args.tol * scale, "C++ nnet values do not match pytorch"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+from typing import List, Optional
+from argparse import ArgumentParser
+from subprocess import Popen, PIPE
+from threading import Thread
+import numpy as np
+import os
+import socket
+
+from search_methods.cpp_transport import CppTransport
+from utils.shm_utils import get_shm_name
+
+
+def serve(transport: CppTransport):
+    # the value of a state is its first element, which cpp/transport_benchmark checks
+    transport.accept()
+    while True:
+        states_np: Optional[np.ndarray] = transport.recv_states()
+        if states_np is None:
+            break
+
+        transport.send_heuristics(states_np[:, 0].astype(np.float32))
+
+
+def time_transport(shm_name: Optional[str], socket_name: str, state_dim: int, num_requests: int,
+                   num_states_l: List[int]):
+    if os.path.exists(socket_name):
+        os.unlink(socket_name)
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(socket_name)
+    sock.listen(1)
+
+    server = Thread(target=serve, args=(CppTransport(sock, state_dim, np.uint8, shm_name=shm_name),))
+    server.daemon = True
+    server.start()
+
+    cmd: List[str] = ['./cpp/transport_benchmark', socket_name, "-" if shm_name is None else shm_name,
+                      str(state_dim), str(num_requests)] + [str(x) for x in num_states_l]
+    popen = Popen(cmd, stdout=PIPE, universal_newlines=True)
+    for stdout_line in iter(popen.stdout.readline, ""):
+        print(stdout_line.strip('\n'))
+
+    popen.wait()
+    assert popen.returncode == 0, "transport_benchmark exited with code %i" % popen.returncode
+
+    server.join()
+    os.unlink(socket_name)
+
+
+def main():
+    # parse arguments
+    parser: ArgumentParser = ArgumentParser()
+    parser.add_argument('--num_states', type=str, default="10000,50000,100000,500000", help="Comma separated "
+                                                                                          "number of states per "
+                                                                                          "request")
+    parser.add_argument('--state_dim', type=int, default=54, help="")
+    parser.add_argument('--num_requests', type=int, default=20, help="")
+    parser.add_argument('--socket_name', type=str, default="transport_timing_socket", help="")
+
+    args = parser.parse_args()
+
+    num_states_l: List[int] = [int(x) for x in args.num_states.split(",")]
+
+    print("socket")
+    time_transport(None, args.socket_name, args.state_dim, args.num_requests, num_states_l)
+
+    print("")
+    print("shm")
+    time_transport(get_shm_name(args.socket_name), args.socket_name, args.state_dim, args.num_requests, num_states_l)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+from typing import List
+from argparse import ArgumentParser
+import numpy as np
+
+from environments.cube3 import Cube3, Cube3State
+from utils import search_utils
+from search_methods.astar import AStar, get_path
+from search_methods import astar_array
+from search_methods.astar_array import ArrayAStar
+
+
+def main():
+    # parse arguments
+    parser: ArgumentParser = ArgumentParser()
+    parser.add_argument('--num_states', type=int, default=20, help="")
+    parser.add_argument('--back_max', type=int, default=6, help="")
+    parser.add_argument('--batch_size', type=int, default=100, help="")
+    parser.add_argument('--max_steps', type=int, default=1000, help="")
+
+    args = parser.parse_args()
+
+    env: Cube3 = Cube3()
+    num_syms: int = env.sym_perms.shape[0]
+    assert num_syms == 48, "Found %i symmetries" % num_syms
+
+    states: List[Cube3State]
+    states, _ = env.generate_states(args.num_states, (1, args.back_max))
+    states_np: np.ndarray = env.states_to_np(states)
+
+    # symmetric states have the same canonical state, which maps back to the state
+    states_canon_np, sym_idxs = env.canonicalize_np(states_np)
+    for _ in range(10):
+        states_sym_np: np.ndarray = env.apply_symmetry_np(states_np, np.random.randint(0, num_syms, len(states)))
+        assert np.array_equal(env.canonicalize_np(states_sym_np)[0], states_canon_np)
+
+    assert np.array_equal(env.apply_symmetry_np(states_canon_np, env.sym_idxs_inv[sym_idxs]), states_np)
+    print("Canonicalized %i states" % len(states))
+
+    # number of stickers with the wrong color, which is the same for symmetric states
+    goal_nnet: np.ndarray = env.np_to_nnet_input(np.expand_dims(env.goal_colors, 0))[0]
+
+    def heuristic_fn(states_h, is_nnet_format: bool = False) -> np.ndarray:
+        states_nnet: np.ndarray = states_h[0] if is_nnet_format else env.state_to_nnet_input(states_h)[0]
+        return np.sum(states_nnet != goal_nnet, axis=1) / 8.0
+
+    # solutions of canonical states are valid for the original states once their moves are mapped back
+    for state, state_canon_np, sym_idx in zip(states, states_canon_np, sym_idxs):
+        astar = AStar([Cube3State(state_canon_np)], env, heuristic_fn, [1.0])
+        for _ in range(args.max_steps):
+            if astar.has_found_goal()[0]:
+                break
+            astar.step(heuristic_fn, args.batch_size)
+
+        moves_canon: List[int] = get_path(astar.get_goal_node_smallest_path_cost(0))[1]
+        moves: List[int] = [int(env.sym_move_maps[env.sym_idxs_inv[sym_idx], move]) for move in moves_canon]
+        assert search_utils.is_valid_soln(state, moves, env)
+
+    print("Mapped back %i solutions" % len(states))
+
+    # search with a canonical closed set keeps the states of the nodes, so solutions are valid as they are
+    for name, make_astar in [("object", lambda canon: AStar(states, env, heuristic_fn, [1.0] * len(states),
+                                                            canonicalize=canon)),
+                             ("array", lambda canon: ArrayAStar(states, env, heuristic_fn, [1.0] * len(states),
+                                                                canonicalize=canon))]:
+        for canonicalize in [False, True]:
+            astar = make_astar(canonicalize)
+            for _ in range(args.max_steps):
+                if min(astar.has_found_goal()):
+                    break
+                astar.step(heuristic_fn, args.batch_size)
+
+            num_nodes_gen: int = 0
+            num_nodes_eval: int = 0
+            for inst_idx, state in enumerate(states):
+                if name == "object":
+                    moves = get_path(astar.get_goal_node_smallest_path_cost(inst_idx))[1]
+                else:
+                    moves = astar_array.get_path(astar.instances[inst_idx],
+                                                 astar.get_goal_node_smallest_path_cost(inst_idx), env)[1]
+                assert search_utils.is_valid_soln(state, moves, env)
+                num_nodes_gen += astar.get_num_nodes_generated(inst_idx)
+                num_nodes_eval += astar.get_num_nodes_evaluated(inst_idx)
+
+            print("%s, canonicalize: %s - Generated %i nodes, evaluated %i nodes" % (
+                name, canonicalize, num_nodes_gen, num_nodes_eval))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+from typing import List
+from argparse import ArgumentParser
+from threading import Thread
+from torch import nn
+import numpy as np
+import itertools
+import tempfile
+import torch
+import time
+
+from environments.environment_abstract import Environment, State
+from utils import env_utils, nnet_utils
+
+
+def run_client(heur_fn_i_q, heur_fn_o_q, proc_id: int, env: Environment, transport: str,
+               states_l: List[List[State]], heurs_l: List[np.ndarray]):
+    heuristic_fn = nnet_utils.heuristic_fn_queue(heur_fn_i_q, heur_fn_o_q, proc_id, env, transport=transport)
+    for states in states_l:
+        heurs_l.append(heuristic_fn(states))
+
+
+def main():
+    # parse arguments
+    parser: ArgumentParser = ArgumentParser()
+    parser.add_argument('--env', type=str, default="puzzle15", help="")
+    parser.add_argument('--num_clients', type=int, default=30, help="Number of clients sending requests at once")
+    parser.add_argument('--num_requests', type=int, default=3, help="Number of requests of each client")
+    parser.add_argument('--max_request_size', type=int, default=200, help="Requests have 1 to this many states")
+    parser.add_argument('--batch_size', type=int, default=1024, help="Largest batch of the heuristic runner")
+    parser.add_argument('--max_waits', type=str, default="0,0.01", help="Comma separated max wait times to compare")
+    parser.add_argument('--transports', type=str, default="shm,queue", help="Comma separated transports to compare")
+
+    args = parser.parse_args()
+
+    env: Environment = env_utils.get_environment(args.env)
+    device = torch.device("cpu")
+
+    np.random.seed(0)
+    states_ll: List[List[List[State]]] = []
+    for _ in range(args.num_clients):
+        states_ll.append([env.generate_states(np.random.randint(1, args.max_request_size + 1), (0, 30))[0]
+                          for _ in range(args.num_requests)])
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        torch.manual_seed(0)
+        nnet: nn.Module = env.get_nnet_model()
+        torch.save(nnet.state_dict(), "%s/model_state_dict.pt" % model_dir)
+        heuristic_fn = nnet_utils.load_heuristic_fn(model_dir, device, False, env.get_nnet_model(), env,
+                                                    clip_zero=True)
+
+        max_waits: List[float] = [float(x) for x in args.max_waits.split(",")]
+        for transport, max_wait in itertools.product(args.transports.split(","), max_waits):
+            heur_fn_i_q, heur_fn_o_qs, heur_procs = nnet_utils.start_heur_fn_runners(args.num_clients, model_dir,
+                                                                                     device, False, env,
+                                                                                     clip_zero=True,
+                                                                                     batch_size=args.batch_size,
+                                                                                     max_wait=max_wait)
+            nnet_utils.heuristic_fn_par(states_ll[0][0], env, heur_fn_i_q, heur_fn_o_qs, batch_size=args.batch_size,
+                                        transport=transport)  # initialize
+
+            start_time = time.time()
+            heurs_ll: List[List[np.ndarray]] = []
+            client_threads: List[Thread] = []
+            for proc_id, states_l in enumerate(states_ll):
+                heurs_l: List[np.ndarray] = []
+                client_thread: Thread = Thread(target=run_client, args=(heur_fn_i_q, heur_fn_o_qs[proc_id], proc_id,
+                                                                        env, transport, states_l, heurs_l))
+                client_thread.start()
+                heurs_ll.append(heurs_l)
+                client_threads.append(client_thread)
+
+            for client_thread in client_threads:
+                client_thread.join()
+            elapsed_time = time.time() - start_time
+
+            # a request split across output queues
+            states_all: List[State] = [state for states_l in states_ll for states in states_l for state in states]
+            heurs_par: np.ndarray = nnet_utils.heuristic_fn_par(states_all, env, heur_fn_i_q, heur_fn_o_qs,
+                                                                batch_size=args.batch_size, transport=transport)
+
+            nnet_utils.stop_heuristic_fn_runners(heur_procs, heur_fn_i_q)
+
+            # each client got the values of its own states
+            max_diff: float = float(np.max(np.abs(heurs_par - heuristic_fn(states_all))))
+            for states_l, heurs_l in zip(states_ll, heurs_ll):
+                for states, heurs in zip(states_l, heurs_l):
+                    max_diff = max(max_diff, float(np.max(np.abs(heurs - heuristic_fn(states)))))
+
+            num_states: int = sum(len(states) for states_l in states_ll for states in states_l)
+            print("Transport %s, max wait %.3f secs - %s states from %i clients in %.2f secs (%.2f/second), "
+                  "max difference: %.2E" % (transport, max_wait, format(num_states, ","), args.num_clients,
+                                            elapsed_time, num_states / elapsed_time, max_diff))
+            print("")
+            assert max_diff < 1e-3, "Heuristic values were not sent to the right client"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+from typing import List
+from argparse import ArgumentParser
+from threading import Thread
+import numpy as np
+
+from environments.environment_abstract import Environment, State
+from utils import env_utils
+from search_methods.heuristic_cache import HeuristicCache
+
+
+class CountedHeuristic:
+    """ Heuristic that depends on every element of a state and counts the states it evaluates """
+
+    def __init__(self):
+        self.num_evaluated: int = 0
+
+    def __call__(self, states_nnet: List[np.ndarray], is_nnet_format: bool = True) -> np.ndarray:
+        assert is_nnet_format, "The cache should send states in nnet format"
+        x: np.ndarray = states_nnet[0].reshape(states_nnet[0].shape[0], -1).astype(np.float64)
+        self.num_evaluated += x.shape[0]
+
+        return np.sin(x @ np.arange(1, x.shape[1] + 1))
+
+
+def check_values(cache: HeuristicCache, heuristic: CountedHeuristic, states: List[State], env: Environment):
+    heurs: np.ndarray = cache(states)
+    heurs_fn: np.ndarray = heuristic(env.state_to_nnet_input(states))
+    assert np.array_equal(heurs, heurs_fn), "Cached values do not match the heuristic function"
+
+
+def main():
+    # parse arguments
+    parser: ArgumentParser = ArgumentParser()
+    parser.add_argument('--env', type=str, default="puzzle15", help="")
+    parser.add_argument('--num_states', type=int, default=5000, help="")
+    parser.add_argument('--back_max', type=int, default=30, help="")
+    parser.add_argument('--num_threads', type=int, default=4, help="")
+
+    args = parser.parse_args()
+
+    env: Environment = env_utils.get_environment(args.env)
+    states: List[State]
+    states, _ = env.generate_states(args.num_states, (args.back_max, args.back_max))
+    states = list({state: None for state in states}.keys())
+
+    # hits, misses and repeated states in a batch
+    heuristic: CountedHeuristic = CountedHeuristic()
+    cache: HeuristicCache = HeuristicCache(heuristic, env, 2 ** 20)
+    check_values(cache, heuristic, states[:100] + states[:100], env)
+    assert cache.get_stats()[:2] == (0, 200), "Expected 200 misses, got %s" % str(cache.get_stats())
+    assert heuristic.num_evaluated == 100 + 200, "Repeated states in a batch were evaluated more than once"
+
+    check_values(cache, heuristic, states[:100], env)
+    assert cache.get_stats()[:2] == (100, 200), "Expected 100 hits, got %s" % str(cache.get_stats())
+    print("Hits and misses: ok")
+
+    # least recently used state of a set is evicted
+    num_ways: int = 4
+    heuristic = CountedHeuristic()
+    cache = HeuristicCache(heuristic, env, HeuristicCache.bytes_per_entry * num_ways, num_ways=num_ways)
+    assert cache.fps.shape[0] == 1, "Expected a single set"
+    for state in states[:num_ways]:
+        cache([state])
+    cache([states[0]])
+    cache([states[num_ways]])
+
+    num_hits: int = cache.num_hits
+    cache([states[0]])
+    assert cache.num_hits == num_hits + 1, "The most recently used state was evicted"
+    cache([states[1]])
+    assert cache.num_hits == num_hits + 1, "The least recently used state was not evicted"
+    print("Eviction: ok")
+
+    # values after many evictions
+    heuristic = CountedHeuristic()
+    cache = HeuristicCache(heuristic, env, 2 ** 12)
+    for start_idx in range(0, len(states), 500):
+        check_values(cache, heuristic, states[start_idx:(start_idx + 1000)], env)
+    check_values(cache, heuristic, states, env)
+    print("Values after evictions: ok, hit rate %.2f" % cache.get_hit_rate())
+
+    # several threads at once
+    heuristic = CountedHeuristic()
+    cache = HeuristicCache(heuristic, env, 2 ** 12)
+    heurs_true: np.ndarray = heuristic(env.state_to_nnet_input(states))
+    num_wrong: List[int] = []
+
+    def run_thread(seed: int):
+        rand: np.random.RandomState = np.random.RandomState(seed)
+        for _ in range(50):
+            idxs: np.ndarray = rand.randint(0, len(states), size=200)
+            heurs: np.ndarray = cache([states[idx] for idx in idxs])
+            num_wrong.append(int(np.sum(heurs != heurs_true[idxs])))
+
+    threads: List[Thread] = [Thread(target=run_thread, args=(seed,)) for seed in range(args.num_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(num_wrong) == 0, "%i wrong values with %i threads" % (sum(num_wrong), args.num_threads)
+    print("Threads: ok, hit rate %.2f" % cache.get_hit_rate())
+
+
+if __name__ == "__main__":
+    main()
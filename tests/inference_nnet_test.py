@@ -0,0 +1,78 @@
+from typing import List
+from argparse import ArgumentParser
+from torch import nn
+import numpy as np
+import tempfile
+import torch
+import os
+
+from environments.environment_abstract import Environment, State
+from utils import env_utils, nnet_utils
+
+
+def save_random_model(env: Environment, model_dir: str, seed: int) -> nn.Module:
+    torch.manual_seed(seed)
+    nnet: nn.Module = env.get_nnet_model()
+    nnet_utils.randomize_batch_norm(nnet)
+    torch.save(nnet.state_dict(), "%s/model_state_dict.pt" % model_dir)
+    nnet.eval()
+
+    return nnet
+
+
+def check_close(name: str, heurs: np.ndarray, heurs_eager: np.ndarray, tol: float):
+    max_diff: float = float(np.max(np.abs(heurs - heurs_eager)))
+    print("%s: max difference %.2E" % (name, max_diff))
+    assert max_diff <= tol, "%s values differ from those of the eager model" % name
+
+
+def main():
+    # parse arguments
+    parser: ArgumentParser = ArgumentParser()
+    parser.add_argument('--envs', type=str, default="cube3,puzzle15,puzzle48,lightsout7",
+                        help="Comma separated environments")
+    parser.add_argument('--num_states', type=int, default=1000, help="")
+    parser.add_argument('--back_max', type=int, default=30, help="")
+    parser.add_argument('--tol', type=float, default=1e-4, help="Largest difference to the values of the eager model")
+
+    args = parser.parse_args()
+
+    device = torch.device("cpu")
+    for env_name in args.envs.split(","):
+        env: Environment = env_utils.get_environment(env_name)
+        print("%s" % env_name)
+
+        states: List[State]
+        states, _ = env.generate_states(args.num_states, (0, args.back_max))
+        states_nnet: List[np.ndarray] = env.state_to_nnet_input(states)
+
+        with tempfile.TemporaryDirectory() as model_dir:
+            nnet: nn.Module = save_random_model(env, model_dir, 0)
+            heurs_eager: np.ndarray = nnet_utils.get_heuristic_fn(nnet, device, env)(states_nnet, is_nnet_format=True)
+
+            # batch norm folding and tracing
+            heuristic_fn = nnet_utils.get_heuristic_fn(nnet, device, env, prepare=True)
+            check_close("Prepared", heuristic_fn(states_nnet, is_nnet_format=True), heurs_eager, args.tol)
+
+            # prepared model made and saved, then loaded from the cache
+            cache_file: str = "%s/model_inference.pt" % model_dir
+            heuristic_fn = nnet_utils.load_heuristic_fn(model_dir, device, False, env.get_nnet_model(), env)
+            assert os.path.isfile(cache_file), "Prepared model was not saved"
+            check_close("Loaded", heuristic_fn(states_nnet, is_nnet_format=True), heurs_eager, args.tol)
+
+            cache_mtime: float = os.path.getmtime(cache_file)
+            heuristic_fn = nnet_utils.load_heuristic_fn(model_dir, device, False, env.get_nnet_model(), env)
+            assert os.path.getmtime(cache_file) == cache_mtime, "Prepared model was not loaded from the cache"
+            check_close("Cached", heuristic_fn(states_nnet, is_nnet_format=True), heurs_eager, args.tol)
+
+            # the cached model is not used for new weights
+            nnet = save_random_model(env, model_dir, 1)
+            heurs_eager = nnet_utils.get_heuristic_fn(nnet, device, env)(states_nnet, is_nnet_format=True)
+            heuristic_fn = nnet_utils.load_heuristic_fn(model_dir, device, False, env.get_nnet_model(), env)
+            check_close("Reloaded", heuristic_fn(states_nnet, is_nnet_format=True), heurs_eager, args.tol)
+
+        print("")
+
+
+if __name__ == "__main__":
+    main()
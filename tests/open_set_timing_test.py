@@ -0,0 +1,96 @@
+from typing import List
+from argparse import ArgumentParser
+import numpy as np
+
+from search_methods.open_set import HeapOpenSet, BucketOpenSet
+
+import time
+
+
+def time_open_set(open_set, costs_pushes: List[np.ndarray], batch_size: int) -> List[int]:
+    # push
+    start_time = time.time()
+    for costs in costs_pushes:
+        open_set.push(costs.tolist(), list(range(costs.shape[0])))
+
+    elapsed_time = time.time() - start_time
+    num_pushed: int = sum(costs.shape[0] for costs in costs_pushes)
+    print("Pushed %i nodes in %s seconds (%.2f/second)" % (num_pushed, elapsed_time, num_pushed / elapsed_time))
+
+    # pop
+    start_time = time.time()
+    popped: List[int] = []
+    while len(open_set) > 0:
+        popped.extend(open_set.pop(batch_size))
+
+    elapsed_time = time.time() - start_time
+    print("Popped %i nodes in %s seconds (%.2f/second)" % (len(popped), elapsed_time, len(popped) / elapsed_time))
+
+    return popped
+
+
+def main():
+    # parse arguments
+    parser: ArgumentParser = ArgumentParser()
+    parser.add_argument('--num_nodes', type=int, default=1000000, help="")
+    parser.add_argument('--batch_size', type=int, default=10000, help="")
+    parser.add_argument('--weight', type=float, default=0.6, help="")
+
+    args = parser.parse_args()
+
+    # costs like weight * path_cost + heuristic, pushed one batch of children at a time
+    path_costs: np.ndarray = np.random.randint(0, 30, size=args.num_nodes)
+    heuristics: np.ndarray = np.random.rand(args.num_nodes) * 30
+    costs: np.ndarray = args.weight * path_costs + heuristics
+    costs_pushes: List[np.ndarray] = np.array_split(costs, max(args.num_nodes // args.batch_size, 1))
+
+    print("heapq")
+    popped_heap: List[int] = time_open_set(HeapOpenSet(), costs_pushes, args.batch_size)
+
+    print("")
+    print("bucket")
+    popped_bucket: List[int] = time_open_set(BucketOpenSet(), costs_pushes, args.batch_size)
+
+    assert popped_heap == popped_bucket, "Open sets popped nodes in a different order"
+
+    # pushes and pops interleaved, as in a search
+    open_set_heap: HeapOpenSet = HeapOpenSet()
+    open_set_bucket: BucketOpenSet = BucketOpenSet()
+    popped_heap, popped_bucket = [], []
+    max_len: int = 0
+    for costs in costs_pushes:
+        for open_set, popped in [(open_set_heap, popped_heap), (open_set_bucket, popped_bucket)]:
+            open_set.push(costs.tolist(), list(range(costs.shape[0])))
+            popped.extend(open_set.pop(args.batch_size // 2))
+        max_len = max(max_len, len(open_set_bucket) + args.batch_size // 2)
+
+    assert popped_heap == popped_bucket, "Open sets popped nodes in a different order with interleaved pushes and pops"
+    assert len(open_set_bucket.items) <= max_len, "Slots of popped items were not reused"
+    print("")
+    print("Interleaved: same order, %i item slots for %i pushes" % (len(open_set_bucket.items), args.num_nodes))
+
+    # pushes into the lowest bucket between pops, as near the frontier of a search
+    print("")
+    costs_start: np.ndarray = np.random.rand(args.num_nodes)
+    costs_frontier: List[np.ndarray] = [np.random.rand(args.batch_size) for _ in range(100)]
+    popped_all: List[List[int]] = []
+    for name, open_set in [("heapq", HeapOpenSet()), ("bucket", BucketOpenSet())]:
+        open_set.push(costs_start.tolist(), list(range(costs_start.shape[0])))
+        popped = []
+
+        start_time = time.time()
+        for costs_push in costs_frontier:
+            open_set.push(costs_push.tolist(), list(range(costs_push.shape[0])))
+            popped.extend(open_set.pop(args.batch_size))
+
+        elapsed_time = time.time() - start_time
+        print("%s frontier: %i pushes and pops of %i nodes in %s seconds" % (name, len(costs_frontier),
+                                                                             args.batch_size, elapsed_time))
+        popped_all.append(popped)
+
+    assert popped_all[0] == popped_all[1], "Open sets popped nodes in a different order with pushes to the lowest " \
+                                           "bucket"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+from typing import List, Tuple
+from argparse import ArgumentParser
+import numpy as np
+import torch
+import copy
+import torch.nn.functional as F
+
+from environments.environment_abstract import Environment, State
+from utils import env_utils, nnet_utils
+from utils.pytorch_models import ResnetModel
+
+import time
+
+
+def time_nnet(nnet: ResnetModel, states_nnet: List[np.ndarray], batch_size: int, device) -> np.ndarray:
+    heuristic_fn = nnet_utils.get_heuristic_fn(nnet, device, None, batch_size=batch_size, prepare=False)
+
+    start_time = time.time()
+    heurs: np.ndarray = heuristic_fn(states_nnet, is_nnet_format=True)
+    elapsed_time = time.time() - start_time
+
+    num_states: int = states_nnet[0].shape[0]
+    input_name: str = "gather" if nnet.gather_input else "one-hot"
+    print("%s: %i states in %.2f seconds (%.2f/second)" % (input_name, num_states, elapsed_time,
+                                                           num_states / elapsed_time))
+
+    return heurs
+
+
+def time_train(nnet: ResnetModel, states_nnet: List[np.ndarray], batch_size: int, num_steps: int, device):
+    nnet.train()
+    optimizer: torch.optim.Optimizer = torch.optim.Adam(nnet.parameters(), lr=0.001)
+    criterion = torch.nn.MSELoss()
+
+    num_states: int = states_nnet[0].shape[0]
+    start_time = time.time()
+    for step in range(num_steps):
+        start_idx: int = (step * batch_size) % num_states
+        states_batch: torch.Tensor = torch.tensor(states_nnet[0][start_idx:(start_idx + batch_size)], device=device)
+        targets: torch.Tensor = torch.rand(states_batch.shape[0], 1, device=device)
+
+        optimizer.zero_grad()
+        loss = criterion(nnet(states_batch), targets)
+        loss.backward()
+        optimizer.step()
+
+    elapsed_time = time.time() - start_time
+
+    input_name: str = "gather" if nnet.gather_input else "one-hot"
+    print("%s: %i training steps of %i states in %.2f seconds" % (input_name, num_steps, batch_size, elapsed_time))
+    nnet.eval()
+
+
+def check_equivalence(nnet: ResnetModel, states_nnet: np.ndarray, num_check: int = 100, seed: int = 0):
+    """ Check that the gather and one-hot inputs give the same fc1 outputs and fc1 gradients with the same weights,
+    and the same outputs in eval and train mode. The fc1 gradients are those of a fixed random gradient of the fc1
+    output, in float64, since rounding differences in gradients through the whole model in train mode are magnified
+    by batch norm. """
+    x: torch.Tensor = torch.tensor(states_nnet[:num_check])
+    x_one_hot: torch.Tensor = F.one_hot(x.long(), nnet.one_hot_depth).float().view(x.shape[0], -1)
+    gather_input: bool = nnet.gather_input
+    training: bool = nnet.training
+
+    with torch.no_grad():
+        assert torch.allclose(nnet.gather_fc1(x), nnet.fc1(x_one_hot), atol=1e-5), "fc1 outputs differ"
+
+    torch.manual_seed(seed)
+    nnet_double: ResnetModel = copy.deepcopy(nnet).double()
+    grad_out: torch.Tensor = torch.randn(x.shape[0], nnet.fc1.out_features, dtype=torch.float64)
+    grads: List[Tuple[torch.Tensor, ...]] = []
+    for fc1_out in [nnet_double.fc1(x_one_hot.double()), nnet_double.gather_fc1(x)]:
+        grads.append(torch.autograd.grad(fc1_out, (nnet_double.fc1.weight, nnet_double.fc1.bias), grad_out))
+
+    for grad_one_hot, grad_gather in zip(grads[0], grads[1]):
+        assert torch.allclose(grad_one_hot, grad_gather, rtol=1e-7, atol=1e-7), "fc1 gradients differ"
+
+    for train in [False, True]:
+        nnet.train(train)
+        outputs: List[torch.Tensor] = []
+        for gather in [False, True]:
+            nnet.gather_input = gather
+            with torch.no_grad():
+                outputs.append(nnet(x))
+
+        assert torch.allclose(outputs[0], outputs[1], rtol=1e-4, atol=1e-4), "Outputs differ (train=%s)" % train
+
+    nnet.gather_input = gather_input
+    nnet.train(training)
+
+
+def main():
+    # parse arguments
+    parser: ArgumentParser = ArgumentParser()
+    parser.add_argument('--envs', type=str, default="cube3,puzzle15,puzzle24,puzzle35,puzzle48,lightsout7",
+                        help="Comma separated environments")
+    parser.add_argument('--num_states', type=int, default=10000, help="")
+    parser.add_argument('--back_max', type=int, default=30, help="")
+    parser.add_argument('--batch_size', type=int, default=1000, help="")
+    parser.add_argument('--num_train_steps', type=int, default=10, help="Number of training steps to time, none if 0")
+    parser.add_argument('--num_threads', type=int, default=0, help="Number of CPU threads, the pytorch default if 0")
+
+    args = parser.parse_args()
+
+    if args.num_threads > 0:
+        torch.set_num_threads(args.num_threads)
+    device = torch.device("cpu")
+
+    for env_name in args.envs.split(","):
+        env: Environment = env_utils.get_environment(env_name)
+        print("%s" % env_name)
+
+        states: List[State]
+        states, _ = env.generate_states(args.num_states, (0, args.back_max))
+        states_nnet: List[np.ndarray] = env.state_to_nnet_input(states)
+
+        torch.manual_seed(0)
+        nnet: ResnetModel = env.get_nnet_model()
+        print("Default input: %s" % ("gather" if nnet.gather_input else "one-hot"))
+        check_equivalence(nnet, states_nnet[0])
+        nnet.eval()
+
+        nnet.gather_input = False
+        heurs_one_hot: np.ndarray = time_nnet(nnet, states_nnet, args.batch_size, device)
+
+        nnet.gather_input = True
+        heurs_gather: np.ndarray = time_nnet(nnet, states_nnet, args.batch_size, device)
+
+        max_diff: float = float(np.max(np.abs(heurs_one_hot - heurs_gather)))
+        print("Max difference: %.2E" % max_diff)
+        print("")
+        assert max_diff < 1e-3, "Gather and one-hot inputs give different heuristic values"
+
+        if args.num_train_steps > 0:
+            state_dict = copy.deepcopy(nnet.state_dict())
+            for gather in [False, True]:
+                nnet.load_state_dict(state_dict)
+                nnet.gather_input = gather
+                time_train(nnet, states_nnet, args.batch_size, args.num_train_steps, device)
+
+            print("")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+from typing import List, Dict, Any, Tuple
+from argparse import ArgumentParser
+from threading import Thread
+from torch import nn
+import tempfile
+import socket
+import struct
+import torch
+import time
+import os
+
+from environments.environment_abstract import Environment, State
+from utils import env_utils, search_utils
+from search_methods import astar
+from search_methods.solver_daemon import SolverDaemon, SolverClient, format_stats, send_msg, recv_msg
+
+
+def save_random_model(env: Environment, model_dir: str, seed: int):
+    torch.manual_seed(seed)
+    nnet: nn.Module = env.get_nnet_model()
+    os.makedirs(model_dir, exist_ok=True)
+    torch.save(nnet.state_dict(), "%s/model_state_dict.pt" % model_dir)
+
+
+def run_client(socket_name: str, states_l: List[List[State]], results_l: List[List[Dict[str, Any]]]):
+    client: SolverClient = SolverClient(socket_name)
+    for states in states_l:
+        results_l.append(client.solve(states))
+    client.close()
+
+
+def start_clients(env: Environment, socket_name: str, num_clients: int, num_requests: int, states_per_request: int,
+                  back_max: int) -> Tuple[List[List[List[State]]], List[List[List[Dict[str, Any]]]], List[Thread]]:
+    states_ll: List[List[List[State]]] = []
+    results_ll: List[List[List[Dict[str, Any]]]] = []
+    client_threads: List[Thread] = []
+    for _ in range(num_clients):
+        states_l: List[List[State]] = [env.generate_states(states_per_request, (0, back_max))[0]
+                                       for _ in range(num_requests)]
+        results_l: List[List[Dict[str, Any]]] = []
+        client_thread: Thread = Thread(target=run_client, args=(socket_name, states_l, results_l))
+        client_thread.start()
+
+        states_ll.append(states_l)
+        results_ll.append(results_l)
+        client_threads.append(client_thread)
+
+    return states_ll, results_ll, client_threads
+
+
+def check_bad_requests(socket_name: str):
+    # a request that is not a dict gets an error and the connection stays usable
+    sock: socket.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(socket_name)
+    for request in [["solve"], "stats", {"states": []}]:
+        send_msg(sock, request)
+        response: Dict[str, Any] = recv_msg(sock)
+        assert not response["ok"], "Bad request %s did not give an error" % request
+
+    send_msg(sock, {"cmd": "stats"})
+    assert recv_msg(sock)["ok"], "Connection not usable after bad requests"
+
+    # a message size that is too large closes the connection
+    sock.sendall(struct.pack("<q", 2 ** 62))
+    assert recv_msg(sock) is None, "Connection not closed after a bad message size"
+    sock.close()
+
+
+def main():
+    # parse arguments
+    parser: ArgumentParser = ArgumentParser()
+    parser.add_argument('--env', type=str, default="puzzle15", help="")
+    parser.add_argument('--language', type=str, default="python", help="python or cpp")
+    parser.add_argument('--num_clients', type=int, default=4, help="")
+    parser.add_argument('--num_requests', type=int, default=3, help="Number of requests of each client after "
+                                                                     "the reload")
+    parser.add_argument('--states_per_request', type=int, default=2, help="")
+    parser.add_argument('--back_max', type=int, default=6, help="")
+    parser.add_argument('--num_instances', type=int, default=8, help="Number of states the daemon solves at the "
+                                                                     "same time")
+
+    args = parser.parse_args()
+
+    env: Environment = env_utils.get_environment(args.env)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_dirs: List[str] = ["%s/model_%i" % (tmp_dir, idx) for idx in range(2)]
+        for idx, model_dir in enumerate(model_dirs):
+            save_random_model(env, model_dir, idx)
+
+        # start daemon
+        daemon_parser: ArgumentParser = ArgumentParser()
+        astar.add_search_args(daemon_parser)
+        daemon_args = daemon_parser.parse_args(["--model_dir", model_dirs[0], "--env", args.env, "--weight", "0.2",
+                                                "--batch_size", "100", "--language", args.language,
+                                                "--num_instances", str(args.num_instances)])
+
+        socket_name: str = "%s/solver_socket" % tmp_dir
+        daemon: SolverDaemon = SolverDaemon(daemon_args, socket_name)
+        daemon_thread: Thread = Thread(target=daemon.serve_forever)
+        daemon_thread.daemon = True
+        daemon_thread.start()
+        while not os.path.exists(socket_name):
+            time.sleep(0.01)
+
+        check_bad_requests(socket_name)
+
+        # each client has a request in flight while the model is reloaded
+        model_first = daemon.model
+        states_ll, results_ll, client_threads = start_clients(env, socket_name, args.num_clients, 1,
+                                                              args.states_per_request, args.back_max)
+        while model_first.num_active + daemon.num_requests < args.num_clients:
+            time.sleep(0.01)
+
+        client: SolverClient = SolverClient(socket_name)
+        client.reload(model_dirs[1])
+
+        # requests that start after the reload
+        states_ll_reload, results_ll_reload, client_threads_reload = start_clients(
+            env, socket_name, args.num_clients, args.num_requests, args.states_per_request, args.back_max)
+
+        for client_thread in client_threads + client_threads_reload:
+            client_thread.join()
+
+        # check solutions and the models they were solved with
+        num_results: int = 0
+        for states_ll_check, results_ll_check, model_dir in [(states_ll, results_ll, model_dirs[0]),
+                                                            (states_ll_reload, results_ll_reload, model_dirs[1])]:
+            for states_l, results_l in zip(states_ll_check, results_ll_check):
+                assert len(results_l) == len(states_l), "Requests were dropped"
+                for states, results in zip(states_l, results_l):
+                    for state, result in zip(states, results):
+                        assert search_utils.is_valid_soln(state, result["solution"], env)
+                        assert result["model_dir"] == model_dir, "Solved with %s instead of %s" % (
+                            result["model_dir"], model_dir)
+                        num_results += 1
+
+        print("")
+        print("Solved %i states, %i in flight during the reload with the first model and %i after it with the "
+              "reloaded one" % (num_results, args.num_clients * args.states_per_request,
+                                args.num_clients * args.num_requests * args.states_per_request))
+        print(format_stats(client.get_stats()))
+
+        client.shutdown()
+        client.close()
+        daemon_thread.join()
+
+
+if __name__ == "__main__":
+    main()
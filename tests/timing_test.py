@@ -6,6 +6,8 @@ import torch.nn as nn
 from environments.environment_abstract import Environment, State
 from utils import nnet_utils
 from utils import env_utils
+from utils.shm_utils import ShmRing, ShmArrays
+from updaters.updater import Updater
 from torch.multiprocessing import Queue, get_context
 
 import time
@@ -19,6 +21,14 @@ def data_runner(queue1: Queue, queue2: Queue):
     queue2.put(1)
 
 
+def shm_data_runner(ring: ShmRing, queue1: Queue, queue2: Queue):
+    for _ in range(2):
+        shm_arrays: ShmArrays = queue1.get()
+        ring.read(shm_arrays)
+        ring.release(shm_arrays)
+        queue2.put(1)
+
+
 def main():
     # parse arguments
     parser: ArgumentParser = ArgumentParser()
@@ -55,6 +65,31 @@ def main():
     states_per_sec = len(states)/elapsed_time
     print("Expanded %i states in %s seconds (%.2f/second)" % (len(states), elapsed_time, states_per_sec))
 
+    # expand packed states
+    states_np = env.states_to_np(states)
+    start_time = time.time()
+    env.expand_np(states_np)
+    elapsed_time = time.time() - start_time
+    states_per_sec = len(states)/elapsed_time
+    print("Expanded %i packed states in %s seconds (%.2f/second)" % (len(states), elapsed_time, states_per_sec))
+
+    # expand with the c++ environment
+    if env.use_cpp_expand():
+        start_time = time.time()
+        env.expand(states)
+        elapsed_time = time.time() - start_time
+        states_per_sec = len(states)/elapsed_time
+        print("Expanded %i states with c++ in %s seconds (%.2f/second)" % (len(states), elapsed_time, states_per_sec))
+
+        start_time = time.time()
+        env.expand_np(states_np)
+        elapsed_time = time.time() - start_time
+        states_per_sec = len(states)/elapsed_time
+        print("Expanded %i packed states with c++ in %s seconds (%.2f/second)" % (len(states), elapsed_time,
+                                                                                   states_per_sec))
+
+        env.use_cpp_expand(False)
+
     # nnet format
     start_time = time.time()
 
@@ -76,18 +111,24 @@ def main():
     if on_gpu:
         nnet = nn.DataParallel(nnet) 
         
-    # nnet initialize
-    print("")
-    heuristic_fn = nnet_utils.get_heuristic_fn(nnet, device, env)
-    heuristic_fn(states)
-
-    # compute
-    start_time = time.time()
-    heuristic_fn(states)
-
-    nnet_time = time.time() - start_time
-    states_per_sec = len(states)/nnet_time
-    print("Computed heuristic for %i states in %s seconds (%.2f/second)" % (len(states), nnet_time, states_per_sec))
+    # nnet as is and prepared for inference
+    for prepare in [False, True]:
+        # nnet initialize
+        print("")
+        start_time = time.time()
+        heuristic_fn = nnet_utils.get_heuristic_fn(nnet, device, env, prepare=prepare)
+        print("Made heuristic function in %.2f seconds, %s" % (time.time() - start_time,
+                                                              "prepared" if prepare else "not prepared"))
+        heuristic_fn(states)
+
+        # compute
+        start_time = time.time()
+        heuristic_fn(states)
+
+        nnet_time = time.time() - start_time
+        states_per_sec = len(states)/nnet_time
+        print("Computed heuristic for %i states in %s seconds (%.2f/second), %s" % (
+            len(states), nnet_time, states_per_sec, "prepared" if prepare else "not prepared"))
 
     # multiprocessing
     print("")
@@ -115,6 +156,40 @@ def main():
     proc.join()
     print("Process join time: %.2f" % (time.time() - start_time))
 
+    # shared memory
+    ring: ShmRing = ShmRing(2 * sum(x.nbytes + 64 for x in states_nnet))
+    proc = ctx.Process(target=shm_data_runner, args=(ring, queue1, queue2))
+    proc.daemon = True
+    proc.start()
+
+    queue1.put(ring.write(states_nnet))
+    queue2.get()
+
+    start_time = time.time()
+    queue1.put(ring.write(states_nnet))
+    print("State nnet send time (shm): %s" % (time.time() - start_time))
+
+    start_time = time.time()
+    queue2.get()
+    print("States nnet receive time (shm): %.2f" % (time.time() - start_time))
+
+    proc.join()
+    ring.close()
+
+    # update with each transport, the heuristic function is all zeros so that only the transport is timed
+    print("")
+    for transport in ["queue", "shm"]:
+        heur_fn_i_q, heur_fn_o_qs, heur_procs = nnet_utils.start_heur_fn_runners(2, "", device, on_gpu, env,
+                                                                                 all_zeros=True)
+        start_time = time.time()
+        updater: Updater = Updater(env, args.num_states, args.back_max, heur_fn_i_q, heur_fn_o_qs, 1, "GBFS",
+                                   update_batch_size=max(args.num_states // 10, 1), transport=transport)
+        updater.update()
+        print("Updated %i states with %s transport in %.2f seconds" % (args.num_states, transport,
+                                                                       time.time() - start_time))
+
+        nnet_utils.stop_heuristic_fn_runners(heur_procs, heur_fn_i_q)
+
 
 if __name__ == "__main__":
     main()
@@ -1,9 +1,11 @@
-from typing import List, Tuple
+from typing import List, Tuple, Dict, Optional
 import numpy as np
 from utils import nnet_utils, misc_utils
+from utils.shm_utils import ShmRing, ShmArrays
 from environments.environment_abstract import Environment, State
 from search_methods.gbfs import GBFS
 from search_methods.astar import AStar, Node
+from search_methods import astar_cpp
 from torch.multiprocessing import Queue, get_context
 import time
 
@@ -54,10 +56,28 @@ def astar_update(states: List[State], env: Environment, num_steps: int, heuristi
     return states_update, cost_to_go_update, is_solved
 
 
+def astar_cpp_update(states: List[State], env: Environment, num_steps: int, heuristic_fn):
+    """ Same as astar_update, with the C++ search (cpp/libweighted_astar.so) in this process """
+    env_name: Optional[str] = env.get_cpp_env_name()
+    if env_name is None:
+        raise ValueError("%s has no C++ environment" % type(env).__name__)
+
+    weights: List[float] = list(np.random.rand(len(states)))
+    results = astar_cpp.solve(env_name, env, states, weights, 1, heuristic_fn, num_instances=len(states),
+                              max_iterations=num_steps, record_popped=True)
+
+    states_update: List[State] = env.np_to_states(np.concatenate([result["popped_states_np"] for result in results]))
+    cost_to_go_update: np.array = np.concatenate([result["popped_bellman"] for result in results]).astype(np.float64)
+
+    is_solved: np.array = np.array([result["solved"] for result in results])
+
+    return states_update, cost_to_go_update, is_solved
+
+
 def update_runner(num_states: int, back_max: int, update_batch_size: int, heur_fn_i_q, heur_fn_o_q,
                   proc_id: int, env: Environment, result_queue: Queue, num_steps: int, update_method: str,
-                  eps_max: float):
-    heuristic_fn = nnet_utils.heuristic_fn_queue(heur_fn_i_q, heur_fn_o_q, proc_id, env)
+                  eps_max: float, transport: str = "queue", result_ring: Optional[ShmRing] = None):
+    heuristic_fn = nnet_utils.heuristic_fn_queue(heur_fn_i_q, heur_fn_o_q, proc_id, env, transport=transport)
 
     start_idx: int = 0
     while start_idx < num_states:
@@ -69,12 +89,22 @@ def update_runner(num_states: int, back_max: int, update_batch_size: int, heur_f
             states_update, cost_to_go_update, is_solved = gbfs_update(states_itr, env, num_steps, heuristic_fn, eps_max)
         elif update_method.upper() == "ASTAR":
             states_update, cost_to_go_update, is_solved = astar_update(states_itr, env, num_steps, heuristic_fn)
+        elif update_method.upper() == "ASTAR_CPP":
+            states_update, cost_to_go_update, is_solved = astar_cpp_update(states_itr, env, num_steps, heuristic_fn)
         else:
             raise ValueError("Unknown update method %s" % update_method)
 
         states_update_nnet: List[np.ndaray] = env.state_to_nnet_input(states_update)
 
-        result_queue.put((states_update_nnet, cost_to_go_update, is_solved))
+        # results that do not fit in the ring are pickled
+        shm_arrays: Optional[ShmArrays] = None
+        if result_ring is not None:
+            shm_arrays = result_ring.write(states_update_nnet + [cost_to_go_update, is_solved])
+
+        if shm_arrays is not None:
+            result_queue.put(shm_arrays)
+        else:
+            result_queue.put((states_update_nnet, cost_to_go_update, is_solved))
 
         start_idx: int = end_idx
 
@@ -82,8 +112,18 @@ def update_runner(num_states: int, back_max: int, update_batch_size: int, heur_f
 
 
 class Updater:
+    """ Updates the cost-to-go of states in parallel worker processes
+
+    With transport "shm", workers send states to the heuristic function runners and send their results back through
+    rings in shared memory (see utils.shm_utils.ShmRing) instead of pickling them. Each worker has a result ring
+    with room for about two batches of results. The default is "queue": "shm" was not faster in
+    tests/heur_fn_runner_test.py and tests/timing_test.py, where evaluating the states takes far longer than pickling
+    them.
+    """
+
     def __init__(self, env: Environment, num_states: int, back_max: int, heur_fn_i_q, heur_fn_o_qs,
-                 num_steps: int, update_method: str, update_batch_size: int = 1000, eps_max: float = 0.0):
+                 num_steps: int, update_method: str, update_batch_size: int = 1000, eps_max: float = 0.0,
+                 transport: str = "queue"):
         super().__init__()
         ctx = get_context("spawn")
         self.num_steps = num_steps
@@ -97,16 +137,36 @@ class Updater:
 
         self.num_batches: int = int(np.ceil(np.array(num_states_per_proc)/update_batch_size).sum())
 
+        # GBFS and A* give at most one state to update per state and step
+        self.num_states: int = num_states
+        self.max_states_update: int = num_states * max(num_steps, 1)
+
+        # size of the results of a batch
+        ring_capacity: int = 0
+        if transport == "shm":
+            states_nnet: List[np.ndarray] = env.state_to_nnet_input(env.generate_goal_states(1))
+            state_num_bytes: int = sum(x.nbytes for x in states_nnet) + 16
+            ring_capacity = 2 * update_batch_size * max(num_steps, 1) * state_num_bytes
+        elif transport != "queue":
+            raise ValueError("Unknown transport %s" % transport)
+
         # initialize processes
         self.procs: List[ctx.Process] = []
+        self.result_rings: Dict[str, ShmRing] = dict()
         for proc_id in range(len(heur_fn_o_qs)):
             num_states_proc: int = num_states_per_proc[proc_id]
             if num_states_proc == 0:
                 continue
 
+            result_ring: Optional[ShmRing] = None
+            if transport == "shm":
+                result_ring = ShmRing(ring_capacity, name="update_%i" % proc_id)
+                self.result_rings[result_ring.file_name] = result_ring
+
             proc = ctx.Process(target=update_runner, args=(num_states_proc, back_max, update_batch_size,
                                                            heur_fn_i_q, heur_fn_o_qs[proc_id], proc_id, env,
-                                                           self.result_queue, num_steps, update_method, eps_max))
+                                                           self.result_queue, num_steps, update_method, eps_max,
+                                                           transport, result_ring))
             proc.daemon = True
             proc.start()
             self.procs.append(proc)
@@ -122,10 +182,13 @@ class Updater:
         return states_update_nnet, output_update, is_solved
 
     def _update(self) -> Tuple[List[np.ndarray], np.ndarray, np.ndarray]:
-        # process results
-        states_update_nnet_l: List[List[np.ndarray]] = []
-        cost_to_go_update_l: List = []
-        is_solved_l: List = []
+        # results are copied into output arrays as they come, so that views of the result rings can be released
+        # without another copy
+        states_update_nnet: Optional[List[np.ndarray]] = None
+        cost_to_go_update: Optional[np.ndarray] = None
+        is_solved: np.ndarray = np.zeros(self.num_states, dtype=bool)
+        num_update: int = 0
+        num_solved: int = 0
 
         none_count: int = 0
         result_count: int = 0
@@ -141,25 +204,42 @@ class Updater:
             result_count += 1
 
             states_nnet_q: List[np.ndarray]
-            states_nnet_q, cost_to_go_q, is_solved_q = result
-            states_update_nnet_l.append(states_nnet_q)
+            result_ring: Optional[ShmRing] = None
+            if isinstance(result, ShmArrays):
+                result_ring = self.result_rings[result.file_name]
+                arrays: List[np.ndarray] = result_ring.read(result)
+
+                states_nnet_q, cost_to_go_q, is_solved_q = arrays[:-2], arrays[-2], arrays[-1]
+            else:
+                states_nnet_q, cost_to_go_q, is_solved_q = result
 
-            cost_to_go_update_l.append(cost_to_go_q)
-            is_solved_l.append(is_solved_q)
+            if states_update_nnet is None:
+                states_update_nnet = [np.empty((self.max_states_update,) + x.shape[1:], dtype=x.dtype)
+                                      for x in states_nnet_q]
+                cost_to_go_update = np.empty(self.max_states_update, dtype=cost_to_go_q.dtype)
+
+            num_update_q: int = cost_to_go_q.shape[0]
+            for states_nnet_idx, states_nnet_idx_q in zip(states_update_nnet, states_nnet_q):
+                states_nnet_idx[num_update:(num_update + num_update_q)] = states_nnet_idx_q
+            cost_to_go_update[num_update:(num_update + num_update_q)] = cost_to_go_q
+            num_update += num_update_q
+
+            is_solved[num_solved:(num_solved + is_solved_q.shape[0])] = is_solved_q
+            num_solved += is_solved_q.shape[0]
+
+            if result_ring is not None:
+                result_ring.release(result)
 
             if result_count in display_counts:
                 print("%.2f%% (Total time: %.2f)" % (100 * result_count/self.num_batches, time.time() - start_time))
 
-        num_states_nnet_np: int = len(states_update_nnet_l[0])
-        states_update_nnet: List[np.ndarray] = []
-        for np_idx in range(num_states_nnet_np):
-            states_nnet_idx: np.ndarray = np.concatenate([x[np_idx] for x in states_update_nnet_l], axis=0)
-            states_update_nnet.append(states_nnet_idx)
-
-        cost_to_go_update: np.ndarray = np.concatenate(cost_to_go_update_l, axis=0)
-        is_solved: np.ndarray = np.concatenate(is_solved_l, axis=0)
+        states_update_nnet = [x[:num_update] for x in states_update_nnet]
+        cost_to_go_update = cost_to_go_update[:num_update]
 
         for proc in self.procs:
             proc.join()
 
+        for result_ring in self.result_rings.values():
+            result_ring.close()
+
         return states_update_nnet, cost_to_go_update, is_solved
@@ -1,9 +1,12 @@
-from typing import List, Tuple, Optional
+from typing import List, Tuple, Dict, Optional
 import numpy as np
+import queue
 import os
+import hashlib
 import torch
 from torch import nn
 from environments.environment_abstract import Environment, State
+from utils.shm_utils import ShmRing, ShmRingReader, ShmArrays
 from collections import OrderedDict
 import re
 from random import shuffle
@@ -155,8 +158,14 @@ def load_nnet(model_file: str, nnet: nn.Module, device: torch.device = None) ->
 
 # heuristic
 def get_heuristic_fn(nnet: nn.Module, device: torch.device, env: Environment, clip_zero: bool = False,
-                     batch_size: Optional[int] = None):
+                     batch_size: Optional[int] = None, prepare: bool = False):
+    """ Heuristic function of a nnet. With prepare, a ResnetModel is evaluated with the model made by
+    prepare_inference_nnet, so later changes to the weights of nnet are not seen by the heuristic function. Preparing
+    traces the model, which takes as long as evaluating thousands of states, so it is only worth it for a heuristic
+    function that is used for long. load_heuristic_fn loads a prepared model. """
     nnet.eval()
+    if prepare:
+        nnet = prepare_inference_nnet(nnet)
 
     def heuristic_fn(states: List, is_nnet_format: bool = False) -> np.ndarray:
         cost_to_go: np.ndarray = np.zeros(0)
@@ -183,7 +192,8 @@ def get_heuristic_fn(nnet: nn.Module, device: torch.device, env: Environment, cl
 
             # get nnet output
             states_nnet_batch_tensors = states_nnet_to_pytorch_input(states_nnet_batch, device)
-            cost_to_go_batch: np.ndarray = nnet(*states_nnet_batch_tensors).cpu().data.numpy()
+            with torch.no_grad():
+                cost_to_go_batch: np.ndarray = nnet(*states_nnet_batch_tensors).cpu().data.numpy()
 
             cost_to_go: np.ndarray = np.concatenate((cost_to_go, cost_to_go_batch[:, 0]), axis=0)
 
@@ -199,6 +209,120 @@ def get_heuristic_fn(nnet: nn.Module, device: torch.device, env: Environment, cl
     return heuristic_fn
 
 
+def get_children_heuristic_fn(nnet: nn.Module, device: torch.device, env: Environment, clip_zero: bool = False,
+                              batch_size: Optional[int] = None):
+    """ Heuristic function of all the children of states. The fc1 output of each child is computed from that of its
+    parent at the positions given by env.get_changed_idxs_np (see ResnetModel.forward_children), and all children are
+    evaluated from scratch if the environment does not give them. Values are those of get_heuristic_fn up to float
+    rounding.
+
+    @param nnet: Model
+    @param device: Device
+    @param env: Environment
+    @param clip_zero: Clip heuristic values at zero
+    @param batch_size: Largest number of children evaluated at a time, all if None
+    @return: Function of packed states and of their children from Environment.expand_np, without parent moves, that
+    gives the heuristic values of the children, with shape (num_states, num_moves). None if nnet is not a ResnetModel
+    with a one-hot input.
+    """
+    from utils.pytorch_models import ResnetModel
+
+    nnet.eval()
+    if isinstance(nnet, nn.DataParallel):
+        nnet = nnet.module
+    if (not isinstance(nnet, ResnetModel)) or (nnet.one_hot_depth == 0):
+        return None
+
+    def heuristic_fn_children(states_np: np.ndarray, states_c_np: np.ndarray) -> np.ndarray:
+        num_states: int = states_c_np.shape[0]
+        num_moves: int = states_c_np.shape[1]
+        changed_idxs_np: Optional[np.ndarray] = env.get_changed_idxs_np(states_np)
+
+        batch_size_inst: int = num_states
+        if batch_size is not None:
+            batch_size_inst = max(batch_size // num_moves, 1)
+
+        cost_to_go: np.ndarray = np.zeros((num_states, num_moves))
+        for start_idx in range(0, num_states, batch_size_inst):
+            end_idx: int = min(start_idx + batch_size_inst, num_states)
+            num_states_batch: int = end_idx - start_idx
+
+            states_c_np_batch: np.ndarray = states_c_np[start_idx:end_idx]
+            states_c_np_batch = states_c_np_batch.reshape((num_states_batch * num_moves,) + states_c_np.shape[2:])
+            children_nnet: Tensor = states_nnet_to_pytorch_input(env.np_to_nnet_input(states_c_np_batch), device)[0]
+            with torch.no_grad():
+                if changed_idxs_np is None:
+                    cost_to_go_batch: Tensor = nnet(children_nnet)
+                else:
+                    parents_nnet: Tensor = states_nnet_to_pytorch_input(
+                        env.np_to_nnet_input(states_np[start_idx:end_idx]), device)[0]
+                    changed_idxs: Tensor = torch.tensor(changed_idxs_np[start_idx:end_idx], dtype=torch.long,
+                                                        device=device)
+                    children_nnet = children_nnet.view(num_states_batch, num_moves, -1)
+                    cost_to_go_batch: Tensor = nnet.forward_children(parents_nnet, nnet.first_layer(parents_nnet),
+                                                                     children_nnet, changed_idxs)
+
+            cost_to_go[start_idx:end_idx] = cost_to_go_batch.cpu().data.numpy()[:, 0].reshape(num_states_batch,
+                                                                                             num_moves)
+
+        if clip_zero:
+            cost_to_go = np.maximum(cost_to_go, 0.0)
+
+        return cost_to_go
+
+    return heuristic_fn_children
+
+
+def export_resnet(nnet: nn.Module, env: Environment, file_name: str):
+    """ Write the weights of a ResnetModel to a flat binary file read by the c++ search (cpp/nnet.h). Batch norm is
+    folded into the linear layers that come before it.
+
+    File: the bytes RESNET01, state_dim, one_hot_depth, h1_dim, resnet_dim, num_resnet_blocks and out_dim as int32,
+    the nnet input of each of the 256 values of an element as float32, then the weights ([out_dim, in_dim]) and bias of
+    fc1, fc2, the two layers of each resnet block and fc_out as float32.
+
+    @param nnet: ResnetModel
+    @param env: Environment, used to get the nnet input of an element
+    @param file_name: Output file
+    """
+    from utils.pytorch_models import ResnetModel, fold_batch_norm
+
+    if isinstance(nnet, nn.DataParallel):
+        nnet = nnet.module
+    assert isinstance(nnet, ResnetModel), "Only ResnetModel can be exported"
+
+    # nnet input of each value of an element, which must not depend on its position
+    elem_vals_np: np.ndarray = np.tile(np.arange(256, dtype=np.uint8)[:, np.newaxis], (1, nnet.state_dim))
+    inputs_nnet: List[np.ndarray] = env.np_to_nnet_input(elem_vals_np)
+    assert len(inputs_nnet) == 1, "Nnet input must be one array"
+    input_map: np.ndarray = inputs_nnet[0].reshape(256, nnet.state_dim).astype(np.float64)
+    if not np.all(input_map == input_map[:, :1]):
+        raise ValueError("The nnet input of an element depends on its position")
+
+    def fold(fc: nn.Linear, bn: Optional[nn.BatchNorm1d]) -> List[np.ndarray]:
+        return [x.cpu().numpy() for x in fold_batch_norm(fc, bn)]
+
+    layers: List[np.ndarray] = []
+    layers += fold(nnet.fc1, nnet.bn1 if nnet.batch_norm else None)
+    layers += fold(nnet.fc2, nnet.bn2 if nnet.batch_norm else None)
+    for block in nnet.blocks:
+        if nnet.batch_norm:
+            layers += fold(block[0], block[1]) + fold(block[2], block[3])
+        else:
+            layers += fold(block[0], None) + fold(block[1], None)
+    layers += fold(nnet.fc_out, None)
+
+    dims: np.ndarray = np.array([nnet.state_dim, nnet.one_hot_depth, nnet.fc1.out_features, nnet.fc2.out_features,
+                                 nnet.num_resnet_blocks, nnet.fc_out.out_features], dtype=np.int32)
+
+    with open(file_name, "wb") as f:
+        f.write(b"RESNET01")
+        f.write(dims.tobytes())
+        f.write(input_map[:, 0].astype(np.float32).tobytes())
+        for layer in layers:
+            f.write(np.ascontiguousarray(layer, dtype=np.float32).tobytes())
+
+
 def get_available_gpu_nums() -> List[int]:
     gpu_nums: List[int] = []
     if ('CUDA_VISIBLE_DEVICES' in os.environ) and (len(os.environ['CUDA_VISIBLE_DEVICES']) > 0):
@@ -207,6 +331,110 @@ def get_available_gpu_nums() -> List[int]:
     return gpu_nums
 
 
+def randomize_batch_norm(nnet: nn.Module):
+    """ Give the batch norm layers of a nnet random statistics and parameters. Batch norm of a new nnet is the identity
+    in eval mode, so checks of inference code that folds batch norm would not see it.
+
+    @param nnet: Model
+    """
+    for module in nnet.modules():
+        if isinstance(module, nn.BatchNorm1d):
+            module.weight.data.uniform_(0.5, 1.5)
+            module.bias.data.uniform_(-0.5, 0.5)
+            module.running_mean.uniform_(-0.5, 0.5)
+            module.running_var.uniform_(0.5, 1.5)
+
+
+def prepare_inference_nnet(nnet: nn.Module, trace: bool = True) -> nn.Module:
+    """ Model for inference that gives the same values as nnet in eval mode. A ResnetModel becomes an
+    InferenceResnetModel, which is traced with TorchScript if trace is True. Other models, and ResnetModels in
+    nn.DataParallel over more than one GPU, are returned in eval mode.
+
+    @param nnet: Model
+    @param trace: Whether to trace the model with TorchScript
+    @return: Model for inference
+    """
+    from utils.pytorch_models import ResnetModel, InferenceResnetModel
+
+    nnet_inf: nn.Module = nnet
+    if isinstance(nnet_inf, nn.DataParallel) and (len(nnet_inf.device_ids) <= 1):
+        nnet_inf = nnet_inf.module
+
+    if not isinstance(nnet_inf, ResnetModel):
+        nnet.eval()
+        return nnet
+
+    nnet_inf = InferenceResnetModel(nnet_inf)
+    if trace:
+        example: Tensor = torch.zeros((2, nnet_inf.state_dim), dtype=torch.uint8, device=nnet_inf.fc1_weight_t.device)
+        with torch.no_grad():
+            nnet_inf = torch.jit.trace(nnet_inf, example)
+
+    return nnet_inf
+
+
+def get_inference_cache_key(model_file: str, nnet: nn.Module) -> str:
+    """ Key of the model saved by load_inference_nnet: a hash of the state dict, the architecture of the model and the
+    version of pytorch """
+    file_hash = hashlib.sha1()
+    with open(model_file, "rb") as f:
+        for chunk in iter(lambda: f.read(2 ** 20), b""):
+            file_hash.update(chunk)
+
+    return "%s %s %s" % (file_hash.hexdigest(), torch.__version__, repr(nnet))
+
+
+def load_inference_nnet(model_file: str, nnet: nn.Module, device: torch.device, on_gpu: bool) -> nn.Module:
+    """ Load a nnet and prepare it for inference with prepare_inference_nnet. A traced model is saved next to
+    model_file, as model_inference.pt, with the key given by get_inference_cache_key. It is loaded instead of preparing
+    the model again while its key matches. With more than one GPU, the model is not traced and is wrapped in
+    nn.DataParallel.
+
+    @param model_file: File of the state dict
+    @param nnet: Model to load the state dict into
+    @param device: Device of the model
+    @param on_gpu: Whether the model is on GPUs
+    @return: Model for inference
+    """
+    if on_gpu and (torch.cuda.device_count() > 1):
+        nnet = load_nnet(model_file, nnet, device=device)
+        nnet.to(device)
+        return nn.DataParallel(prepare_inference_nnet(nnet, trace=False))
+
+    cache_file: str = "%s/model_inference.pt" % os.path.dirname(model_file)
+    cache_key: str = get_inference_cache_key(model_file, nnet)
+    if os.path.isfile(cache_file):
+        extra_files: Dict[str, str] = {"cache_key": ""}
+        try:
+            nnet_cached = torch.jit.load(cache_file, map_location=device, _extra_files=extra_files)
+            cached_key = extra_files["cache_key"]
+            if isinstance(cached_key, bytes):
+                cached_key = cached_key.decode()
+
+            if cached_key == cache_key:
+                return nnet_cached
+        except RuntimeError:
+            # made by another version of pytorch
+            pass
+
+    nnet = load_nnet(model_file, nnet, device=device)
+    nnet.to(device)
+    nnet = prepare_inference_nnet(nnet)
+
+    if isinstance(nnet, torch.jit.ScriptModule):
+        # replace the file at once since other processes may be loading it
+        cache_file_tmp: str = "%s.%i" % (cache_file, os.getpid())
+        try:
+            torch.jit.save(nnet, cache_file_tmp, _extra_files={"cache_key": cache_key})
+            os.replace(cache_file_tmp, cache_file)
+        except (OSError, RuntimeError):
+            # the model directory may not be writable
+            if os.path.exists(cache_file_tmp):
+                os.unlink(cache_file_tmp)
+
+    return nnet
+
+
 def load_heuristic_fn(nnet_dir: str, device: torch.device, on_gpu: bool, nnet: nn.Module, env: Environment,
                       clip_zero: bool = False, gpu_num: int = -1, batch_size: Optional[int] = None):
     if (gpu_num >= 0) and on_gpu:
@@ -214,33 +442,97 @@ def load_heuristic_fn(nnet_dir: str, device: torch.device, on_gpu: bool, nnet: n
 
     model_file = "%s/model_state_dict.pt" % nnet_dir
 
-    nnet = load_nnet(model_file, nnet, device=device)
-    nnet.eval()
-    nnet.to(device)
-    if on_gpu:
-        nnet = nn.DataParallel(nnet)
+    nnet = load_inference_nnet(model_file, nnet, device, on_gpu)
 
-    heuristic_fn = get_heuristic_fn(nnet, device, env, clip_zero=clip_zero, batch_size=batch_size)
+    heuristic_fn = get_heuristic_fn(nnet, device, env, clip_zero=clip_zero, batch_size=batch_size, prepare=False)
 
     return heuristic_fn
 
 
-def heuristic_fn_par(states: List[State], env: Environment, heur_fn_i_q, heur_fn_o_qs):
+# rings of this process that requests to the heuristic function runners are written to, by output queue
+_heur_fn_rings: Dict[int, ShmRing] = dict()
+
+
+def send_heuristic_fn_request(heur_fn_i_q, proc_id: int, states_nnet: List[np.ndarray],
+                              transport: str = "queue") -> Optional[Tuple[ShmRing, ShmArrays]]:
+    """ Send states to the heuristic function runners. With transport "shm", the states are written to a ring in
+    shared memory, which also has room for the heuristic values, and only a descriptor goes over the queue. With
+    "queue", the states are pickled.
+
+    @return: What recv_heuristic_fn_result needs to read the heuristic values
+    """
+    if transport == "queue":
+        heur_fn_i_q.put((proc_id, states_nnet, time.time()))
+        return None
+    elif transport != "shm":
+        raise ValueError("Unknown transport %s" % transport)
+
+    shapes: List[Tuple] = [(x.shape, x.dtype) for x in states_nnet] + [((states_nnet[0].shape[0],), np.float32)]
+    ring: Optional[ShmRing] = _heur_fn_rings.get(proc_id)
+    shm_arrays: Optional[ShmArrays] = ring.alloc(shapes) if ring is not None else None
+    if shm_arrays is None:
+        if ring is not None:
+            ring.close()
+
+        num_bytes: int = sum(int(np.prod(shape)) * np.dtype(dtype).itemsize for shape, dtype in shapes)
+        ring = ShmRing(max(2 * num_bytes + 64 * len(shapes), 2 ** 20), name="heur_fn_%i" % proc_id)
+        _heur_fn_rings[proc_id] = ring
+        shm_arrays = ring.alloc(shapes)
+
+    for view, x in zip(ring.read(shm_arrays), states_nnet):
+        view[...] = x
+    heur_fn_i_q.put((proc_id, shm_arrays, time.time()))
+
+    return ring, shm_arrays
+
+
+def recv_heuristic_fn_result(heur_fn_o_q, request: Optional[Tuple[ShmRing, ShmArrays]]) -> np.ndarray:
+    heuristics = heur_fn_o_q.get()
+    if request is not None:
+        ring, shm_arrays = request
+        heuristics = ring.read(shm_arrays)[-1].copy()
+        ring.release(shm_arrays)
+
+    return heuristics
+
+
+def heuristic_fn_par(states: List[State], env: Environment, heur_fn_i_q, heur_fn_o_qs,
+                     batch_size: Optional[int] = None, transport: str = "queue"):
+    return heuristic_fn_par_nnet(env.state_to_nnet_input(states), heur_fn_i_q, heur_fn_o_qs, batch_size=batch_size,
+                                 transport=transport)
+
+
+def heuristic_fn_par_nnet(states_nnet: List[np.ndarray], heur_fn_i_q, heur_fn_o_qs,
+                          batch_size: Optional[int] = None, transport: str = "queue") -> np.ndarray:
+    """ Evaluate states with the heuristic function runners, splitting them across the output queues in chunks that
+    are multiples of batch_size, so a request is only split if it fills more than one batch
+
+    @param states_nnet: States in nnet format
+    @param heur_fn_i_q: Input queue of the runners
+    @param heur_fn_o_qs: Output queues, one per chunk that can be in flight
+    @param batch_size: Batch size of the runners, the request is split evenly across output queues if None
+    @param transport: "shm" or "queue", see send_heuristic_fn_request
+    @return: Heuristic values
+    """
+    num_states: int = states_nnet[0].shape[0]
     num_parallel: int = len(heur_fn_o_qs)
+    if batch_size is None:
+        batch_size = 1
 
-    # Write data
-    states_nnet: List[np.ndarray] = env.state_to_nnet_input(states)
+    num_batches: int = int(np.ceil(num_states / batch_size))
+    chunk_size: int = int(np.ceil(num_batches / max(min(num_parallel, num_batches), 1))) * batch_size
+    start_idxs: List[int] = list(range(0, num_states, max(chunk_size, 1)))
 
-    parallel_nums = range(min(num_parallel, len(states)))
-    split_idxs = np.array_split(np.arange(len(states)), len(parallel_nums))
-    for idx in parallel_nums:
-        states_nnet_idx = [x[split_idxs[idx]] for x in states_nnet]
-        heur_fn_i_q.put((idx, states_nnet_idx))
+    # Write data
+    requests: List = []
+    for idx, start_idx in enumerate(start_idxs):
+        states_nnet_idx = [x[start_idx:(start_idx + chunk_size)] for x in states_nnet]
+        requests.append(send_heuristic_fn_request(heur_fn_i_q, idx, states_nnet_idx, transport=transport))
 
     # Check until all data is obtaied
-    results = [None]*len(parallel_nums)
-    for idx in parallel_nums:
-        results[idx] = heur_fn_o_qs[idx].get()
+    results = [recv_heuristic_fn_result(heur_fn_o_qs[idx], request) for idx, request in enumerate(requests)]
+    if len(results) == 0:
+        return np.zeros(0)
 
     results = np.concatenate(results, axis=0)
 
@@ -248,42 +540,174 @@ def heuristic_fn_par(states: List[State], env: Environment, heur_fn_i_q, heur_fn
 
 
 # parallel training
-def heuristic_fn_queue(heuristic_fn_input_queue, heuristic_fn_output_queue, proc_id, env: Environment):
-    def heuristic_fn(states):
-        states_nnet = env.state_to_nnet_input(states)
-        heuristic_fn_input_queue.put((proc_id, states_nnet))
-        heuristics = heuristic_fn_output_queue.get()
+def heuristic_fn_queue(heuristic_fn_input_queue, heuristic_fn_output_queue, proc_id, env: Environment,
+                       transport: str = "queue"):
+    def heuristic_fn(states, is_nnet_format: bool = False):
+        if not is_nnet_format:
+            states_nnet = env.state_to_nnet_input(states)
+        else:
+            states_nnet = states
+        request = send_heuristic_fn_request(heuristic_fn_input_queue, proc_id, states_nnet, transport=transport)
+        heuristics = recv_heuristic_fn_result(heuristic_fn_output_queue, request)
 
         return heuristics
 
     return heuristic_fn
 
 
+class HeurFnRunnerStats:
+    """ Batches evaluated by a heuristic function runner. Batch sizes are counted in power of two buckets. """
+
+    def __init__(self):
+        self.num_batches: int = 0
+        self.num_requests: int = 0
+        self.num_states: int = 0
+        self.batch_size_hist: Dict[int, int] = dict()
+        self.wait_time: float = 0.0
+        self.max_wait_time: float = 0.0
+        self.forward_time: float = 0.0
+
+    def update(self, num_requests: int, num_states: int, wait_times: List[float], forward_time: float):
+        self.num_batches += 1
+        self.num_requests += num_requests
+        self.num_states += num_states
+
+        bucket: int = 2 ** int(np.ceil(np.log2(max(num_states, 1))))
+        self.batch_size_hist[bucket] = self.batch_size_hist.get(bucket, 0) + 1
+
+        self.wait_time += sum(wait_times)
+        self.max_wait_time = max([self.max_wait_time] + wait_times)
+        self.forward_time += forward_time
+
+    def __str__(self) -> str:
+        num_batches: int = max(self.num_batches, 1)
+        hist_str: str = ", ".join(["<=%i: %i" % (bucket, count) for bucket, count in
+                                   sorted(self.batch_size_hist.items())])
+        return ("batches: %i, states: %s, mean batch size: %.1f, requests per batch: %.2f, "
+                "queue wait (mean/max): %.3f/%.3f secs, forward time: %.2f secs\n"
+                "Batch sizes - %s" % (self.num_batches, format(self.num_states, ","),
+                                      self.num_states / num_batches, self.num_requests / num_batches,
+                                      self.wait_time / max(self.num_requests, 1), self.max_wait_time,
+                                      self.forward_time, hist_str))
+
+
+def get_heuristic_fn_requests(heuristic_fn_input_queue: Queue, max_batch_size: Optional[int],
+                              max_wait: float) -> Tuple[List[Tuple], bool]:
+    """ Get the next request and coalesce it with requests that arrive before the batch has max_batch_size states
+    or max_wait seconds have passed. With max_wait=0, only requests already in the queue are coalesced.
+
+    @return: Requests, and whether the runner was told to stop
+    """
+    request = heuristic_fn_input_queue.get()
+    if request[0] is None:
+        return [], True
+
+    requests: List[Tuple] = [request]
+    num_states: int = _get_request_num_states(request[1])
+    end_time: float = time.time() + max_wait
+    while (max_batch_size is None) or (num_states < max_batch_size):
+        try:
+            wait_time: float = end_time - time.time()
+            if wait_time > 0:
+                request = heuristic_fn_input_queue.get(timeout=wait_time)
+            else:
+                request = heuristic_fn_input_queue.get_nowait()
+        except queue.Empty:
+            break
+
+        if request[0] is None:
+            return requests, True
+
+        requests.append(request)
+        num_states += _get_request_num_states(request[1])
+
+    return requests, False
+
+
+def _get_request_num_states(states_nnet) -> int:
+    if isinstance(states_nnet, ShmArrays):
+        return states_nnet.get_shape(0)[0]
+    else:
+        return states_nnet[0].shape[0]
+
+
 def heuristic_fn_runner(heuristic_fn_input_queue: Queue, heuristic_fn_output_queues, nnet_dir: str,
                         device, on_gpu: bool, gpu_num: int, env: Environment, all_zeros: bool,
-                        clip_zero: bool, batch_size: Optional[int]):
+                        clip_zero: bool, batch_size: Optional[int], max_wait: float = 0.0, runner_num: int = 0):
     heuristic_fn = None
     if not all_zeros:
         heuristic_fn = load_heuristic_fn(nnet_dir, device, on_gpu, env.get_nnet_model(), env, gpu_num=gpu_num,
                                          clip_zero=clip_zero, batch_size=batch_size)
 
-    while True:
-        proc_id, states_nnet = heuristic_fn_input_queue.get()
-        if proc_id is None:
-            break
+    stats: HeurFnRunnerStats = HeurFnRunnerStats()
+    ring_reader: ShmRingReader = ShmRingReader()
+    ring_names: Dict[int, str] = dict()
+    stop: bool = False
+    while not stop:
+        requests: List[Tuple]
+        requests, stop = get_heuristic_fn_requests(heuristic_fn_input_queue, batch_size, max_wait)
+        if len(requests) == 0:
+            continue
+
+        # one forward pass for all requests
+        start_time = time.time()
+        wait_times: List[float] = [start_time - put_time for _, _, put_time in requests]
+        states_nnet_l: List[List[np.ndarray]] = []
+        outputs_shm: List[Optional[np.ndarray]] = []
+        for proc_id, states_nnet_req, _ in requests:
+            if isinstance(states_nnet_req, ShmArrays):
+                # a client writes to a new ring when its requests outgrow the old one
+                if ring_names.get(proc_id, states_nnet_req.file_name) != states_nnet_req.file_name:
+                    ring_reader.forget(ring_names[proc_id])
+                ring_names[proc_id] = states_nnet_req.file_name
+
+                views: List[np.ndarray] = ring_reader.read(states_nnet_req)
+                states_nnet_l.append(views[:-1])
+                outputs_shm.append(views[-1])
+            else:
+                states_nnet_l.append(states_nnet_req)
+                outputs_shm.append(None)
+
+        states_nnet: List[np.ndarray] = [np.concatenate(xs, axis=0) for xs in zip(*states_nnet_l)]
+        num_states: int = states_nnet[0].shape[0]
 
         if all_zeros:
-            heuristics = np.zeros(states_nnet[0].shape[0], dtype=np.float)
+            heuristics = np.zeros(num_states, dtype=float)
         else:
             heuristics = heuristic_fn(states_nnet, is_nnet_format=True)
+        forward_time = time.time() - start_time
+
+        # scatter results
+        start_idx: int = 0
+        for (proc_id, _, _), states_nnet_req, output_shm in zip(requests, states_nnet_l, outputs_shm):
+            end_idx: int = start_idx + states_nnet_req[0].shape[0]
+            if output_shm is not None:
+                output_shm[:] = heuristics[start_idx:end_idx]
+                heuristic_fn_output_queues[proc_id].put(True)
+            else:
+                heuristic_fn_output_queues[proc_id].put(heuristics[start_idx:end_idx])
+            start_idx = end_idx
 
-        heuristic_fn_output_queues[proc_id].put(heuristics)
+        stats.update(len(requests), num_states, wait_times, forward_time)
+
+    ring_reader.close()
+    if stats.num_batches > 0:
+        print("Heuristic runner %i - %s" % (runner_num, stats))
 
     return heuristic_fn
 
 
 def start_heur_fn_runners(num_procs: int, nnet_dir: str, device, on_gpu: bool, env: Environment,
-                          all_zeros: bool = False, clip_zero: bool = False, batch_size: Optional[int] = None):
+                          all_zeros: bool = False, clip_zero: bool = False, batch_size: Optional[int] = None,
+                          max_wait: float = 0.0):
+    """ Start one heuristic function runner per GPU, or one on the CPU if there are no GPUs. Each runner coalesces
+    requests from all clients into batches of up to batch_size states (see get_heuristic_fn_requests), evaluates
+    them in one forward pass, and sends each client its part. Runners print their batch statistics when stopped.
+
+    @param num_procs: Number of clients, each gets an output queue
+    @param max_wait: Longest time a runner waits for more requests to fill a batch
+    @return: Input queue, output queues, runner processes
+    """
     ctx = get_context("spawn")
 
     heuristic_fn_input_queue: ctx.Queue = ctx.Queue()
@@ -293,16 +717,16 @@ def start_heur_fn_runners(num_procs: int, nnet_dir: str, device, on_gpu: bool, e
         heuristic_fn_output_queues.append(heuristic_fn_output_queue)
 
     # initialize heuristic procs
-    if ('CUDA_VISIBLE_DEVICES' in os.environ) and (len(os.environ['CUDA_VISIBLE_DEVICES']) > 0):
-        gpu_nums = [int(x) for x in os.environ['CUDA_VISIBLE_DEVICES'].split(",")]
-    else:
-        gpu_nums = [None]
+    gpu_nums: List[int] = get_available_gpu_nums()
+    if len(gpu_nums) == 0:
+        gpu_nums = [-1]
 
     heur_procs: List[ctx.Process] = []
-    for gpu_num in gpu_nums:
+    for runner_num, gpu_num in enumerate(gpu_nums):
         heur_proc = ctx.Process(target=heuristic_fn_runner,
                                 args=(heuristic_fn_input_queue, heuristic_fn_output_queues,
-                                      nnet_dir, device, on_gpu, gpu_num, env, all_zeros, clip_zero, batch_size))
+                                      nnet_dir, device, on_gpu, gpu_num, env, all_zeros, clip_zero, batch_size,
+                                      max_wait, runner_num))
         heur_proc.daemon = True
         heur_proc.start()
         heur_procs.append(heur_proc)
@@ -312,7 +736,7 @@ def start_heur_fn_runners(num_procs: int, nnet_dir: str, device, on_gpu: bool, e
 
 def stop_heuristic_fn_runners(heur_procs, heuristic_fn_input_queue):
     for _ in heur_procs:
-        heuristic_fn_input_queue.put((None, None))
+        heuristic_fn_input_queue.put((None, None, None))
 
     for heur_proc in heur_procs:
         heur_proc.join()
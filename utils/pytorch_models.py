@@ -1,13 +1,23 @@
+from typing import Optional, Tuple
+import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from torch import Tensor
 
 
 class ResnetModel(nn.Module):
+    """ With one_hot_depth > 0 and gather_input, fc1 of the one-hot input is computed by summing the state_dim
+    columns of the fc1 weight that the one-hot input selects (see gather_fc1) instead of multiplying the one-hot
+    input. This is only faster for wide inputs, such as those of puzzle24 and larger, so it is off by default. The
+    parameters are the same either way, so saved models load unchanged.
+    """
+
     def __init__(self, state_dim: int, one_hot_depth: int, h1_dim: int, resnet_dim: int, num_resnet_blocks: int,
-                 out_dim: int, batch_norm: bool):
+                 out_dim: int, batch_norm: bool, gather_input: bool = False):
         super().__init__()
         self.one_hot_depth: int = one_hot_depth
         self.state_dim: int = state_dim
+        self.gather_input: bool = gather_input
         self.blocks = nn.ModuleList()
         self.num_resnet_blocks: int = num_resnet_blocks
         self.batch_norm = batch_norm
@@ -42,19 +52,107 @@ class ResnetModel(nn.Module):
         # output
         self.fc_out = nn.Linear(resnet_dim, out_dim)
 
+        # transposed fc1 weight for gather_fc1 when not training, and the version of the weight it was made from
+        self._fc1_weight_t: Optional[Tensor] = None
+        self._fc1_weight_t_key: Optional[Tuple] = None
+
+    def gather_fc1(self, x: Tensor) -> Tensor:
+        """ fc1 of the one-hot encoding of x without making the one-hot encoding. Row i * one_hot_depth + v of the
+        transposed fc1 weight is the weight of value v at position i, so fc1 is the sum of the rows that x selects.
+
+        @param x: States, one value per position
+        @return: Output of fc1
+        """
+        offsets: Tensor = torch.arange(self.state_dim, device=x.device) * self.one_hot_depth
+        idxs: Tensor = x.long().view(-1, self.state_dim) + offsets
+
+        return F.embedding_bag(idxs, self._get_fc1_weight_t(), mode="sum") + self.fc1.bias
+
+    def _get_fc1_weight_t(self) -> Tensor:
+        weight: Tensor = self.fc1.weight
+        if torch.is_grad_enabled() and weight.requires_grad:
+            return weight.t().contiguous()
+
+        # only transpose again when the weight changes
+        key: Tuple = (weight.data_ptr(), weight._version, weight.device)
+        if key != self._fc1_weight_t_key:
+            self._fc1_weight_t = weight.detach().t().contiguous()
+            self._fc1_weight_t_key = key
+
+        return self._fc1_weight_t
+
     def forward(self, states_nnet):
+        return self.forward_hidden(self.first_layer(states_nnet))
+
+    def first_layer(self, states_nnet: Tensor) -> Tensor:
+        """ Output of fc1
+
+        @param states_nnet: States
+        @return: Output of fc1
+        """
         x = states_nnet
 
-        # preprocess input
-        if self.one_hot_depth > 0:
-            x = F.one_hot(x.long(), self.one_hot_depth)
-            x = x.float()
-            x = x.view(-1, self.state_dim * self.one_hot_depth)
+        # preprocess input and first hidden layer
+        if (self.one_hot_depth > 0) and self.gather_input:
+            x = self.gather_fc1(x)
         else:
-            x = x.float()
+            if self.one_hot_depth > 0:
+                x = F.one_hot(x.long(), self.one_hot_depth)
+                x = x.float()
+                x = x.view(-1, self.state_dim * self.one_hot_depth)
+            else:
+                x = x.float()
+
+            x = self.fc1(x)
 
+        return x
+
+    def forward_children(self, parents_nnet: Tensor, parents_first: Tensor, children_nnet: Tensor,
+                         changed_idxs: Tensor) -> Tensor:
+        """ Output for the children of states. The output of fc1 for a child is that for its parent plus, for each
+        position at which they can differ, the fc1 weight of the value of the child minus that of the value of the
+        parent, so only those positions are gathered. Needs a one-hot input.
+
+        @param parents_nnet: States, shape (num_states, state_dim)
+        @param parents_first: Output of first_layer for the states
+        @param children_nnet: Their children, shape (num_states, num_moves, state_dim)
+        @param changed_idxs: Positions at which each child can differ from its parent, padded with -1, shape
+        (num_states, num_moves, num_positions) (see Environment.get_changed_idxs_np)
+        @return: Output for the children, shape (num_states * num_moves, out_dim)
+        """
+        assert self.one_hot_depth > 0, "Children are computed from their parents only for a one-hot input"
+        num_states: int = children_nnet.shape[0]
+        num_moves: int = children_nnet.shape[1]
+        weight_t: Tensor = self._get_fc1_weight_t()
+        num_rows: int = weight_t.shape[0]
+
+        is_changed: Tensor = (changed_idxs >= 0).float()
+        changed_idxs = changed_idxs.clamp(min=0)
+        children_vals: Tensor = torch.gather(children_nnet.long(), 2, changed_idxs)
+        parents_vals: Tensor = torch.gather(parents_nnet.long().unsqueeze(1).expand(-1, num_moves, -1), 2,
+                                            changed_idxs)
+
+        # one embedding bag over the weight and the fc1 outputs of the parents: the row of the parent, plus the rows
+        # of the values of the child, minus those of the values of the parent
+        offsets: Tensor = changed_idxs * self.one_hot_depth
+        parent_rows: Tensor = num_rows + torch.arange(num_states, device=changed_idxs.device)
+        idxs: Tensor = torch.cat((parent_rows.view(-1, 1, 1).expand(-1, num_moves, 1), offsets + children_vals,
+                                  offsets + parents_vals), dim=2)
+        sample_weights: Tensor = torch.cat((torch.ones_like(is_changed[:, :, :1]), is_changed, -is_changed), dim=2)
+
+        table: Tensor = torch.cat((weight_t, parents_first), dim=0)
+        x = F.embedding_bag(idxs.view(num_states * num_moves, -1), table,
+                            per_sample_weights=sample_weights.view(num_states * num_moves, -1), mode="sum")
+
+        return self.forward_hidden(x)
+
+    def forward_hidden(self, x: Tensor) -> Tensor:
+        """ Output from the output of fc1
+
+        @param x: Output of fc1
+        @return: Output
+        """
         # first two hidden layers
-        x = self.fc1(x)
         if self.batch_norm:
             x = self.bn1(x)
 
@@ -84,3 +182,87 @@ class ResnetModel(nn.Module):
         # output
         x = self.fc_out(x)
         return x
+
+
+def fold_batch_norm(fc: nn.Linear, bn: Optional[nn.BatchNorm1d]) -> Tuple[Tensor, Tensor]:
+    """ Weight and bias of a linear layer followed by batch norm in eval mode, as one linear layer, in float64
+
+    @param fc: Linear layer
+    @param bn: Batch norm after it, or None
+    @return: Weight ([out_dim, in_dim]) and bias
+    """
+    weight: Tensor = fc.weight.detach().double()
+    bias: Tensor = fc.bias.detach().double()
+    if bn is not None:
+        scale: Tensor = bn.weight.detach().double() / torch.sqrt(bn.running_var.double() + bn.eps)
+        weight = weight * scale[:, None]
+        bias = (bias - bn.running_mean.double()) * scale + bn.bias.detach().double()
+
+    return weight, bias
+
+
+class InferenceResnetModel(nn.Module):
+    """ ResnetModel for inference. Batch norm is folded into the linear layer before it, fc1 of a one-hot input is
+    an embedding bag over the transposed fc1 weight, and the ReLUs and residual adds are done in place. Only the
+    forward pass is supported, it gives the same values as the ResnetModel in eval mode.
+    """
+
+    def __init__(self, nnet: ResnetModel):
+        super().__init__()
+        self.state_dim: int = nnet.state_dim
+        self.one_hot_depth: int = nnet.one_hot_depth
+
+        def linear(fc: nn.Linear, bn: Optional[nn.BatchNorm1d]) -> nn.Linear:
+            weight, bias = fold_batch_norm(fc, bn if nnet.batch_norm else None)
+            fc_folded: nn.Linear = nn.Linear(fc.in_features, fc.out_features)
+            fc_folded.weight.data.copy_(weight)
+            fc_folded.bias.data.copy_(bias)
+
+            return fc_folded
+
+        # first layer
+        fc1_weight, fc1_bias = fold_batch_norm(nnet.fc1, nnet.bn1 if nnet.batch_norm else None)
+        self.register_buffer("fc1_weight_t", fc1_weight.t().float().contiguous())
+        self.register_buffer("fc1_bias", fc1_bias.float())
+        self.register_buffer("input_offsets", torch.arange(self.state_dim) * max(self.one_hot_depth, 1))
+
+        self.fc2: nn.Linear = linear(nnet.fc2, nnet.bn2 if nnet.batch_norm else None)
+
+        # resnet blocks
+        self.res_fc1s = nn.ModuleList()
+        self.res_fc2s = nn.ModuleList()
+        for block in nnet.blocks:
+            if nnet.batch_norm:
+                self.res_fc1s.append(linear(block[0], block[1]))
+                self.res_fc2s.append(linear(block[2], block[3]))
+            else:
+                self.res_fc1s.append(linear(block[0], None))
+                self.res_fc2s.append(linear(block[1], None))
+
+        # output
+        self.fc_out: nn.Linear = linear(nnet.fc_out, None)
+
+        self.to(nnet.fc1.weight.device)
+        self.eval()
+        for param in self.parameters():
+            param.requires_grad = False
+
+    def forward(self, states_nnet: Tensor) -> Tensor:
+        if self.one_hot_depth > 0:
+            idxs: Tensor = states_nnet.long().view(-1, self.state_dim) + self.input_offsets
+            x = F.embedding_bag(idxs, self.fc1_weight_t, mode="sum") + self.fc1_bias
+        else:
+            x = torch.addmm(self.fc1_bias, states_nnet.float(), self.fc1_weight_t)
+
+        x = F.relu_(x)
+        x = F.relu_(self.fc2(x))
+
+        # resnet blocks
+        for res_fc1, res_fc2 in zip(self.res_fc1s, self.res_fc2s):
+            res_inp = x
+            x = F.relu_(res_fc1(x))
+            x = F.relu_(res_fc2(x).add_(res_inp))
+
+        # output
+        x = self.fc_out(x)
+        return x
@@ -1,4 +1,4 @@
-from typing import List, Tuple
+from typing import List, Tuple, Callable, Optional
 import numpy as np
 from environments.environment_abstract import Environment, State
 from utils import misc_utils
@@ -13,18 +13,53 @@ def is_valid_soln(state: State, soln: List[int], env: Environment) -> bool:
     return env.is_solved([soln_state])[0]
 
 
-def bellman(states: List, heuristic_fn, env: Environment) -> Tuple[np.ndarray, List[np.ndarray], List[List[State]]]:
-    # expand states
-    states_exp, tc_l = env.expand(states)
-    tc = np.concatenate(tc_l, axis=0)
+def canonical_heuristic_fn(heuristic_fn: Callable, env: Environment) -> Callable:
+    """ Heuristic function that evaluates states as their canonical state (see Environment.canonicalize_np), each
+    unique canonical state once """
+    from search_methods.closed_set import unique_states
 
-    # get cost-to-go of expanded states
-    states_exp_flat, split_idxs = misc_utils.flatten(states_exp)
-    ctg_next: np.ndarray = heuristic_fn(states_exp_flat)
+    def heuristic_fn_canon(states: List[State]) -> np.ndarray:
+        states_np, _ = env.canonicalize_np(env.states_to_np(states))
+        first_idxs, inverse = unique_states(states_np)
 
-    # backup cost-to-go
-    ctg_next_p_tc = tc + ctg_next
-    ctg_next_p_tc_l = np.split(ctg_next_p_tc, split_idxs)
+        return heuristic_fn(env.np_to_states(states_np[first_idxs]))[inverse]
+
+    return heuristic_fn_canon
+
+
+def bellman(states: List, heuristic_fn, env: Environment,
+            heuristic_fn_children: Optional[Callable] = None) -> Tuple[np.ndarray, List[np.ndarray], List[List[State]]]:
+    """ Bellman backup of states
+
+    @param states: States
+    @param heuristic_fn: Heuristic function
+    @param env: Environment
+    @param heuristic_fn_children: If given, used instead of heuristic_fn to evaluate the children of the states from
+    the states (see nnet_utils.get_children_heuristic_fn)
+    @return: Backed-up cost-to-go, transition cost plus cost-to-go of each child, children
+    """
+    ctg_next_p_tc_l: List[np.ndarray]
+    states_exp: List[List[State]]
+    if heuristic_fn_children is not None:
+        # expand states
+        states_np: np.ndarray = env.states_to_np(states)
+        states_c_np, tc_np = env.expand_np(states_np)
+        states_exp = [env.np_to_states(states_c_np_i) for states_c_np_i in states_c_np]
+
+        # get cost-to-go of expanded states and back it up
+        ctg_next_p_tc_l = list(tc_np + heuristic_fn_children(states_np, states_c_np))
+    else:
+        # expand states
+        states_exp, tc_l = env.expand(states)
+        tc = np.concatenate(tc_l, axis=0)
+
+        # get cost-to-go of expanded states
+        states_exp_flat, split_idxs = misc_utils.flatten(states_exp)
+        ctg_next: np.ndarray = heuristic_fn(states_exp_flat)
+
+        # backup cost-to-go
+        ctg_next_p_tc = tc + ctg_next
+        ctg_next_p_tc_l = np.split(ctg_next_p_tc, split_idxs)
 
     is_solved = env.is_solved(states)
     ctg_backup = np.array([np.min(x) for x in ctg_next_p_tc_l]) * np.logical_not(is_solved)
@@ -0,0 +1,184 @@
+from typing import List, Tuple, Dict, Optional, Any
+from multiprocessing import util
+import numpy as np
+import itertools
+import mmap
+import time
+import os
+
+_HEADER_SIZE: int = 64
+_ALIGN: int = 64
+_ring_nums = itertools.count()
+
+
+def get_shm_name(name: str) -> str:
+    """ Path of the file used as shared memory, in /dev/shm when it exists so that it is backed by memory
+
+    @param name: Path the name is made from
+    @return: Path of the file
+    """
+    if os.path.isdir("/dev/shm"):
+        return "/dev/shm/%s_%i" % (os.path.basename(name), os.getpid())
+
+    return name
+
+
+def _unlink_if_exists(file_name: str):
+    if os.path.exists(file_name):
+        os.unlink(file_name)
+
+
+class ShmArrays:
+    """ Arrays written to a ShmRing. Only this small descriptor is sent to the process reading them. """
+
+    def __init__(self, file_name: str, start: int, end: int, arrays: List[Tuple[int, Tuple[int, ...], str]]):
+        self.file_name: str = file_name
+        self.start: int = start
+        self.end: int = end
+        self.arrays: List[Tuple[int, Tuple[int, ...], str]] = arrays
+
+    def get_shape(self, idx: int) -> Tuple[int, ...]:
+        return self.arrays[idx][1]
+
+
+class ShmRing:
+    """ Ring buffer in a file in shared memory for sending numpy arrays from one process to another without pickling
+
+    The process that creates the ring owns its file and removes it when the ring is closed or the process exits.
+    Pickling a ring (for example, as an argument of a spawned process) maps the same file in the other process.
+
+    One process allocates space with alloc or write and sends the returned ShmArrays over a queue. The reading
+    process gets numpy views of the arrays with read and calls release when it is done with them. Space is released
+    in the order it was allocated, and alloc waits while the ring is full.
+    """
+
+    def __init__(self, capacity: int, name: str = "ring"):
+        self.capacity: int = capacity
+        self.file_name: str = get_shm_name("deepcubea_%s_%i" % (name, next(_ring_nums)))
+        self.owner: bool = True
+
+        fd: int = os.open(self.file_name, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.ftruncate(fd, _HEADER_SIZE + capacity)
+        os.close(fd)
+        util.Finalize(self, _unlink_if_exists, args=(self.file_name,), exitpriority=0)
+
+        self._map()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {"capacity": self.capacity, "file_name": self.file_name}
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.capacity = state["capacity"]
+        self.file_name = state["file_name"]
+        self.owner = False
+        self._map()
+
+    @staticmethod
+    def attach(file_name: str) -> 'ShmRing':
+        """ Map the ring in file_name, created by another process """
+        ring: ShmRing = ShmRing.__new__(ShmRing)
+        ring.__setstate__({"capacity": os.path.getsize(file_name) - _HEADER_SIZE, "file_name": file_name})
+
+        return ring
+
+    def alloc(self, shapes: List[Tuple[Tuple[int, ...], Any]]) -> Optional[ShmArrays]:
+        """ Allocate space for arrays, waiting while the ring is full
+
+        @param shapes: Shape and dtype of each array
+        @return: Descriptor of the arrays, or None if they do not fit in the ring
+        """
+        arrays: List[Tuple[int, Tuple[int, ...], str]] = []
+        size: int = 0
+        for shape, dtype in shapes:
+            dtype = np.dtype(dtype)
+            arrays.append((size, tuple(shape), dtype.str))
+            size += int(np.ceil(int(np.prod(shape)) * dtype.itemsize / _ALIGN)) * _ALIGN
+
+        if size > self.capacity:
+            return None
+
+        # arrays do not wrap around the end of the ring
+        head: int = int(self.header[0])
+        pos: int = head % self.capacity
+        start: int = head if pos + size <= self.capacity else head + (self.capacity - pos)
+        while start + size - int(self.header[1]) > self.capacity:
+            time.sleep(0.0001)
+
+        self.header[0] = start + size
+
+        return ShmArrays(self.file_name, start, start + size, arrays)
+
+    def write(self, arrays: List[np.ndarray]) -> Optional[ShmArrays]:
+        """ Copy arrays into the ring, waiting while the ring is full
+
+        @return: Descriptor of the arrays, or None if they do not fit in the ring
+        """
+        shm_arrays: Optional[ShmArrays] = self.alloc([(x.shape, x.dtype) for x in arrays])
+        if shm_arrays is not None:
+            for view, x in zip(self.read(shm_arrays), arrays):
+                view[...] = x
+
+        return shm_arrays
+
+    def read(self, shm_arrays: ShmArrays) -> List[np.ndarray]:
+        """ Views of the arrays, valid until they are released """
+        offset: int = _HEADER_SIZE + shm_arrays.start % self.capacity
+        views: List[np.ndarray] = []
+        for array_offset, shape, dtype_str in shm_arrays.arrays:
+            dtype = np.dtype(dtype_str)
+            view: np.ndarray = np.frombuffer(self.shm, dtype=dtype, count=int(np.prod(shape)),
+                                             offset=offset + array_offset)
+            views.append(view.reshape(shape))
+
+        return views
+
+    def release(self, shm_arrays: ShmArrays):
+        self.header[1] = shm_arrays.end
+
+    def close(self):
+        self.header = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # views of the ring are still in use, the memory is freed when they are
+            pass
+
+        if self.owner:
+            _unlink_if_exists(self.file_name)
+
+    def _map(self):
+        fd: int = os.open(self.file_name, os.O_RDWR)
+        self.shm: mmap.mmap = mmap.mmap(fd, _HEADER_SIZE + self.capacity)
+        os.close(fd)
+
+        # position of the next allocation and of the oldest allocation not released
+        self.header: Optional[np.ndarray] = np.frombuffer(self.shm, dtype=np.int64, count=2)
+
+
+class ShmRingReader:
+    """ Reads arrays from the rings of several processes, mapping each ring the first time it is seen """
+
+    def __init__(self):
+        self.rings: Dict[str, ShmRing] = dict()
+
+    def get_ring(self, shm_arrays: ShmArrays) -> ShmRing:
+        ring: Optional[ShmRing] = self.rings.get(shm_arrays.file_name)
+        if ring is None:
+            ring = ShmRing.attach(shm_arrays.file_name)
+            self.rings[shm_arrays.file_name] = ring
+
+        return ring
+
+    def read(self, shm_arrays: ShmArrays) -> List[np.ndarray]:
+        return self.get_ring(shm_arrays).read(shm_arrays)
+
+    def forget(self, file_name: str):
+        """ Stop using a ring that its owner closed """
+        ring: Optional[ShmRing] = self.rings.pop(file_name, None)
+        if ring is not None:
+            ring.close()
+
+    def close(self):
+        for ring in self.rings.values():
+            ring.close()
+        self.rings = dict()